@@ -0,0 +1,171 @@
+# async_database.py
+# DatabaseManager dạng async cho bot: mọi thao tác SQLite chạy trên MỘT thread riêng với một kết nối dùng chung,
+# handler chỉ await kết quả (không chặn event loop). Các yêu cầu đang xếp hàng được gom vào một giao dịch.
+
+import asyncio
+import inspect
+import logging
+import queue
+import sqlite3
+import threading
+
+from database import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+
+MAX_BATCH = 100  # số yêu cầu tối đa gom vào một giao dịch
+
+
+class _SharedConnection:
+    """Kết nối đưa cho các hàm của DatabaseManager trong thread worker: commit/close/`with conn` không làm gì
+    (worker tự commit cả lô); row_factory chỉ áp dụng cho cursor của lần gọi này."""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.row_factory = None
+
+    def cursor(self):
+        cursor = self._conn.cursor()
+        cursor.row_factory = self.row_factory
+        return cursor
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class _WorkerDatabase(DatabaseManager):
+    """DatabaseManager chạy trên kết nối dùng chung của thread worker"""
+
+    def __init__(self, conn):
+        self._shared = conn
+        super().__init__()
+
+    def _connect(self):
+        return _SharedConnection(self._shared)
+
+
+class AsyncDatabaseManager:
+    """Cùng các hàm như DatabaseManager nhưng là coroutine: `await db.get_officer_contact(name)`.
+    - Một thread worker giữ kết nối SQLite duy nhất và chạy lần lượt các yêu cầu trong hàng đợi
+    - Các yêu cầu đang chờ sẵn (tối đa MAX_BATCH) chạy trong một giao dịch, mỗi yêu cầu một SAVEPOINT:
+      yêu cầu lỗi chỉ hoàn tác phần của nó; kết quả trả về sau khi giao dịch đã commit
+    - Các hàm duyệt dữ liệu lớn (iter_*) trả về generator nên dùng bản đồng bộ `sync` (mở kết nối riêng)
+    """
+
+    def __init__(self):
+        self.sync = DatabaseManager()
+        self.db_file = self.sync.db_file
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats = {'requests': 0, 'batches': 0, 'max_batch': 0}
+
+    def _ensure_worker(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='sqlite-worker', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_file, isolation_level=None)  # tự quản lý BEGIN/COMMIT
+        db = _WorkerDatabase(conn)
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = [first]
+            while len(batch) < MAX_BATCH:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)  # dừng sau khi xử lý xong lô này
+                    break
+                batch.append(item)
+            self._run_batch(conn, db, batch)
+        conn.close()
+
+    def _run_batch(self, conn, db, batch):
+        results = []
+        try:
+            conn.execute('BEGIN')
+            for i, (method, args, kwargs, loop, future) in enumerate(batch):
+                conn.execute(f'SAVEPOINT req_{i}')
+                try:
+                    results.append((loop, future, getattr(db, method)(*args, **kwargs), None))
+                    conn.execute(f'RELEASE req_{i}')
+                except Exception as e:
+                    conn.execute(f'ROLLBACK TO req_{i}')
+                    conn.execute(f'RELEASE req_{i}')
+                    results.append((loop, future, None, e))
+            conn.execute('COMMIT')
+        except Exception as e:
+            logger.exception("Lỗi giao dịch SQLite (%d yêu cầu): %s", len(batch), e)
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            done = {id(future) for _, future, _, _ in results}
+            results = [(loop, future, None, e) for loop, future, _, _ in results] + [
+                (loop, future, None, e) for _, _, _, loop, future in batch if id(future) not in done
+            ]
+
+        self._stats['requests'] += len(batch)
+        self._stats['batches'] += 1
+        self._stats['max_batch'] = max(self._stats['max_batch'], len(batch))
+        for loop, future, result, error in results:
+            loop.call_soon_threadsafe(self._resolve, future, result, error)
+
+    @staticmethod
+    def _resolve(future, result, error):
+        if future.cancelled():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    async def _call(self, method, *args, **kwargs):
+        self._ensure_worker()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put((method, args, kwargs, loop, future))
+        return await future
+
+    def __getattr__(self, name):
+        attr = getattr(DatabaseManager, name, None)
+        if name.startswith('_') or not callable(attr):
+            raise AttributeError(name)
+        if name.startswith('iter_') or inspect.isgeneratorfunction(attr):
+            return getattr(self.sync, name)  # duyệt theo lô trên kết nối riêng (dùng trong thread khác)
+
+        async def method(*args, **kwargs):
+            return await self._call(name, *args, **kwargs)
+        method.__name__ = name
+        method.__doc__ = attr.__doc__
+        return method
+
+    def stats(self):
+        """Số yêu cầu, số giao dịch và lô lớn nhất đã chạy"""
+        return dict(self._stats)
+
+    async def close(self):
+        """Dừng thread worker sau khi chạy hết các yêu cầu đang chờ"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            await asyncio.to_thread(self._thread.join)
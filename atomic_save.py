@@ -0,0 +1,146 @@
+# atomic_save.py
+# Lưu file Excel an toàn: ghi ra file tạm cùng thư mục rồi đổi tên (không bao giờ để lại file ghi dở),
+# đồng thời giữ vòng N bản sao gần nhất trong thư mục .backup để khôi phục tức thì
+
+import os
+import tempfile
+from datetime import datetime
+
+import config
+
+
+# Thư mục chứa bản sao (nằm cạnh file năm học, không khớp mẫu *.xlsx khi quét thư mục lịch)
+BACKUP_DIRNAME = ".backup"
+DEFAULT_BACKUP_COUNT = 10
+
+
+def _backup_count():
+    return max(0, int(getattr(config, 'SCHEDULE_BACKUP_COUNT', DEFAULT_BACKUP_COUNT)))
+
+
+def _backup_dir(filepath):
+    return os.path.join(os.path.dirname(os.path.abspath(filepath)), BACKUP_DIRNAME)
+
+
+def _fsync_dir(dirpath):
+    """Đảm bảo thao tác đổi tên đã ghi xuống đĩa (POSIX; Windows không hỗ trợ mở thư mục)"""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(dirpath, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _link_or_copy(src, dst):
+    """Hardlink (không tốn thêm dung lượng, tức thì); hệ thống file không hỗ trợ thì sao chép"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        import shutil
+        shutil.copy2(src, dst)
+
+
+def list_backups(filepath):
+    """Các bản sao của file, mới nhất trước: [(tên bản sao, đường dẫn, thời điểm)]"""
+    backup_dir = _backup_dir(filepath)
+    if not os.path.isdir(backup_dir):
+        return []
+    stem, ext = os.path.splitext(os.path.basename(filepath))
+    prefix = f"{stem}."
+    backups = []
+    for name in os.listdir(backup_dir):
+        if not (name.startswith(prefix) and name.endswith(ext)):
+            continue
+        stamp = name[len(prefix):len(name) - len(ext)]
+        try:
+            taken_at = datetime.strptime(stamp, '%Y%m%d-%H%M%S-%f')
+        except ValueError:
+            continue
+        backups.append((name, os.path.join(backup_dir, name), taken_at))
+    backups.sort(key=lambda b: b[2], reverse=True)
+    return backups
+
+
+def _snapshot(filepath, keep):
+    """Giữ lại phiên bản hiện tại của file trước khi bị thay, xóa các bản cũ hơn keep bản gần nhất"""
+    backup_dir = _backup_dir(filepath)
+    os.makedirs(backup_dir, exist_ok=True)
+    stem, ext = os.path.splitext(os.path.basename(filepath))
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    _link_or_copy(filepath, os.path.join(backup_dir, f"{stem}.{stamp}{ext}"))
+    for _, path, _ in list_backups(filepath)[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+DEFAULT_FILE_MODE = 0o644
+
+
+def _current_umask():
+    """umask của tiến trình, đọc từ /proc (Linux) mà không đổi umask: os.umask() đặt lại giá trị cho cả tiến trình,
+    các thread ghi khác có thể tạo file với umask sai trong lúc đó. Không đọc được thì trả về None."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('Umask:'):
+                    return int(line.split()[1], 8)
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _copy_mode(filepath, tmp_path):
+    """mkstemp tạo file tạm quyền 0600: giữ quyền của file cũ, file mới thì theo umask như khi tạo bình thường
+    (không đọc được umask thì dùng 0644)"""
+    if os.path.exists(filepath):
+        mode = os.stat(filepath).st_mode & 0o7777
+    else:
+        umask = _current_umask()
+        mode = DEFAULT_FILE_MODE if umask is None else 0o666 & ~umask
+    os.chmod(tmp_path, mode)
+
+
+def replace_file_atomic(filepath, write_func, keep_backups=None):
+    """Ghi file mới bằng write_func(đường_dẫn_tạm), fsync, giữ bản sao phiên bản cũ rồi os.replace vào filepath.
+    Người đọc luôn thấy trọn vẹn file cũ hoặc file mới; lỗi giữa chừng không làm hỏng file đang có."""
+    filepath = os.path.abspath(filepath)
+    dirpath = os.path.dirname(filepath)
+    keep = _backup_count() if keep_backups is None else keep_backups
+
+    fd, tmp_path = tempfile.mkstemp(dir=dirpath, prefix=f".{os.path.basename(filepath)}.", suffix='.tmp')
+    os.close(fd)
+    try:
+        write_func(tmp_path)
+        with open(tmp_path, 'rb+') as f:
+            os.fsync(f.fileno())
+        _copy_mode(filepath, tmp_path)
+        if keep > 0 and os.path.exists(filepath):
+            _snapshot(filepath, keep)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_dir(dirpath)
+
+
+def save_workbook_atomic(wb, filepath, keep_backups=None):
+    """Thay cho wb.save(filepath) trên file năm học (xem replace_file_atomic).
+    openpyxl không tự tính công thức nên đánh dấu để Excel tính lại toàn bộ khi mở file."""
+    if wb.calculation is not None:
+        wb.calculation.fullCalcOnLoad = True
+    replace_file_atomic(filepath, wb.save, keep_backups)
+
+
+def restore_backup(filepath, backup_name):
+    """Khôi phục file từ một bản sao (bản hiện tại cũng được giữ lại thành bản sao mới nhất)"""
+    backup_path = os.path.join(_backup_dir(filepath), os.path.basename(backup_name))
+    if not os.path.isfile(backup_path):
+        raise FileNotFoundError(f"Không tìm thấy bản sao '{backup_name}'")
+
+    import shutil
+    replace_file_atomic(filepath, lambda tmp_path: shutil.copyfile(backup_path, tmp_path))
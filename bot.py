@@ -3,22 +3,30 @@ import logging
 import asyncio
 import os
 from datetime import datetime, time, timezone, timedelta
-from telegram import Update
-from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, ConversationHandler, MessageHandler, filters
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
+from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, CallbackQueryHandler, ConversationHandler, MessageHandler, filters
 import config
-from schedule_manager import ScheduleManager
-from database import DatabaseManager
+from schedule_manager import ScheduleManager, PREVIEW_TTL
+from async_database import AsyncDatabaseManager
+from contact_directory import ContactDirectory
+from response_cache import ResponseCache
+from schedule_index import normalize_name
+from name_matcher import AUTO_ACCEPT_SCORE
+from history_export import export_history, HISTORY_KINDS, EXPORT_FORMATS
+from sheet_export import export_sheets
+from logging_setup import configure_logging
 import sys
 import shlex
+import re
+import html
+import hashlib
 
 # Force UTF-8 encoding for stdout (Windows fix)
 sys.stdout.reconfigure(encoding='utf-8')
 
-# Enable logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# Enable logging (mức log/định dạng JSON cấu hình trong config.py)
+configure_logging()
 
 logger = logging.getLogger(__name__)
 
@@ -28,10 +36,48 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 # Múi giờ Việt Nam (UTC+7)
 VN_TZ = timezone(timedelta(hours=7))
 
+# Số dòng mỗi trang của lệnh /history
+HISTORY_PAGE_SIZE = 10
+
+# Từ khóa chọn chế độ xếp lịch cân bằng trong /auto_schedule
+BALANCED_MODE_KEYWORDS = ('balanced', 'can_bang', 'cân_bằng')
+
+# Hướng dẫn cú pháp /auto_schedule (dùng chung cho /auto_schedule_preview)
+AUTO_SCHEDULE_USAGE = (
+    "⚠️ Cách dùng 1 (Lấy tên từ DS trực): /auto_schedule [m-yyyy] | [Lãnh đạo]\n"
+    "Ví dụ: /auto_schedule 3-2026 | Lãnh Đạo A, Lãnh Đạo B\n\n"
+    "⚠️ Cách dùng 2 (Chỉ định người bắt đầu): /auto_schedule [m-yyyy] [Tên] | [Lãnh đạo]\n"
+    "Ví dụ: /auto_schedule 3-2026 Hải | Lãnh Đạo A\n\n"
+    "⚠️ Cách dùng 3 (Nhập DS thủ công): /auto_schedule [m-yyyy] [Tên_A, Tên_B] | [Lãnh đạo]\n"
+    "Ví dụ: /auto_schedule 3-2026 Hải, Việt | Lãnh Đạo A\n\n"
+    "⚠️ Xếp cân bằng (chia đều tổng số buổi cả năm, tránh trực 2 ngày liền): thêm chữ 'balanced' trước danh sách\n"
+    "Ví dụ: /auto_schedule 3-2026 balanced | Lãnh Đạo A, Lãnh Đạo B\n\n"
+    "⚠️ Xếp nhiều tháng một lượt: dùng [m-yyyy..m-yyyy]\n"
+    "Ví dụ: /auto_schedule 8-2026..6-2027 | Lãnh Đạo A, Lãnh Đạo B\n\n"
+    "👁️ Xem trước (chưa ghi file): dùng /auto_schedule_preview với cùng cú pháp"
+)
+
 class DutyBot:
     def __init__(self):
         self.schedule_mgr = ScheduleManager()
-        self.db = DatabaseManager()
+        self.db = AsyncDatabaseManager()  # SQLite chạy trên thread riêng, handler chỉ await
+        self.contacts = ContactDirectory()  # danh bạ cán bộ trong bộ nhớ (DB + TELEGRAM_CHAT_IDS)
+        self.responses = ResponseCache()  # câu trả lời lệnh chỉ đọc, dùng lại tới khi lịch trực đổi/sang ngày
+        # Các thao tác ghi cùng một file năm học chạy lần lượt trong thread riêng (mỗi file một hàng đợi),
+        # các lệnh chỉ đọc xử lý song song (concurrent_updates) không phải chờ
+        self._write_locks = {}
+
+    async def refresh_contacts(self):
+        """Nạp lại danh bạ từ bảng officers_contact và config (sau /register, đổi tên, nhập cán bộ)"""
+        rows = await self.db.get_all_officer_contacts()
+        self.contacts.load(rows, getattr(config, 'TELEGRAM_CHAT_IDS', {}))
+        return self.contacts
+
+    async def get_contacts(self):
+        """Danh bạ cán bộ, nạp lần đầu khi cần"""
+        if not self.contacts.loaded:
+            await self.refresh_contacts()
+        return self.contacts
         
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(
@@ -42,7 +88,7 @@ class DutyBot:
             "🔹 /check - Tra cứu lịch theo ngày\n"
             "   <i>VD: /check 30/01/2026</i>\n"
             "🔹 /search - Tìm lịch cá nhân\n"
-            "   <i>VD: /search An | /search 3/2026 (Tìm lịch của mình)</i>\n"
+            "   <i>VD: /search An | /search 3/2026 (Tìm lịch của mình) | /search An năm</i>\n"
             "🔹 /change - Đổi người trực (1 ca)\n"
             "   <i>VD: /change 01/05/2026 sáng \"Nguyễn Văn A\" \"Bận việc\"</i>\n"
             "🔹 /swap - Hoán đổi 2 ca trực\n"
@@ -71,7 +117,9 @@ class DutyBot:
             "• <code>/search [tên]</code>: Tìm lịch cán bộ trong tháng hiện tại\n"
             "• <code>/search [m/yyyy]</code>: Tìm lịch của <b>bản thân</b> trong tháng chỉ định\n"
             "• <code>/search [tên] [m/yyyy]</code>: Tìm lịch cán bộ trong tháng chỉ định\n"
-            "   <i>VD: /search An | /search 3/2026 | /search An 3/2026</i>\n"
+            "• <code>/search [tên] năm</code>: Tìm lịch cán bộ trong cả năm học\n"
+            "• <code>/search [tên] [dd/mm/yyyy-dd/mm/yyyy]</code>: Tìm lịch cán bộ trong khoảng ngày\n"
+            "   <i>VD: /search An | /search 3/2026 | /search An 3/2026 | /search hieu 01/09/2025-30/11/2025</i>\n"
             "• <code>/register [họ tên]</code>: Đăng ký ID để nhận tin nhắn\n"
             "   <i>VD: /register Nguyễn Văn A</i>\n\n"
             "3️⃣ <b>Đổi lịch & Hoán đổi:</b>\n"
@@ -87,6 +135,15 @@ class DutyBot:
                 f"{section_num}{keycap} <b>Quản lý & Thống kê (Admin):</b>\n"
                 "• <code>/auto_schedule [m-yyyy] [tên] | [lãnh đạo]</code>: Xếp lịch tự động vòng tròn\n"
                 "   <i>VD: /auto_schedule 3-2026 | Lãnh Đạo A, Lãnh Đạo B</i>\n"
+                "   <i>Xếp cân bằng: /auto_schedule 3-2026 balanced | Lãnh Đạo A, Lãnh Đạo B</i>\n"
+                "   <i>Xếp nhiều tháng: /auto_schedule 8-2026..6-2027 | Lãnh Đạo A, Lãnh Đạo B</i>\n"
+                "• <code>/auto_schedule_preview [như /auto_schedule]</code>: Xếp thử, xem bảng lịch trong chat (chưa ghi file)\n"
+                "• <code>/auto_schedule_commit [mã]</code>: Ghi bản xếp thử vào file\n"
+                "• <code>/rotation [reset [m-yyyy]]</code>: Xem/xóa vị trí vòng tròn xếp lịch đã lưu\n"
+                "• <code>/backup [restore số]</code>: Xem/khôi phục các bản sao tự động của file năm học\n"
+                "• <code>/holidays</code>: Xem lịch ngày nghỉ; gửi file .ics/.csv kèm chú thích /holidays để nhập\n"
+                "• <code>/replace_range [tên] [từ ngày] [đến ngày] [người thay | auto] [lý do]</code>: Thay một cán bộ nghỉ dài ngày\n"
+                "   <i>VD: /replace_range Nguyễn Văn A 04/05/2026 15/05/2026 auto Nghỉ phép</i>\n"
                 "• <code>/send_noti [ngày] [ca]</code>: Gửi thông báo thủ công\n"
                 "   <i>VD: /send_noti 30/01/2026 sáng</i>\n"
                 "• <code>/stats</code>: Thống kê tổng hợp số buổi trực\n"
@@ -102,7 +159,11 @@ class DutyBot:
                 "• <code>/active_officer [Họ tên]</code>: Bỏ miễn trực, về trực bình thường\n"
                 "   <i>VD: /active_officer Nguyễn Văn A</i>\n"
                 "• <code>/edit_officer \"[Tên cũ]\" \"[Tên mới]\"</code>: Sửa tên cán bộ ghi sai\n"
-                "   <i>VD: /edit_officer \"Nguyễn Văn A\" \"Nguyễn Văn B\"</i>\n\n"
+                "   <i>VD: /edit_officer \"Nguyễn Văn A\" \"Nguyễn Văn B\"</i>\n"
+                "• <code>/import_officers</code>: Gửi file .csv/.xlsx (Họ tên, Miễn, Lý do, Telegram ID, SĐT) kèm chú thích này để nhập hàng loạt\n"
+                "• <code>/history [noti|change]</code>: Xem nhật ký thông báo/đổi lịch theo trang\n"
+                "• <code>/export_history [noti|change] [csv|xlsx] [từ-đến]</code>: Xuất nhật ký thông báo/đổi lịch ra file\n"
+                "   <i>VD: /export_history change xlsx 01/08/2025-31/12/2025</i>\n\n"
             )
             section_num += 1
 
@@ -113,15 +174,32 @@ class DutyBot:
         )
         await update.message.reply_text(help_text, parse_mode='HTML')
 
+    async def _cached_response(self, key, build):
+        """Câu trả lời của lệnh chỉ đọc: dùng lại bản đã định dạng cho cùng khóa nếu lịch trực chưa đổi
+        và chưa sang ngày mới, ngược lại gọi build() và lưu lại.
+        Lấy phiên bản (có thể phải lập lại chỉ mục) và build() chạy trong thread, không chặn vòng lặp sự kiện;
+        bộ nhớ đệm chỉ được đọc/ghi trên vòng lặp sự kiện."""
+        version = await asyncio.to_thread(self.schedule_mgr.schedule_version)
+        if version is None:
+            return await asyncio.to_thread(build)
+        version = (datetime.now().date(), version)
+        response = self.responses.get(key, version)
+        if response is None:
+            response, built_version = await asyncio.to_thread(
+                lambda: (build(), self.schedule_mgr.schedule_version()))
+            # Lịch bị ghi trong lúc build(): câu trả lời có thể đã cũ, không lưu
+            if (datetime.now().date(), built_version) == version:
+                self.responses.put(key, version, response)
+        return response
+
     async def today_schedule(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        today = datetime.now()
-        info = self.schedule_mgr.get_duty_info_for_date(today)
-        msg = self._format_duty_message(info, "HÔM NAY")
+        msg = await self._cached_response(('today',), lambda: self._format_duty_message(
+            self.schedule_mgr.get_duty_info_for_date(datetime.now()), "HÔM NAY"))
         await update.message.reply_text(msg, parse_mode='HTML')
 
     async def tomorrow_schedule(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        info = self.schedule_mgr.get_tomorrow_duty()
-        msg = self._format_duty_message(info, "NGÀY MAI")
+        msg = await self._cached_response(('tomorrow',), lambda: self._format_duty_message(
+            self.schedule_mgr.get_tomorrow_duty(), "NGÀY MAI"))
         await update.message.reply_text(msg, parse_mode='HTML')
 
     async def check_schedule(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -131,16 +209,17 @@ class DutyBot:
                 # Nếu không nhập ngày, mặc định lấy ngày hôm nay
                 date = datetime.now()
                 date_str = date.strftime('%d/%m/%Y')
-                info = self.schedule_mgr.get_duty_info_for_date(date)
-                msg = self._format_duty_message(info, f"HÔM NAY ({date_str})")
+                msg = await self._cached_response(('check',), lambda: self._format_duty_message(
+                    self.schedule_mgr.get_duty_info_for_date(date), f"HÔM NAY ({date_str})"))
                 await update.message.reply_text(msg, parse_mode='HTML')
                 return
 
             date_str = context.args[0]
             try:
                 date = datetime.strptime(date_str, '%d/%m/%Y')
-                info = self.schedule_mgr.get_duty_info_for_date(date)
-                msg = self._format_duty_message(info, f"NGÀY {date_str}")
+                date_str = date.strftime('%d/%m/%Y')  # 1/2/2026 và 01/02/2026 dùng chung câu trả lời
+                msg = await self._cached_response(('check', date.date()), lambda: self._format_duty_message(
+                    self.schedule_mgr.get_duty_info_for_date(date), f"NGÀY {date_str}"))
                 await update.message.reply_text(msg, parse_mode='HTML')
             except ValueError:
                 await update.message.reply_text("❌ Định dạng ngày không đúng. Ví dụ: /check 30/01/2026")
@@ -154,7 +233,9 @@ class DutyBot:
              return f"❌ Không tìm thấy lịch trực {title}!"
              
         if info.get('is_off'):
-            return f"📅 <b>LỊCH TRỰC {title} ({info['date']} - {info['day_of_week']})</b>\n\n🏖️ Không có lịch trực (Ngày nghỉ/Lễ)"
+            holiday = info.get('holiday')
+            reason = f"Nghỉ {html.escape(holiday)}" if holiday else "Ngày nghỉ/Lễ"
+            return f"📅 <b>LỊCH TRỰC {title} ({info['date']} - {info['day_of_week']})</b>\n\n🏖️ Không có lịch trực ({reason})"
             
         return (
             f"📅 <b>LỊCH TRỰC {title} ({info['date']} - {info['day_of_week']})</b>\n\n"
@@ -183,6 +264,22 @@ class DutyBot:
             new_officer = command_args[2]
             reason = " ".join(command_args[3:]) # Ghép phần còn lại thành lý do nếu không dùng quote
 
+            # Chuẩn hóa tên người mới theo tên đã có trong file (gõ thiếu dấu -> đúng tên trong DS trực);
+            # tên chưa có nhưng gần giống một người đã có thì vẫn ghi, kèm cảnh báo để kiểm tra lại
+            name_warning = ""
+            # Lấy bộ so khớp tên / thông tin ngày trong thread riêng: sau mỗi lần ghi, chỉ mục năm được lập lại từ file
+            matcher = await asyncio.to_thread(self.schedule_mgr.get_name_matcher)
+            exact_name = matcher.exact(new_officer)
+            if exact_name:
+                new_officer = exact_name
+            else:
+                close = matcher.top_k(new_officer, k=3, min_score=AUTO_ACCEPT_SCORE)
+                if close:
+                    name_warning = (
+                        f"\n⚠️ \"{new_officer}\" chưa có trong lịch trực. Có phải ý bạn là: "
+                        f"{', '.join(name for name, _ in close)}? Nếu nhập nhầm, hãy /change lại."
+                    )
+
             # Validate ngày
             try:
                 date = datetime.strptime(date_str, '%d/%m/%Y')
@@ -197,12 +294,13 @@ class DutyBot:
 
             # Thực hiện đổi lịch
             # Lấy thông tin cũ để log cho đẹp
-            info = self.schedule_mgr.get_duty_info_for_date(date)
+            info = await asyncio.to_thread(self.schedule_mgr.get_duty_info_for_date, date)
             old_officer = "N/A"
             if info and not info.get('is_off'):
                 old_officer = info['morning_officer'] if shift == 'sáng' else info['afternoon_officer']
 
-            success = self.schedule_mgr.update_schedule(
+            success = await self._run_schedule_write(
+                self.schedule_mgr.update_schedule,
                 date=date,
                 shift=shift,
                 new_officer=new_officer,
@@ -217,7 +315,7 @@ class DutyBot:
                     f"- Ngày: {date_str}\n"
                     f"- Ca: {shift}\n"
                     f"- Mới: {new_officer}\n"
-                    f"- Lý do: {reason}",
+                    f"- Lý do: {reason}{name_warning}",
                     parse_mode='HTML'
                 )
             else:
@@ -250,13 +348,15 @@ class DutyBot:
 
             try:
                 date = datetime.strptime(date_str, '%d/%m/%Y')
-                duty_info = self.schedule_mgr.get_duty_info_for_date(date)
             except ValueError:
                 await update.message.reply_text("❌ Định dạng ngày không đúng. Ví dụ: /send_noti 30/01/2026")
                 return
+            duty_info = await asyncio.to_thread(self.schedule_mgr.get_duty_info_for_date, date)
 
             if not duty_info or duty_info.get('is_off'):
-                await update.message.reply_text(f"⚠️ Ngày {date_str} không có lịch trực (Ngày nghỉ/Lễ).")
+                holiday = duty_info.get('holiday') if duty_info else None
+                reason = f"Nghỉ {holiday}" if holiday else "Ngày nghỉ/Lễ"
+                await update.message.reply_text(f"⚠️ Ngày {date_str} không có lịch trực ({reason}).")
                 return
 
             # Xác định người cần gửi
@@ -279,14 +379,9 @@ class DutyBot:
             sent_count = 0
             log_messages = []
 
+            contacts = await self.get_contacts()
             for name, shift in officers_to_notify:
-                # Lookup contact
-                contact = self.db.get_officer_contact(name)
-                chat_id = None
-                if contact and contact[2]: # Telegram ID
-                    chat_id = contact[2]
-                elif name in config.TELEGRAM_CHAT_IDS:
-                    chat_id = config.TELEGRAM_CHAT_IDS[name]
+                chat_id = contacts.chat_id_for(name)
                 
                 if chat_id:
                     try:
@@ -301,15 +396,15 @@ class DutyBot:
                         log_messages.append(f"✅ Đã gửi cho {name} ({shift})")
                         logger.info(f"Manually sent notification to {name} ({chat_id})")
                         # Log to database
-                        self.db.log_notification(duty_info['date'], shift, name, "Success")
+                        await self.db.log_notification(duty_info['date'], shift, name, "Success")
                     except Exception as e:
                         log_messages.append(f"❌ Lỗi gửi {name}: {e}")
                         logger.error(f"Failed to send to {name}: {e}")
                         # Log to database
-                        self.db.log_notification(duty_info['date'], shift, name, "Failed", str(e))
+                        await self.db.log_notification(duty_info['date'], shift, name, "Failed", str(e))
                 else:
                     log_messages.append(f"⚠️ Không tìm thấy ID của {name}")
-                    self.db.log_notification(duty_info['date'], shift, name, "Failed", "Không tìm thấy ID")
+                    await self.db.log_notification(duty_info['date'], shift, name, "Failed", "Không tìm thấy ID")
 
             # Report back to admin
             summary = "\n".join(log_messages)
@@ -324,21 +419,60 @@ class DutyBot:
             logger.error(f"Error manual notification: {e}")
             await update.message.reply_text("❌ Có lỗi xảy ra khi gửi thông báo.")
 
+    def _parse_search_period(self, arg):
+        """Đọc phần thời gian ở cuối lệnh /search.
+        Trả về (start_date, end_date, nhãn) hoặc None nếu arg không phải thời gian:
+          m/yyyy                   → tháng chỉ định
+          năm (hoặc nam)           → cả năm học hiện tại
+          dd/mm/yyyy-dd/mm/yyyy    → khoảng ngày bất kỳ
+        """
+        if arg.lower() in ('năm', 'nam'):
+            return None, None, "cả năm học"
+
+        if '-' in arg:
+            parts = arg.split('-')
+            if len(parts) == 2:
+                try:
+                    start = datetime.strptime(parts[0], '%d/%m/%Y')
+                    end = datetime.strptime(parts[1], '%d/%m/%Y')
+                except ValueError:
+                    return None
+                if start > end:
+                    start, end = end, start
+                return start, end, f"{start.strftime('%d/%m/%Y')} - {end.strftime('%d/%m/%Y')}"
+            return None
+
+        if '/' in arg:
+            parts = arg.split('/')
+            if len(parts) == 2 and parts[0].isdigit() and parts[1].isdigit() and len(parts[1]) == 4:
+                month = int(parts[0])
+                year = int(parts[1])
+                if 1 <= month <= 12:
+                    start = datetime(year, month, 1)
+                    end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+                    return start, end, f"Tháng {month}/{year}"
+        return None
+
     async def find_schedule(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Tìm lịch trực theo tên và/hoặc tháng.
+        """Tìm lịch trực theo tên và/hoặc khoảng thời gian.
         Cú pháp:
-          /search [tên]            → Tìm theo tên trong tháng hiện tại
-          /search [m/yyyy]         → Xem toàn bộ lịch của tháng chỉ định
-          /search [tên] [m/yyyy]   → Tìm theo tên trong tháng chỉ định
+          /search [tên]                          → Tìm theo tên trong tháng hiện tại
+          /search [m/yyyy]                       → Tìm lịch của bản thân trong tháng chỉ định
+          /search [tên] [m/yyyy]                 → Tìm theo tên trong tháng chỉ định
+          /search [tên] năm                      → Tìm theo tên trong cả năm học
+          /search [tên] [dd/mm/yyyy-dd/mm/yyyy]  → Tìm theo tên trong khoảng ngày
         """
         try:
-            search_date = datetime.now()
+            now = datetime.now()
+            start_date = datetime(now.year, now.month, 1)
+            end_date = (start_date + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+            period_label = f"Tháng {now.month}/{now.year}"
             name_query = ""
 
             if not context.args:
                 # Nếu không nhập gì, tự động tìm theo Telegram ID của người dùng
                 user_id = str(update.effective_user.id)
-                officer = self.db.get_officer_by_telegram_id(user_id)
+                officer = (await self.get_contacts()).by_telegram_id(user_id)
                 
                 if officer:
                     name_query = officer[1] # Cột 'name' trong bảng officers_contact
@@ -353,69 +487,159 @@ class DutyBot:
             else:
                 args = list(context.args)
                 
-                # Thử parse đối số cuối cùng xem có phải tháng/năm không (m/yyyy hoặc mm/yyyy)
-                last_arg = args[-1]
-                month_parsed = False
-                if '/' in last_arg:
-                    parts = last_arg.split('/')
-                    if len(parts) == 2 and parts[0].isdigit() and parts[1].isdigit() and len(parts[1]) == 4:
-                        try:
-                            month = int(parts[0])
-                            year = int(parts[1])
-                            if 1 <= month <= 12:
-                                search_date = datetime(year, month, 1)
-                                args = args[:-1]  # Bỏ phần tháng/năm ra khỏi danh sách tên
-                                month_parsed = True
-                        except ValueError:
-                            pass  # Không phải tháng/năm, coi như phần tên
+                # Thử parse đối số cuối cùng xem có phải thời gian không (m/yyyy, năm, dd/mm/yyyy-dd/mm/yyyy)
+                period = self._parse_search_period(args[-1])
+                if period:
+                    start_date, end_date, period_label = period
+                    args = args[:-1]  # Bỏ phần thời gian ra khỏi danh sách tên
 
                 name_query = " ".join(args).strip()
 
-                # --- Trường hợp: CHỈ nhập tháng (không có tên) ---
-                if month_parsed and not name_query:
+                # --- Trường hợp: CHỈ nhập thời gian (không có tên) ---
+                if period and not name_query:
                     # Lấy tên người dùng hiện tại từ Database
                     user_id = str(update.effective_user.id)
-                    officer = self.db.get_officer_by_telegram_id(user_id)
+                    officer = (await self.get_contacts()).by_telegram_id(user_id)
                     
                     if officer:
                         name_query = officer[1]
-                        await update.message.reply_text(f"🔍 Đang tìm lịch trực của đồng chí <b>{name_query}</b> trong tháng {search_date.month}/{search_date.year}...", parse_mode='HTML')
+                        await update.message.reply_text(f"🔍 Đang tìm lịch trực của đồng chí <b>{name_query}</b> ({period_label})...", parse_mode='HTML')
                     else:
                         await update.message.reply_text(
-                            f"❌ Bạn chưa đăng ký họ tên nên không thể tự tìm lịch trong tháng {search_date.month}/{search_date.year}.\n"
-                            "Vui lòng dùng lệnh /register [Họ tên] trước, hoặc nhập tên kèm theo tháng.\n"
+                            f"❌ Bạn chưa đăng ký họ tên nên không thể tự tìm lịch ({period_label}).\n"
+                            "Vui lòng dùng lệnh /register [Họ tên] trước, hoặc nhập tên kèm theo thời gian.\n"
                             "Ví dụ: /search Nguyễn Văn A 3/2026"
                         )
                         return
 
-            # --- Tìm theo tên (có hoặc không có tháng) ---
+            # --- Tìm theo tên (có hoặc không có thời gian) ---
             if len(name_query) < 2:
                  await update.message.reply_text(
                      "⚠️ Vui lòng nhập họ tên đầy đủ (ít nhất 2 ký tự) hoặc nhập tháng theo định dạng m/yyyy.\n"
-                     "Ví dụ: /search An | /search 3/2026 | /search An 3/2026"
+                     "Ví dụ: /search An | /search 3/2026 | /search An 3/2026 | /search An năm"
                  )
                  return
 
-            results = self.schedule_mgr.search_duty_schedule(name_query, search_date)
-            
-            if not results:
-                await update.message.reply_text(
-                    f"⚠️ Không tìm thấy lịch trực nào cho \"{name_query}\" trong tháng {search_date.month}/{search_date.year}."
-                )
-                return
-            
-            # Format output cho tìm kiếm theo tên
-            msg = f"🔎 <b>KẾT QUẢ TÌM KIẾM: {name_query} (Tháng {search_date.month}/{search_date.year})</b>\n\n"
-            for item in results:
-                roles_str = ", ".join(item['roles'])
-                msg += f"🗓 <b>{item['date']} ({item['day_of_week']})</b>: {roles_str}\n"
-            
-            await update.message.reply_text(msg, parse_mode='HTML')
+            key = ('search', normalize_name(name_query), start_date.date(), end_date.date(), period_label)
+            msg, is_html = await self._cached_response(key, lambda: self._build_search_reply(
+                name_query, start_date, end_date, period_label))
+            if is_html:
+                await self._reply_long_html(update, msg)
+            else:
+                await update.message.reply_text(msg)
 
         except Exception as e:
             logger.error(f"Error searching schedule: {e}")
             await update.message.reply_text("❌ Có lỗi xảy ra khi tìm kiếm.")
 
+    def _build_search_reply(self, name_query, start_date, end_date, period_label):
+        """Câu trả lời /search: (nội dung, True nếu là HTML) — có gợi ý tên khi không tìm thấy"""
+        results = self.schedule_mgr.search_officer_schedule(name_query, start_date, end_date)
+
+        if not results:
+            # Thử so khớp gần đúng (gõ thiếu dấu / sai chính tả)
+            resolved = self.schedule_mgr.resolve_officer_name(name_query)
+            if resolved and resolved != name_query:
+                results = self.schedule_mgr.search_officer_schedule(resolved, start_date, end_date)
+                if results:
+                    name_query = resolved
+
+        if not results:
+            suggestions = self.schedule_mgr.suggest_officer_names(name_query, k=3)
+            hint = ""
+            if suggestions:
+                hint = "\nCó phải bạn muốn tìm: " + ", ".join(name for name, _ in suggestions) + "?"
+            return f"⚠️ Không tìm thấy lịch trực nào cho \"{name_query}\" ({period_label}).{hint}", False
+
+        # Format output cho tìm kiếm theo tên (ghi kèm tên nếu truy vấn khớp nhiều người)
+        matched_names = {n for item in results for n in item['names']}
+        msg = f"🔎 <b>KẾT QUẢ TÌM KIẾM: {name_query} ({period_label})</b>\n\n"
+        for item in results:
+            roles_str = ", ".join(item['roles'])
+            who = f" — {', '.join(item['names'])}" if len(matched_names) > 1 else ""
+            msg += f"🗓 <b>{item['date']} ({item['day_of_week']})</b>: {roles_str}{who}\n"
+        msg += f"\nTổng cộng: {len(results)} ngày trực."
+        return msg, True
+
+    def _write_lock(self, resource):
+        """Hàng đợi (asyncio.Lock) của một tài nguyên ghi, tạo khi dùng lần đầu"""
+        lock = self._write_locks.get(resource)
+        if lock is None:
+            lock = self._write_locks[resource] = asyncio.Lock()
+        return lock
+
+    async def _run_schedule_write(self, func, *args, **kwargs):
+        """Chạy một thao tác ghi file năm học (ScheduleManager) trong thread riêng.
+        Các thao tác ghi cùng file năm học hiện tại xếp hàng lần lượt (/change, /swap, lệnh cán bộ, /auto_schedule...);
+        lệnh chỉ đọc không đi qua hàng đợi này. Khóa file (file_lock) lo phần giữa các tiến trình."""
+        filepath = await asyncio.to_thread(self.schedule_mgr.get_master_schedule_path)
+        lock = self._write_lock(os.path.abspath(filepath) if filepath else None)
+        queued = lock.locked()
+        started = asyncio.get_running_loop().time()
+        async with lock:
+            waited = asyncio.get_running_loop().time() - started
+            if queued:
+                logger.info(f"{func.__name__}: chờ {waited:.2f}s sau thao tác ghi khác")
+            return await asyncio.to_thread(func, *args, **kwargs)
+
+    async def _send_sheets(self, bot, chat_ids, sheet_names, filename, caption=None, parse_mode=None):
+        """Gửi file Excel nhỏ chỉ gồm các sheet chỉ định của file năm học (xem sheet_export) cho các chat_ids.
+        Trả về {chat_id: None nếu gửi được, hoặc exception} (xem _send_document_cached)."""
+        filepath = await asyncio.to_thread(self.schedule_mgr.get_master_schedule_path)
+        data, content_hash = await asyncio.to_thread(export_sheets, filepath, sheet_names)
+        if data is None:
+            # Không có sheet nào cần trích (VD: sheet bị đổi tên) -> gửi cả file như trước
+            with open(filepath, 'rb') as f:
+                data = f.read()
+            content_hash = None
+        return await self._send_document_cached(bot, chat_ids, data, filename, caption, parse_mode, content_hash)
+
+    async def _send_document_cached(self, bot, chat_ids, data, filename, caption=None, parse_mode=None,
+                                     content_hash=None):
+        """Gửi cùng một file cho nhiều người: upload một lần, các lần sau (kể cả sau khi khởi động lại bot)
+        gửi bằng file_id Telegram lưu trong SQLite theo mã băm nội dung (mặc định: sha256 của bytes).
+        Trả về {chat_id: None nếu gửi được, hoặc exception}."""
+        if content_hash is None:
+            content_hash = hashlib.sha256(data).hexdigest()
+        file_id = await self.db.get_cached_file_id(content_hash, filename)
+
+        results = {}
+        for chat_id in chat_ids:
+            try:
+                if file_id:
+                    try:
+                        await bot.send_document(chat_id=chat_id, document=file_id,
+                                                caption=caption, parse_mode=parse_mode)
+                        results[chat_id] = None
+                        continue
+                    except BadRequest as e:
+                        # Chỉ bỏ file_id khi Telegram báo lỗi về file (lỗi khác, VD: sai chat, thì ghi nhận cho người đó)
+                        if 'file' not in str(e).lower():
+                            raise
+                        logger.warning(f"file_id đã lưu không dùng được ({e}), upload lại {filename}")
+                        await self.db.delete_cached_file_id(content_hash, filename)
+                        file_id = None
+
+                sent = await bot.send_document(chat_id=chat_id, document=data, filename=filename,
+                                               caption=caption, parse_mode=parse_mode)
+                file_id = sent.document.file_id
+                await self.db.save_cached_file_id(content_hash, filename, file_id)
+                results[chat_id] = None
+            except Exception as e:
+                results[chat_id] = e
+        return results
+
+    async def _reply_long_html(self, update: Update, text, limit=4000):
+        """Gửi tin nhắn HTML dài (VD: lịch cả năm) — tự tách theo dòng để không vượt giới hạn 4096 ký tự của Telegram"""
+        chunk = ""
+        for line in text.split("\n"):
+            if chunk and len(chunk) + len(line) + 1 > limit:
+                await update.message.reply_text(chunk, parse_mode='HTML')
+                chunk = ""
+            chunk += line + "\n"
+        if chunk.strip():
+            await update.message.reply_text(chunk, parse_mode='HTML')
+
     async def register_user(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Đăng ký thông tin người dùng: /dang_ky [Họ tên]"""
         try:
@@ -425,13 +649,40 @@ class DutyBot:
 
             full_name = " ".join(context.args)
             chat_id = update.effective_chat.id
-            
-            # Thêm hoặc cập nhật thông tin trong database
-            self.db.add_or_update_officer_contact(full_name, telegram_id=str(chat_id))
+
+            # Đăng ký theo đúng tên trong lịch trực (để thông báo tìm được người nhận). Chỉ tự nhận tên trùng khớp
+            # sau khi bỏ dấu: tên gần giống có thể là người khác (VD: "Trần Hoàng An" / "Trần Hoàng Anh")
+            name_note = ""
+            matcher = await asyncio.to_thread(self.schedule_mgr.get_name_matcher)
+            exact_name = matcher.exact(full_name)
+            if exact_name:
+                if exact_name != full_name:
+                    name_note = f" (theo tên trong lịch trực, bạn nhập: {html.escape(full_name)})"
+                full_name = exact_name
+            else:
+                suggestions = await asyncio.to_thread(self.schedule_mgr.suggest_officer_names, full_name, k=3)
+                if suggestions:
+                    await update.message.reply_text(
+                        f"⚠️ \"{full_name}\" không trùng với tên nào trong lịch trực. Có phải bạn là: "
+                        + ", ".join(n for n, _ in suggestions)
+                        + "?\nVui lòng gõ lại đúng họ tên đầy đủ, ví dụ: /register " + suggestions[0][0]
+                    )
+                    return
+                name_note = "\n⚠️ Tên chưa có trong lịch trực."
+
+            # Không cho ghi đè Telegram ID của người khác đã đăng ký tên này
+            if not await self.db.register_officer_telegram(full_name, str(chat_id)):
+                await update.message.reply_text(
+                    f"⛔ Họ tên \"{full_name}\" đã được đăng ký bởi một tài khoản Telegram khác.\n"
+                    "Nếu đây là tên của bạn, vui lòng liên hệ Admin để được hỗ trợ."
+                )
+                logger.warning(f"User {chat_id} tried to register name already bound to another account: {full_name}")
+                return
+            await self.refresh_contacts()
             
             await update.message.reply_text(
                 f"✅ <b>ĐĂNG KÝ THÀNH CÔNG</b>\n"
-                f"- Họ tên: {full_name}\n"
+                f"- Họ tên: {full_name}{name_note}\n"
                 f"- Telegram ID: <code>{chat_id}</code>\n\n"
                 f"Bạn sẽ nhận được thông báo khi có lịch trực ban.",
                 parse_mode='HTML'
@@ -474,7 +725,7 @@ class DutyBot:
             
             if not is_admin:
                 # Lấy tên người yêu cầu từ Database
-                requester = self.db.get_officer_by_telegram_id(user_id)
+                requester = (await self.get_contacts()).by_telegram_id(user_id)
                 if not requester:
                     await update.message.reply_text("❌ Bạn chưa đăng ký tài khoản. Vui lòng dùng lệnh /register [Họ tên] trước.")
                     return
@@ -482,8 +733,9 @@ class DutyBot:
                 requester_name = requester[1].lower().strip()
                 
                 # Lấy thông tin 2 ca trực cần đổi
-                duty1 = self.schedule_mgr.get_duty_info_for_date(date1)
-                duty2 = self.schedule_mgr.get_duty_info_for_date(date2)
+                duty1, duty2 = await asyncio.to_thread(
+                    lambda: (self.schedule_mgr.get_duty_info_for_date(date1),
+                             self.schedule_mgr.get_duty_info_for_date(date2)))
                 
                 if not duty1 or not duty2:
                     await update.message.reply_text("❌ Không tìm thấy thông tin lịch trực để xác thực quyền.")
@@ -503,7 +755,7 @@ class DutyBot:
 
             # Gọi logic đổi ca
             user_info = update.effective_user.full_name
-            success, message = self.schedule_mgr.swap_shifts(date1, shift1, date2, shift2, changed_by=user_info)
+            success, message = await self._run_schedule_write(self.schedule_mgr.swap_shifts, date1, shift1, date2, shift2, changed_by=user_info)
 
             if success:
                 await update.message.reply_text(f"✅ {message}")
@@ -518,8 +770,18 @@ class DutyBot:
     # --- Background Job ---
     async def daily_notification(self, context: ContextTypes.DEFAULT_TYPE):
         """Gửi thông báo hàng ngày"""
+        await self.send_daily_notifications(context.bot, datetime.now() + timedelta(days=1))
+
+    async def send_daily_notifications(self, bot, day):
+        """Nhắc lịch trực ngày day cho các cán bộ trực (job hàng ngày gọi với day = ngày mai;
+        fake_telegram.py gọi trực tiếp với ngày cố định để chạy thử)"""
         logger.info("Running daily notification job...")
-        duty_info = self.schedule_mgr.get_tomorrow_duty()
+        # Ngày mai là cuối tuần/ngày nghỉ trong lịch ngày nghỉ: không cần đọc file lịch
+        if not await asyncio.to_thread(self.schedule_mgr.is_working_day, day):
+            logger.info("Tomorrow is not a working day (weekend/holiday calendar).")
+            return
+
+        duty_info = await asyncio.to_thread(self.schedule_mgr.get_duty_info_for_date, day)
         
         if not duty_info or duty_info.get('is_off'):
             logger.info("No duty schedule for tomorrow (Off/Empty).")
@@ -531,16 +793,11 @@ class DutyBot:
             (duty_info['afternoon_officer'], 'chiều')
         ]
         
+        contacts = await self.get_contacts()
         for name, shift in officers:
             if not name: continue
             
-            # Lookup contact
-            contact = self.db.get_officer_contact(name)
-            chat_id = None
-            if contact and contact[2]: # Telegram ID
-                chat_id = contact[2]
-            elif name in config.TELEGRAM_CHAT_IDS:
-                chat_id = config.TELEGRAM_CHAT_IDS[name]
+            chat_id = contacts.chat_id_for(name)
                 
             if chat_id:
                 try:
@@ -550,18 +807,18 @@ class DutyBot:
                         f"Lãnh đạo trực: {duty_info['leader']}.\n\n"
                         f"Đề nghị đồng chí thực hiện nhiệm vụ nghiêm túc."
                     )
-                    await context.bot.send_message(chat_id=chat_id, text=personal_msg, parse_mode='HTML')
+                    await bot.send_message(chat_id=chat_id, text=personal_msg, parse_mode='HTML')
                     sent_count += 1
                     logger.info(f"Sent notification to {name} ({chat_id})")
                     # Log to database
-                    self.db.log_notification(duty_info['date'], shift, name, "Success")
+                    await self.db.log_notification(duty_info['date'], shift, name, "Success")
                 except Exception as e:
                      logger.error(f"Failed to send to {name}: {e}")
                      # Log to database
-                     self.db.log_notification(duty_info['date'], shift, name, "Failed", str(e))
+                     await self.db.log_notification(duty_info['date'], shift, name, "Failed", str(e))
             else:
                     logger.warning(f"Không tìm thấy ID của {name}")
-                    self.db.log_notification(duty_info['date'], shift, name, "Failed", "Không tìm thấy ID")
+                    await self.db.log_notification(duty_info['date'], shift, name, "Failed", "Không tìm thấy ID")
         
         logger.info(f"Daily notification job finished. Sent {sent_count} messages.")
 
@@ -575,18 +832,18 @@ class DutyBot:
 
         await update.message.reply_text("📊 Đang tổng hợp dữ liệu thống kê từ tất cả các tháng, vui lòng chờ trong giây lát...")
         
-        success, message = self.schedule_mgr.generate_full_report()
+        success, message = await self._run_schedule_write(self.schedule_mgr.generate_full_report)
         
         if success:
-            # Gửi file Excel đã cập nhật cho Admin
-            filepath = self.schedule_mgr.get_master_schedule_path()
+            # Chỉ gửi sheet 'Tổng' (file nhỏ) thay cho cả file năm học
             try:
-                with open(filepath, 'rb') as doc:
-                    await update.message.reply_document(
-                        document=doc,
-                        filename="Bao_Cao_Thong_Ke.xlsx",
-                        caption=f"✅ {message}\nBảng thống kê đã được thêm vào sheet đầu tiên của file Excel."
-                    )
+                chat_id = update.effective_chat.id
+                results = await self._send_sheets(
+                    context.bot, [chat_id], ["Tổng"], "Bao_Cao_Thong_Ke.xlsx",
+                    caption=f"✅ {message}\nBảng thống kê đã được cập nhật vào sheet 'Tổng' của file năm học (file đính kèm chỉ gồm sheet này)."
+                )
+                if results[chat_id]:
+                    raise results[chat_id]
             except Exception as e:
                 await update.message.reply_text(f"❌ Lỗi khi gửi file: {str(e)}")
         else:
@@ -595,7 +852,11 @@ class DutyBot:
     # --- Monthly Auto-Schedule Job ---
     async def monthly_auto_schedule_job(self, context: ContextTypes.DEFAULT_TYPE):
         """Job chạy hàng ngày, kiểm tra nếu đúng ngày cấu hình thì tự động xếp lịch tháng tiếp theo"""
-        today = datetime.now(VN_TZ)
+        await self.run_monthly_auto_schedule(context.bot, datetime.now(VN_TZ))
+
+    async def run_monthly_auto_schedule(self, bot, today):
+        """Phần việc của monthly_auto_schedule_job khi hôm nay là today (fake_telegram.py gọi trực tiếp
+        với ngày cố định để chạy thử)"""
         target_day = getattr(config, 'AUTO_SCHEDULE_DAY', 25)
         
         # Chỉ chạy vào đúng ngày đã cấu hình
@@ -621,119 +882,163 @@ class DutyBot:
             logger.error(error_msg)
             for admin_id in config.ADMIN_IDS:
                 try:
-                    await context.bot.send_message(chat_id=admin_id, text=error_msg)
+                    await bot.send_message(chat_id=admin_id, text=error_msg)
                 except Exception as e:
                     logger.error(f"Lỗi gửi thông báo lỗi cho Admin {admin_id}: {e}")
             return
         
         # Gọi hàm xếp lịch (names=None để tự lấy từ sheet 'DS trực')
-        success, message = self.schedule_mgr.auto_generate_round_robin(month_year, names=None, leaders=leaders)
+        mode = getattr(config, 'AUTO_SCHEDULE_MODE', 'round_robin')
+        success, message = await self._run_schedule_write(
+            self.schedule_mgr.auto_generate_round_robin, month_year, names=None, leaders=leaders, mode=mode
+        )
         
         # Gửi kết quả cho tất cả Admin
-        for admin_id in config.ADMIN_IDS:
+        if success:
+            # Trích sheet tháng một lần, upload một lần; các Admin còn lại nhận bằng file_id
             try:
-                if success:
-                    filepath = self.schedule_mgr.get_master_schedule_path()
-                    with open(filepath, 'rb') as doc:
-                        await context.bot.send_document(
-                            chat_id=admin_id,
-                            document=doc,
-                            filename=f"Lich_Truc_{month_year}.xlsx",
-                            caption=(
-                                f"📅 <b>XẾP LỊCH TỰ ĐỘNG THÀNH CÔNG</b>\n\n"
-                                f"✅ {message}\n"
-                                f"Tháng: <b>{month_year}</b>\n"
-                                f"Lãnh đạo: {', '.join(leaders)}\n\n"
-                                f"Hãy kiểm tra sheet '<b>{month_year}</b>' trong file đính kèm."
-                            ),
-                            parse_mode='HTML'
-                        )
-                    logger.info(f"Đã gửi lịch tự động tháng {month_year} cho Admin {admin_id}")
+                results = await self._send_sheets(
+                    bot, config.ADMIN_IDS, [month_year], f"Lich_Truc_{month_year}.xlsx",
+                    caption=(
+                        f"📅 <b>XẾP LỊCH TỰ ĐỘNG THÀNH CÔNG</b>\n\n"
+                        f"✅ {message}\n"
+                        f"Tháng: <b>{month_year}</b>\n"
+                        f"Lãnh đạo: {', '.join(leaders)}\n\n"
+                        f"Hãy kiểm tra sheet '<b>{month_year}</b>' trong file đính kèm."
+                    ),
+                    parse_mode='HTML'
+                )
+            except Exception as e:
+                results = {admin_id: e for admin_id in config.ADMIN_IDS}
+            for admin_id, error in results.items():
+                if error:
+                    logger.error(f"Lỗi gửi kết quả auto-schedule cho Admin {admin_id}: {error}")
                 else:
-                    await context.bot.send_message(
-                        chat_id=admin_id,
-                        text=(
-                            f"❌ <b>XẾP LỊCH TỰ ĐỘNG THẤT BẠI</b>\n\n"
-                            f"Tháng: {month_year}\n"
-                            f"Lỗi: {message}"
-                        ),
-                        parse_mode='HTML'
-                    )
-                    logger.error(f"Xếp lịch tự động tháng {month_year} thất bại: {message}")
+                    logger.info(f"Đã gửi lịch tự động tháng {month_year} cho Admin {admin_id}")
+            return
+
+        logger.error(f"Xếp lịch tự động tháng {month_year} thất bại: {message}")
+        for admin_id in config.ADMIN_IDS:
+            try:
+                await bot.send_message(
+                    chat_id=admin_id,
+                    text=(
+                        f"❌ <b>XẾP LỊCH TỰ ĐỘNG THẤT BẠI</b>\n\n"
+                        f"Tháng: {month_year}\n"
+                        f"Lỗi: {message}"
+                    ),
+                    parse_mode='HTML'
+                )
             except Exception as e:
                 logger.error(f"Lỗi gửi kết quả auto-schedule cho Admin {admin_id}: {e}")
 
+    def _parse_auto_schedule_args(self, args):
+        """Phân tích tham số /auto_schedule (và /auto_schedule_preview).
+        Trả về (dict tham số, None) hoặc (None, thông báo lỗi)."""
+        full_text = " ".join(args)
+        month_year = args[0]
+        
+        # Phần còn lại sau month_year
+        content = full_text.replace(month_year, "", 1).strip()
+
+        # Khoảng tháng (VD: 8-2026..6-2027) -> xếp nhiều tháng trong một lần lưu file
+        start_month, _, end_month = month_year.partition('..')
+        end_month = end_month or start_month
+        period_label = f"tháng {month_year}" if start_month == end_month else f"các tháng {start_month} → {end_month}"
+        
+        if '|' not in content:
+            # Nếu không có dấu |, coi như chỉ nhập tháng (lỗi hoặc thiếu)
+            return None, "❌ Vui lòng cung cấp danh sách lãnh đạo sau dấu gạch đứng '|'."
+
+        parts = content.split('|')
+        names_str = parts[0].strip()
+        leaders_str = parts[1].strip()
+        
+        leaders = [n.strip() for n in leaders_str.split(',') if n.strip()]
+        
+        # Phân biệt 3 trường hợp:
+        # 1. Không nhập tên (trước dấu | trống) → names=None, start_name=None
+        # 2. Nhập 1 tên (không có dấu phẩy) → đó là người bắt đầu, start_name=tên đó
+        # 3. Nhập nhiều tên (có dấu phẩy) → đó là danh sách đầy đủ, names=list
+        names = None
+        start_name = None
+
+        # Từ khóa chế độ (tùy chọn) đứng đầu: 'balanced' / 'can_bang' -> xếp cân bằng
+        mode = 'round_robin'
+        first_word, _, rest = names_str.partition(' ')
+        if first_word.lower() in BALANCED_MODE_KEYWORDS:
+            mode = 'balanced'
+            names_str = rest.strip()
+        
+        if names_str:
+            if ',' in names_str:
+                # Nhiều tên → danh sách đầy đủ
+                names = [n.strip() for n in names_str.split(',') if n.strip()]
+            else:
+                # 1 tên duy nhất → người bắt đầu
+                start_name = names_str
+
+        if not leaders:
+            return None, "❌ Thiếu danh sách lãnh đạo."
+
+        if mode == 'balanced' and start_name:
+            return None, "❌ Chế độ cân bằng không dùng tên người bắt đầu. Bỏ tên hoặc nhập danh sách nhiều tên (cách nhau dấu phẩy)."
+
+        return {
+            'month_year': month_year,
+            'start_month': start_month,
+            'end_month': end_month,
+            'period_label': period_label,
+            'names': names,
+            'leaders': leaders,
+            'start_name': start_name,
+            'mode': mode,
+        }, None
+
     async def auto_schedule_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Xếp lịch tự động: /auto_schedule [m-yyyy] [danh_sách_cán_bộ] | [danh_sách_lãnh_đạo]"""
+        """Xếp lịch tự động: /auto_schedule [m-yyyy | m-yyyy..m-yyyy] [danh_sách_cán_bộ] | [danh_sách_lãnh_đạo]"""
         user_id = str(update.effective_user.id)
         if hasattr(config, 'ADMIN_IDS') and user_id not in config.ADMIN_IDS:
              await update.message.reply_text("⛔ Bạn không có quyền thực hiện lệnh này.")
              return
 
         if not context.args:
-            await update.message.reply_text(
-                "⚠️ Cách dùng 1 (Lấy tên từ DS trực): /auto_schedule [m-yyyy] | [Lãnh đạo]\n"
-                "Ví dụ: /auto_schedule 3-2026 | Lãnh Đạo A, Lãnh Đạo B\n\n"
-                "⚠️ Cách dùng 2 (Chỉ định người bắt đầu): /auto_schedule [m-yyyy] [Tên] | [Lãnh đạo]\n"
-                "Ví dụ: /auto_schedule 3-2026 Hải | Lãnh Đạo A\n\n"
-                "⚠️ Cách dùng 3 (Nhập DS thủ công): /auto_schedule [m-yyyy] [Tên_A, Tên_B] | [Lãnh đạo]\n"
-                "Ví dụ: /auto_schedule 3-2026 Hải, Việt | Lãnh Đạo A"
-            )
+            await update.message.reply_text(AUTO_SCHEDULE_USAGE)
             return
 
         try:
-            full_text = " ".join(context.args)
-            month_year = context.args[0]
-            
-            # Phần còn lại sau month_year
-            content = full_text.replace(month_year, "", 1).strip()
-            
-            if '|' in content:
-                parts = content.split('|')
-                names_str = parts[0].strip()
-                leaders_str = parts[1].strip()
-                
-                leaders = [n.strip() for n in leaders_str.split(',') if n.strip()]
-                
-                # Phân biệt 3 trường hợp:
-                # 1. Không nhập tên (trước dấu | trống) → names=None, start_name=None
-                # 2. Nhập 1 tên (không có dấu phẩy) → đó là người bắt đầu, start_name=tên đó
-                # 3. Nhập nhiều tên (có dấu phẩy) → đó là danh sách đầy đủ, names=list
-                names = None
-                start_name = None
-                
-                if names_str:
-                    if ',' in names_str:
-                        # Nhiều tên → danh sách đầy đủ
-                        names = [n.strip() for n in names_str.split(',') if n.strip()]
-                    else:
-                        # 1 tên duy nhất → người bắt đầu
-                        start_name = names_str
-            else:
-                # Nếu không có dấu |, coi như chỉ nhập tháng (lỗi hoặc thiếu)
-                await update.message.reply_text("❌ Vui lòng cung cấp danh sách lãnh đạo sau dấu gạch đứng '|'.")
-                return
-            
-            if not leaders:
-                await update.message.reply_text("❌ Thiếu danh sách lãnh đạo.")
+            params, error = self._parse_auto_schedule_args(context.args)
+            if error:
+                await update.message.reply_text(error)
                 return
 
-            if start_name:
-                await update.message.reply_text(f"⏳ Đang xếp lịch vòng tròn cho tháng {month_year}, bắt đầu từ <b>{start_name}</b>...", parse_mode='HTML')
+            month_year = params['month_year']
+            period_label = params['period_label']
+            start_name = params['start_name']
+            if params['mode'] == 'balanced':
+                await update.message.reply_text(f"⏳ Đang xếp lịch cân bằng cho {period_label}...")
+            elif start_name:
+                await update.message.reply_text(f"⏳ Đang xếp lịch vòng tròn cho {period_label}, bắt đầu từ <b>{start_name}</b>...", parse_mode='HTML')
             else:
-                await update.message.reply_text(f"⏳ Đang tự động xếp lịch vòng tròn cho tháng {month_year}...")
-            
-            success, message = self.schedule_mgr.auto_generate_round_robin(month_year, names, leaders, start_name=start_name)
+                await update.message.reply_text(f"⏳ Đang tự động xếp lịch vòng tròn cho {period_label}...")
             
+            success, message = await self._run_schedule_write(
+                self.schedule_mgr.auto_generate_range,
+                params['start_month'], params['end_month'], params['names'], params['leaders'],
+                start_name=start_name, mode=params['mode']
+            )
+
             if success:
-                 # Gửi file Excel cho Admin kiểm tra
-                filepath = self.schedule_mgr.get_master_schedule_path()
-                with open(filepath, 'rb') as doc:
-                    await update.message.reply_document(
-                        document=doc,
-                        filename=f"Lich_Truc_{month_year}.xlsx",
-                        caption=f"✅ {message}\nBạn hãy kiểm tra sheet '{month_year}' trong file đính kèm."
-                    )
+                # Gửi cho Admin kiểm tra: chỉ các sheet tháng vừa xếp (file nhỏ) thay cho cả file năm học
+                sheet_names = [f"{m}-{y}" for m, y in ScheduleManager.month_range(params['start_month'], params['end_month'])]
+                chat_id = update.effective_chat.id
+                results = await self._send_sheets(
+                    context.bot, [chat_id], sheet_names,
+                    f"Lich_Truc_{month_year.replace('..', '_')}.xlsx",
+                    caption=f"✅ {message}\nBạn hãy kiểm tra sheet '{month_year}' trong file đính kèm."
+                )
+                if results[chat_id]:
+                    raise results[chat_id]
             else:
                 await update.message.reply_text(f"❌ Lỗi: {message}")
 
@@ -741,6 +1046,84 @@ class DutyBot:
             logger.error(f"Error in auto_schedule: {e}")
             await update.message.reply_text(f"❌ Có lỗi xảy ra: {str(e)}")
 
+    def _format_schedule_preview(self, m, y, assignments):
+        """Bảng lịch một tháng (HTML, khối <pre>) cho bản xếp thử: mỗi ngày làm việc một dòng"""
+        import calendar
+
+        day_short = ["T2", "T3", "T4", "T5", "T6", "T7", "CN"]
+        lines = []
+        for day in range(1, calendar.monthrange(y, m)[1] + 1):
+            duty_date = datetime(y, m, day).date()
+            if duty_date not in assignments:
+                continue
+            morning, afternoon, leader = assignments[duty_date]
+            lines.append(
+                f"{duty_date.strftime('%d/%m')} {day_short[duty_date.weekday()]} | "
+                f"{morning or '-'} | {afternoon or '-'} | {leader or '-'}"
+            )
+        body = html.escape("\n".join(lines) or "(không có ngày làm việc)")
+        return f"📅 <b>Tháng {m}-{y}</b> (Ngày | Sáng | Chiều | Lãnh đạo)\n<pre>{body}</pre>"
+
+    async def auto_schedule_preview_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Xếp thử (không ghi file): /auto_schedule_preview <cùng cú pháp /auto_schedule>"""
+        user_id = str(update.effective_user.id)
+        if hasattr(config, 'ADMIN_IDS') and user_id not in config.ADMIN_IDS:
+            await update.message.reply_text("⛔ Bạn không có quyền thực hiện lệnh này.")
+            return
+
+        if not context.args:
+            await update.message.reply_text(AUTO_SCHEDULE_USAGE.replace('/auto_schedule ', '/auto_schedule_preview '))
+            return
+
+        try:
+            params, error = self._parse_auto_schedule_args(context.args)
+            if error:
+                await update.message.reply_text(error)
+                return
+
+            # Xếp thử (lập chỉ mục, chạy bộ xếp cân bằng, có thể nhiều tháng) chạy trong thread riêng
+            token, plan = await asyncio.to_thread(
+                self.schedule_mgr.preview_auto_schedule,
+                params['start_month'], params['end_month'], params['names'], params['leaders'],
+                start_name=params['start_name'], mode=params['mode']
+            )
+            if token is None:
+                await update.message.reply_text(f"❌ Lỗi: {plan}")
+                return
+
+            for m, y in plan['months']:
+                await update.message.reply_text(
+                    self._format_schedule_preview(m, y, plan['assignments'][(m, y)]), parse_mode='HTML'
+                )
+            ttl_minutes = int(PREVIEW_TTL.total_seconds() // 60)
+            await update.message.reply_text(
+                f"👁️ Đây là bản xếp thử cho {params['period_label']}"
+                f"{' (chế độ cân bằng)' if params['mode'] == 'balanced' else ''}, <b>chưa ghi vào file</b>.\n"
+                f"Ghi vào file: <code>/auto_schedule_commit {token}</code> (hiệu lực {ttl_minutes} phút)",
+                parse_mode='HTML'
+            )
+
+        except Exception as e:
+            logger.error(f"Error in auto_schedule_preview: {e}")
+            await update.message.reply_text(f"❌ Có lỗi xảy ra: {str(e)}")
+
+    async def auto_schedule_commit_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Ghi bản xếp thử vào file Excel: /auto_schedule_commit <mã>"""
+        user_id = str(update.effective_user.id)
+        if hasattr(config, 'ADMIN_IDS') and user_id not in config.ADMIN_IDS:
+            await update.message.reply_text("⛔ Bạn không có quyền thực hiện lệnh này.")
+            return
+
+        if not context.args:
+            await update.message.reply_text("❌ Vui lòng nhập mã bản xếp thử. Ví dụ: /auto_schedule_commit a1b2c3")
+            return
+
+        token = context.args[0].strip().lower()
+        success, message = await self._run_schedule_write(self.schedule_mgr.commit_schedule_preview, token)
+        await update.message.reply_text(f"{'✅' if success else '❌'} {message}")
+        if success:
+            logger.info(f"Admin {update.effective_user.full_name} committed schedule preview {token}")
+
     async def start_new_year_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Tạo file Excel chuẩn cho năm học mới: /start_new_year [year]"""
         user_id = str(update.effective_user.id)
@@ -758,7 +1141,7 @@ class DutyBot:
             f"{f' ({year_arg}-{int(year_arg)+1})' if year_arg else ''}..."
         )
 
-        success, message, filepath = self.schedule_mgr.start_new_year(year_arg)
+        success, message, filepath = await self._run_schedule_write(self.schedule_mgr.start_new_year, year_arg)
 
         if success:
             try:
@@ -781,7 +1164,7 @@ class DutyBot:
             return
 
         if not context.args or not context.args[0].isdigit():
-            years = self.db.get_all_years()
+            years = await self.db.get_all_years()
             years_str = ", ".join(f"{y}-{y+1}{' (hiện tại)' if cur else ''}" for y, _, cur in years) or "chưa có năm nào"
             await update.message.reply_text(
                 f"❌ Vui lòng nhập năm. Ví dụ: /set_current_year 2026\n"
@@ -791,7 +1174,7 @@ class DutyBot:
 
         year = int(context.args[0])
         try:
-            self.db.set_current_year(year)
+            await self.db.set_current_year(year)
             await update.message.reply_text(f"✅ Đã chuyển năm hiện tại đang quản lý sang {year}-{year+1}.")
             logger.info(f"Admin {update.effective_user.full_name} set current year to {year}")
         except ValueError as e:
@@ -799,6 +1182,218 @@ class DutyBot:
                 f"❌ {e}. Năm này chưa có file template — dùng /start_new_year {year} để tạo trước."
             )
 
+    async def rotation_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Xem/xóa vị trí vòng tròn xếp lịch đã lưu: /rotation | /rotation reset [m-yyyy]"""
+        user_id = str(update.effective_user.id)
+        if hasattr(config, 'ADMIN_IDS') and user_id not in config.ADMIN_IDS:
+            await update.message.reply_text("⛔ Bạn không có quyền thực hiện lệnh này.")
+            return
+
+        if context.args and context.args[0].lower() == 'reset':
+            month_year = context.args[1] if len(context.args) > 1 else None
+            success, message = await asyncio.to_thread(self.schedule_mgr.reset_rotation_state, month_year)
+            await update.message.reply_text(f"{'✅' if success else '❌'} {message}")
+            if success:
+                logger.info(f"Admin {update.effective_user.full_name} reset rotation state ({month_year or 'all'})")
+            return
+
+        states = await asyncio.to_thread(self.schedule_mgr.get_rotation_state)
+        if not states:
+            await update.message.reply_text(
+                "ℹ️ Chưa lưu vị trí vòng tròn nào cho năm học hiện tại.\n"
+                "Lần xếp lịch vòng tròn tiếp theo sẽ dò người trực cuối của tháng trước."
+            )
+            return
+
+        msg = "🔄 <b>VỊ TRÍ VÒNG TRÒN (cuối mỗi tháng đã xếp)</b>\n\n"
+        for state in states:
+            msg += (
+                f"• <b>{state['month']}</b>: cán bộ #{state['officer_index']}, lãnh đạo #{state['leader_index']}"
+                f" ({state['roster_size']} người, cập nhật {state['updated_at']})\n"
+            )
+        msg += "\n<i>Xóa: /rotation reset [m-yyyy] (bỏ trống tháng để xóa cả năm)</i>"
+        await update.message.reply_text(msg, parse_mode='HTML')
+
+    async def backup_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Xem/khôi phục bản sao file năm học: /backup | /backup restore <số thứ tự hoặc tên bản sao>"""
+        user_id = str(update.effective_user.id)
+        if hasattr(config, 'ADMIN_IDS') and user_id not in config.ADMIN_IDS:
+            await update.message.reply_text("⛔ Bạn không có quyền thực hiện lệnh này.")
+            return
+
+        backups = await asyncio.to_thread(self.schedule_mgr.list_schedule_backups)
+
+        if context.args and context.args[0].lower() == 'restore':
+            if len(context.args) < 2:
+                await update.message.reply_text("❌ Vui lòng nhập số thứ tự bản sao. Ví dụ: /backup restore 1")
+                return
+            choice = context.args[1]
+            if choice.isdigit():
+                if not 1 <= int(choice) <= len(backups):
+                    await update.message.reply_text(f"❌ Không có bản sao số {choice}. Dùng /backup để xem danh sách.")
+                    return
+                choice = backups[int(choice) - 1][0]
+            success, message = await self._run_schedule_write(self.schedule_mgr.restore_schedule_backup, choice)
+            await update.message.reply_text(f"{'✅' if success else '❌'} {message}")
+            if success:
+                logger.info(f"Admin {update.effective_user.full_name} restored schedule backup {choice}")
+            return
+
+        if not backups:
+            await update.message.reply_text("ℹ️ Chưa có bản sao nào của file năm học hiện tại.")
+            return
+
+        msg = "🗂️ <b>BẢN SAO FILE NĂM HỌC</b> (mới nhất trước)\n\n"
+        for i, (name, _, taken_at) in enumerate(backups, 1):
+            msg += f"{i}. {taken_at.strftime('%d/%m/%Y %H:%M:%S')} — <code>{html.escape(name)}</code>\n"
+        msg += "\n<i>Khôi phục: /backup restore [số thứ tự]</i>"
+        await update.message.reply_text(msg, parse_mode='HTML')
+
+    async def replace_range_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Thay một cán bộ trong khoảng ngày (nghỉ phép):
+        /replace_range [tên] [từ dd/mm/yyyy] [đến dd/mm/yyyy] [\"người thay\" | auto] [lý do]"""
+        user_id = str(update.effective_user.id)
+        if hasattr(config, 'ADMIN_IDS') and user_id not in config.ADMIN_IDS:
+            await update.message.reply_text("⛔ Bạn không có quyền thực hiện lệnh này.")
+            return
+
+        usage = (
+            "❌ Sai cú pháp! /replace_range [tên] [từ ngày] [đến ngày] [người thay | auto] [lý do]\n"
+            "Ví dụ: /replace_range Nguyễn Văn A 04/05/2026 15/05/2026 auto Nghỉ phép\n"
+            "hoặc: /replace_range \"Nguyễn Văn A\" 04/05/2026 15/05/2026 \"Trần Văn B\""
+        )
+        try:
+            args = shlex.split(update.message.text)[1:]
+        except ValueError:
+            await update.message.reply_text(usage)
+            return
+
+        # Tên người nghỉ: các từ đứng trước ngày đầu tiên
+        date_pos = next((i for i, a in enumerate(args) if re.fullmatch(r'\d{1,2}/\d{1,2}/\d{4}', a)), None)
+        if not date_pos or len(args) < date_pos + 3:
+            await update.message.reply_text(usage)
+            return
+        name = " ".join(args[:date_pos])
+        try:
+            start_date = datetime.strptime(args[date_pos], '%d/%m/%Y')
+            end_date = datetime.strptime(args[date_pos + 1], '%d/%m/%Y')
+        except ValueError:
+            await update.message.reply_text("❌ Định dạng ngày không đúng (dd/mm/yyyy).")
+            return
+        substitute = args[date_pos + 2]
+        reason = " ".join(args[date_pos + 3:])
+
+        success, message, changes = await self._run_schedule_write(
+            self.schedule_mgr.replace_range, name, start_date, end_date, substitute,
+            reason=reason, changed_by=update.effective_user.full_name
+        )
+        if not success:
+            await update.message.reply_text(f"❌ {message}")
+            return
+
+        lines = ["✅ <b>THAY LỊCH TRỰC</b>", html.escape(message), ""]
+        lines += [f"• {d.strftime('%d/%m/%Y')} ({shift}): {html.escape(new)}" for d, shift, new in changes]
+        await self._reply_long_html(update, "\n".join(lines))
+        logger.info(f"Range replaced by {update.effective_user.full_name}: {message}")
+
+    async def _download_attachment(self, update: Update, extensions):
+        """File đính kèm của lệnh (gửi kèm chú thích lệnh, hoặc trả lời tin nhắn có file bằng lệnh).
+        Trả về None nếu không có file, (tên file, None) nếu sai định dạng, (tên file, bytes) nếu tải được."""
+        document = update.message.document
+        if document is None and update.message.reply_to_message:
+            document = update.message.reply_to_message.document
+        if document is None:
+            return None
+        filename = document.file_name or ""
+        if not filename.lower().endswith(extensions):
+            return filename, None
+        tg_file = await document.get_file()
+        return filename, bytes(await tg_file.download_as_bytearray())
+
+    async def import_officers_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Nhập hàng loạt cán bộ: gửi file .csv/.xlsx (Họ tên, Miễn, Lý do, Telegram ID, SĐT)
+        kèm chú thích /import_officers, hoặc trả lời tin nhắn có file bằng /import_officers"""
+        user_id = str(update.effective_user.id)
+        if hasattr(config, 'ADMIN_IDS') and user_id not in config.ADMIN_IDS:
+            await update.message.reply_text("⛔ Bạn không có quyền thực hiện lệnh này.")
+            return
+
+        attached = await self._download_attachment(update, ('.csv', '.xlsx'))
+        if attached is None:
+            await update.message.reply_text(
+                "❌ Vui lòng gửi file .csv hoặc .xlsx kèm chú thích /import_officers "
+                "(hoặc trả lời tin nhắn có file bằng /import_officers).\n"
+                "Mỗi dòng: Họ tên, Miễn (x), Lý do, Telegram ID, SĐT — dòng tiêu đề (nếu có) sẽ được bỏ qua."
+            )
+            return
+        filename, content = attached
+        if content is None:
+            await update.message.reply_text("❌ Chỉ hỗ trợ file .csv hoặc .xlsx.")
+            return
+
+        success, message, report = await self._run_schedule_write(self.schedule_mgr.import_officers, filename, content)
+        icons = {'added': '➕', 'updated': '✏️', 'unchanged': '▫️', 'error': '❌'}
+        lines = [f"{'✅' if success else '❌'} <b>NHẬP DS CÁN BỘ</b> ({html.escape(filename)})", html.escape(message), ""]
+        lines += [f"{icons[status]} Dòng {line}: {html.escape(detail)}" for line, status, detail in report]
+        await self._reply_long_html(update, "\n".join(lines))
+        if success:
+            await self.refresh_contacts()  # Telegram ID/SĐT vừa nhập
+            logger.info(f"Admin {update.effective_user.full_name} imported officers from {filename}: {message}")
+
+    async def holidays_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Lịch ngày nghỉ: /holidays [dd/mm/yyyy] | /holidays delete dd/mm/yyyy [dd/mm/yyyy]
+        | gửi file .ics/.csv kèm chú thích /holidays (hoặc trả lời tin nhắn có file bằng /holidays)"""
+        user_id = str(update.effective_user.id)
+        if hasattr(config, 'ADMIN_IDS') and user_id not in config.ADMIN_IDS:
+            await update.message.reply_text("⛔ Bạn không có quyền thực hiện lệnh này.")
+            return
+
+        # Lệnh có thể đến từ chú thích của file đính kèm (MessageHandler) nên tự tách tham số
+        text = update.message.text or update.message.caption or ""
+        args = text.split()[1:]
+
+        attached = await self._download_attachment(update, ('.ics', '.csv'))
+        if attached is not None:
+            filename, content = attached
+            if content is None:
+                await update.message.reply_text("❌ Chỉ hỗ trợ file .ics hoặc .csv.")
+                return
+            # Đọc file người dùng gửi + ghi DB trong thread riêng, không chặn các lệnh khác
+            success, message = await asyncio.to_thread(self.schedule_mgr.import_holidays, filename, content)
+            await update.message.reply_text(f"{'✅' if success else '❌'} {message}")
+            if success:
+                logger.info(f"Admin {update.effective_user.full_name} imported holidays from {filename}")
+            return
+
+        try:
+            if args and args[0].lower() == 'delete':
+                if len(args) < 2:
+                    await update.message.reply_text("❌ Ví dụ: /holidays delete 02/09/2026 [03/09/2026]")
+                    return
+                start = datetime.strptime(args[1], '%d/%m/%Y').date()
+                end = datetime.strptime(args[2], '%d/%m/%Y').date() if len(args) > 2 else start
+                success, message = await asyncio.to_thread(self.schedule_mgr.delete_holidays, start, end)
+                await update.message.reply_text(f"{'✅' if success else '❌'} {message}")
+                return
+            day = datetime.strptime(args[0], '%d/%m/%Y').date() if args else None
+        except ValueError:
+            await update.message.reply_text("❌ Định dạng ngày không đúng (dd/mm/yyyy).")
+            return
+
+        holidays = await asyncio.to_thread(self.schedule_mgr.list_holidays, day)
+        if not holidays:
+            await update.message.reply_text(
+                "ℹ️ Chưa có ngày nghỉ nào cho năm học này.\n"
+                "Gửi file .ics hoặc .csv (ngày,đến ngày,tên) kèm chú thích /holidays để nhập."
+            )
+            return
+
+        msg = "🏖️ <b>LỊCH NGÀY NGHỈ NĂM HỌC</b>\n\n"
+        for holiday_date, name in holidays:
+            msg += f"• {holiday_date.strftime('%d/%m/%Y')}: {html.escape(name) or 'Nghỉ lễ'}\n"
+        msg += "\n<i>Xóa: /holidays delete dd/mm/yyyy [dd/mm/yyyy]</i>"
+        await update.message.reply_text(msg, parse_mode='HTML')
+
     async def add_officer_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Thêm cán bộ mới vào DS trực: /add_officer [Họ tên]"""
         user_id = str(update.effective_user.id)
@@ -811,7 +1406,7 @@ class DutyBot:
             return
 
         name = " ".join(context.args).strip()
-        success, message = self.schedule_mgr.add_officer(name)
+        success, message = await self._run_schedule_write(self.schedule_mgr.add_officer, name)
         await update.message.reply_text(f"{'✅' if success else '❌'} {message}")
         if success:
             logger.info(f"Admin {update.effective_user.full_name} added officer '{name}'")
@@ -828,7 +1423,7 @@ class DutyBot:
             return
 
         name = " ".join(context.args).strip()
-        success, message = self.schedule_mgr.remove_officer(name)
+        success, message = await self._run_schedule_write(self.schedule_mgr.remove_officer, name)
         await update.message.reply_text(f"{'✅' if success else '❌'} {message}")
         if success:
             logger.info(f"Admin {update.effective_user.full_name} removed officer '{name}'")
@@ -860,7 +1455,7 @@ class DutyBot:
         name = command_args[0].strip()
         reason = " ".join(command_args[1:]).strip()
 
-        success, message = self.schedule_mgr.deactivate_officer(name, reason)
+        success, message = await self._run_schedule_write(self.schedule_mgr.deactivate_officer, name, reason)
         await update.message.reply_text(f"{'✅' if success else '❌'} {message}")
         if success:
             logger.info(f"Admin {update.effective_user.full_name} deactivated officer '{name}' (reason: {reason})")
@@ -877,7 +1472,7 @@ class DutyBot:
             return
 
         name = " ".join(context.args).strip()
-        success, message = self.schedule_mgr.activate_officer(name)
+        success, message = await self._run_schedule_write(self.schedule_mgr.activate_officer, name)
         await update.message.reply_text(f"{'✅' if success else '❌'} {message}")
         if success:
             logger.info(f"Admin {update.effective_user.full_name} activated officer '{name}'")
@@ -908,21 +1503,161 @@ class DutyBot:
         old_name = command_args[0].strip()
         new_name = command_args[1].strip()
 
-        success, message = self.schedule_mgr.rename_officer(old_name, new_name)
+        success, message = await self._run_schedule_write(self.schedule_mgr.rename_officer, old_name, new_name)
         await update.message.reply_text(f"{'✅' if success else '❌'} {message}")
         if success:
+            await self.refresh_contacts()  # rename_officer_contact đã đổi tên trong DB
             logger.info(f"Admin {update.effective_user.full_name} renamed officer '{old_name}' -> '{new_name}'")
 
+    @staticmethod
+    def _utc_timestamp(local_time):
+        """Thời điểm giờ Việt Nam -> chuỗi 'YYYY-MM-DD HH:MM:SS' UTC (cùng định dạng CURRENT_TIMESTAMP của SQLite)"""
+        return local_time.replace(tzinfo=VN_TZ).astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
 
-if __name__ == '__main__':
-    if 'YOUR_TELEGRAM_BOT_TOKEN' in config.TELEGRAM_BOT_TOKEN:
-        print("⚠️ Vui lòng cấu hình TELEGRAM_BOT_TOKEN trong config.py trước khi chạy bot!")
-        exit(1)
+    async def export_history_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Xuất nhật ký ra file: /export_history <noti|change> [csv|xlsx] [dd/mm/yyyy-dd/mm/yyyy]"""
+        user_id = str(update.effective_user.id)
+        if hasattr(config, 'ADMIN_IDS') and user_id not in config.ADMIN_IDS:
+            await update.message.reply_text("⛔ Bạn không có quyền thực hiện lệnh này.")
+            return
+
+        args = [a.lower() for a in (context.args or [])]
+        if not args or args[0] not in HISTORY_KINDS:
+            await update.message.reply_text(
+                "❌ Cú pháp: /export_history [noti|change] [csv|xlsx] [dd/mm/yyyy-dd/mm/yyyy]\n"
+                "• noti: nhật ký gửi thông báo\n"
+                "• change: nhật ký đổi lịch (/change, /swap)\n"
+                "Ví dụ: /export_history change xlsx 01/08/2025-31/12/2025"
+            )
+            return
+
+        kind = args[0]
+        fmt = 'csv'
+        start_time = end_time = None
+        for arg in args[1:]:
+            if arg in EXPORT_FORMATS:
+                fmt = arg
+                continue
+            period = self._parse_search_period(arg) if '-' in arg else None
+            if not period:
+                await update.message.reply_text(f"❌ Tham số không hợp lệ: {arg}")
+                return
+            start_date, end_date, _ = period
+            # Nhật ký lưu thời điểm theo UTC (CURRENT_TIMESTAMP của SQLite): đổi đầu/cuối ngày giờ Việt Nam sang UTC
+            start_time = self._utc_timestamp(start_date.replace(hour=0, minute=0, second=0, microsecond=0))
+            end_time = self._utc_timestamp(end_date.replace(hour=23, minute=59, second=59, microsecond=0))
+
+        await update.message.reply_text("⏳ Đang xuất nhật ký, vui lòng chờ...")
+
+        path = None
+        try:
+            # Ghi file trong thread riêng để không chặn các lệnh khác khi nhật ký lớn
+            path, filename, count = await asyncio.to_thread(
+                export_history, self.db.sync, kind, fmt, start_time, end_time
+            )
+            with open(path, 'rb') as doc:
+                await update.message.reply_document(
+                    document=doc,
+                    filename=filename,
+                    caption=f"✅ Đã xuất {count} dòng nhật ký."
+                )
+        except Exception as e:
+            logger.error(f"Error exporting history: {e}")
+            await update.message.reply_text(f"❌ Lỗi khi xuất nhật ký: {e}")
+        finally:
+            if path and os.path.exists(path):
+                os.remove(path)
+
+    def _render_history_page(self, kind, page):
+        """Định dạng một trang nhật ký + bàn phím inline Mới hơn/Cũ hơn.
+        Con trỏ keyset (thời gian, id) được nhúng vào callback_data: hist|<kind>|<older/newer>|<thời gian>|<id>"""
+        if kind == 'noti':
+            title = "📨 <b>NHẬT KÝ GỬI THÔNG BÁO</b>"
+            lines = [
+                f"• <code>{r[4]}</code> {html.escape(str(r[3]))} ({r[2]} {r[1]}): "
+                f"{'✅' if r[5] == 'Success' else '❌'} {html.escape(str(r[6] or ''))}".rstrip()
+                for r in page['rows']
+            ]
+        else:
+            title = "🔁 <b>NHẬT KÝ ĐỔI LỊCH</b>"
+            lines = [
+                f"• <code>{r[1]}</code> {r[2]} {r[3]}: {html.escape(str(r[4]))} → {html.escape(str(r[5]))}"
+                f"{f' ({html.escape(str(r[6]))})' if r[6] else ''}{f' — {html.escape(str(r[7]))}' if r[7] else ''}"
+                for r in page['rows']
+            ]
+
+        text = title + "\n\n" + ("\n".join(lines) if lines else "<i>Không có dữ liệu.</i>")
+
+        buttons = []
+        if page['newer_cursor']:
+            t, row_id = page['newer_cursor']
+            buttons.append(InlineKeyboardButton("⬅️ Mới hơn", callback_data=f"hist|{kind}|newer|{t}|{row_id}"))
+        if page['older_cursor']:
+            t, row_id = page['older_cursor']
+            buttons.append(InlineKeyboardButton("Cũ hơn ➡️", callback_data=f"hist|{kind}|older|{t}|{row_id}"))
+        markup = InlineKeyboardMarkup([buttons]) if buttons else None
+        return text, markup
+
+    async def _get_history_page(self, kind, cursor=None, direction='older'):
+        if kind == 'noti':
+            return await self.db.get_notification_history_page(cursor, direction, HISTORY_PAGE_SIZE)
+        return await self.db.get_schedule_change_history_page(cursor, direction, HISTORY_PAGE_SIZE)
+
+    async def history_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Xem nhật ký theo trang: /history [noti|change] (mặc định: change)"""
+        user_id = str(update.effective_user.id)
+        if hasattr(config, 'ADMIN_IDS') and user_id not in config.ADMIN_IDS:
+            await update.message.reply_text("⛔ Bạn không có quyền thực hiện lệnh này.")
+            return
+
+        kind = context.args[0].lower() if context.args else 'change'
+        if kind not in HISTORY_KINDS:
+            await update.message.reply_text("❌ Cú pháp: /history [noti|change]")
+            return
+
+        try:
+            page = await self._get_history_page(kind)
+            text, markup = self._render_history_page(kind, page)
+            await update.message.reply_text(text, parse_mode='HTML', reply_markup=markup)
+        except Exception as e:
+            logger.error(f"Error reading history: {e}")
+            await update.message.reply_text("❌ Có lỗi xảy ra khi đọc nhật ký.")
+
+    async def history_page_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Xử lý nút Mới hơn/Cũ hơn của /history"""
+        query = update.callback_query
+        user_id = str(query.from_user.id)
+        if hasattr(config, 'ADMIN_IDS') and user_id not in config.ADMIN_IDS:
+            await query.answer("⛔ Bạn không có quyền thực hiện lệnh này.", show_alert=True)
+            return
+
+        try:
+            _, kind, direction, cursor_time, cursor_id = query.data.split('|', 4)
+            page = await self._get_history_page(kind, (cursor_time, int(cursor_id)), direction)
+            text, markup = self._render_history_page(kind, page)
+            await query.answer()
+            await query.edit_message_text(text, parse_mode='HTML', reply_markup=markup)
+        except Exception as e:
+            logger.error(f"Error paging history: {e}")
+            await query.answer("❌ Có lỗi xảy ra khi đọc nhật ký.")
+
+
+def build_application(bot_logic, base_url=None, base_file_url=None, concurrent_updates=None):
+    """Tạo Application với đầy đủ handler và job. base_url/base_file_url: địa chỉ Bot API thay thế
+    (VD: máy chủ giả lập trong fake_telegram.py), mặc định là api.telegram.org.
+    concurrent_updates: số update xử lý song song (mặc định CONCURRENT_UPDATES trong config; 1 = lần lượt)."""
+    async def close_database(application):
+        # Ghi nốt các yêu cầu SQLite đang chờ trước khi thoát
+        await bot_logic.db.close()
+
+    if concurrent_updates is None:
+        concurrent_updates = int(getattr(config, 'CONCURRENT_UPDATES', 16))
+    builder = (ApplicationBuilder().token(config.TELEGRAM_BOT_TOKEN).post_shutdown(close_database)
+               .concurrent_updates(concurrent_updates if concurrent_updates > 1 else False))
+    if base_url:
+        builder = builder.base_url(base_url).base_file_url(base_file_url or base_url.replace('/bot', '/file/bot'))
+    app = builder.build()
 
-    bot_logic = DutyBot()
-    
-    app = ApplicationBuilder().token(config.TELEGRAM_BOT_TOKEN).build()
-    
     # Add Command Handlers
     app.add_handler(CommandHandler("start", bot_logic.start))
     app.add_handler(CommandHandler("help", bot_logic.help_command))
@@ -934,15 +1669,27 @@ if __name__ == '__main__':
     app.add_handler(CommandHandler("search", bot_logic.find_schedule))
     app.add_handler(CommandHandler("register", bot_logic.register_user))
     app.add_handler(CommandHandler("swap", bot_logic.swap_schedule))
+    app.add_handler(CommandHandler("replace_range", bot_logic.replace_range_command))
     app.add_handler(CommandHandler("stats", bot_logic.stats_command))
     app.add_handler(CommandHandler("auto_schedule", bot_logic.auto_schedule_command))
+    app.add_handler(CommandHandler("auto_schedule_preview", bot_logic.auto_schedule_preview_command))
+    app.add_handler(CommandHandler("auto_schedule_commit", bot_logic.auto_schedule_commit_command))
     app.add_handler(CommandHandler("start_new_year", bot_logic.start_new_year_command))
     app.add_handler(CommandHandler("set_current_year", bot_logic.set_current_year_command))
+    app.add_handler(CommandHandler("rotation", bot_logic.rotation_command))
+    app.add_handler(CommandHandler("backup", bot_logic.backup_command))
+    app.add_handler(CommandHandler("holidays", bot_logic.holidays_command))
+    app.add_handler(MessageHandler(filters.Document.ALL & filters.CaptionRegex(r'^/holidays\b'), bot_logic.holidays_command))
     app.add_handler(CommandHandler("add_officer", bot_logic.add_officer_command))
     app.add_handler(CommandHandler("remove_officer", bot_logic.remove_officer_command))
     app.add_handler(CommandHandler("deactive_officer", bot_logic.deactive_officer_command))
     app.add_handler(CommandHandler("active_officer", bot_logic.active_officer_command))
     app.add_handler(CommandHandler("edit_officer", bot_logic.edit_officer_command))
+    app.add_handler(CommandHandler("import_officers", bot_logic.import_officers_command))
+    app.add_handler(MessageHandler(filters.Document.ALL & filters.CaptionRegex(r'^/import_officers\b'), bot_logic.import_officers_command))
+    app.add_handler(CommandHandler("export_history", bot_logic.export_history_command))
+    app.add_handler(CommandHandler("history", bot_logic.history_command))
+    app.add_handler(CallbackQueryHandler(bot_logic.history_page_callback, pattern=r'^hist\|'))
 
     # Job Queue
     job_queue = app.job_queue
@@ -967,5 +1714,46 @@ if __name__ == '__main__':
     except Exception as e:
         print(f"❌ Lỗi cấu hình auto schedule: {e}")
 
-    print("🤖 Bot đang chạy...")
-    app.run_polling()
+    return app
+
+
+def webhook_options():
+    """Tham số run_webhook/start_webhook lấy từ config (TELEGRAM_MODE = "webhook").
+    Telegram gọi WEBHOOK_URL/WEBHOOK_PATH; máy chủ cục bộ nghe tại WEBHOOK_LISTEN:WEBHOOK_PORT."""
+    url_path = str(getattr(config, 'WEBHOOK_PATH', 'telegram')).strip('/')
+    public_url = str(getattr(config, 'WEBHOOK_URL', '') or '').rstrip('/')
+    return {
+        'listen': getattr(config, 'WEBHOOK_LISTEN', '127.0.0.1'),
+        'port': int(getattr(config, 'WEBHOOK_PORT', 8443)),
+        'url_path': url_path,
+        'webhook_url': f"{public_url}/{url_path}" if public_url else None,
+        'secret_token': getattr(config, 'WEBHOOK_SECRET_TOKEN', None) or None,
+        'cert': getattr(config, 'WEBHOOK_CERT', None) or None,
+        'key': getattr(config, 'WEBHOOK_KEY', None) or None,
+    }
+
+
+def run_application(app):
+    """Chạy bot theo TELEGRAM_MODE: "polling" (mặc định, không cần địa chỉ public) hoặc "webhook"
+    (Telegram đẩy update tới máy chủ HTTP của bot, không có độ trễ long-polling)."""
+    mode = str(getattr(config, 'TELEGRAM_MODE', 'polling')).lower()
+    if mode == 'webhook':
+        options = webhook_options()
+        if not options['webhook_url']:
+            print("⚠️ Chế độ webhook cần WEBHOOK_URL (địa chỉ HTTPS public của bot) trong config.py!")
+            exit(1)
+        print(f"🤖 Bot đang chạy (webhook: {options['listen']}:{options['port']}/{options['url_path']})...")
+        app.run_webhook(**options)
+    else:
+        print("🤖 Bot đang chạy...")
+        app.run_polling()
+
+
+if __name__ == '__main__':
+    if 'YOUR_TELEGRAM_BOT_TOKEN' in config.TELEGRAM_BOT_TOKEN:
+        print("⚠️ Vui lòng cấu hình TELEGRAM_BOT_TOKEN trong config.py trước khi chạy bot!")
+        exit(1)
+
+    bot_logic = DutyBot()
+    app = build_application(bot_logic)
+    run_application(app)
@@ -9,15 +9,39 @@ SCHEDULE_FOLDER = "lich-truc-ban"
 # (dùng /start_new_year để tạo, /set_current_year để chỉnh tay năm hiện tại).
 
 LOG_FOLDER = "logs"
+# Mức log ("DEBUG" để xem chi tiết từng ngày khi xếp lịch/đọc file) và định dạng ("text" hoặc "json")
+LOG_LEVEL = "INFO"
+LOG_FORMAT = "text"
 DATABASE_FILE = "truc_ban.db"
 
 # Cấu hình Telegram Bot
 TELEGRAM_BOT_TOKEN = "YOUR_BOT_TOKEN_HERE"
 ADMIN_IDS = ["YOUR_TELEGRAM_ID_HERE"] # Ví dụ: ["123456789"]
 
+# Cách nhận tin nhắn từ Telegram: "polling" (mặc định, bot tự hỏi Telegram) hoặc "webhook"
+# (Telegram đẩy tin tới máy chủ HTTP của bot ngay lập tức; cần địa chỉ HTTPS public, VD: qua reverse proxy)
+TELEGRAM_MODE = "polling"
+WEBHOOK_URL = ""                 # Địa chỉ public, VD: "https://bot.truong.edu.vn" (bot đăng ký WEBHOOK_URL/WEBHOOK_PATH)
+WEBHOOK_PATH = "telegram"
+WEBHOOK_LISTEN = "127.0.0.1"     # Địa chỉ/cổng máy chủ HTTP cục bộ của bot ("0.0.0.0" nếu không qua proxy)
+WEBHOOK_PORT = 8443
+WEBHOOK_SECRET_TOKEN = ""        # Chuỗi bí mật Telegram gửi kèm mỗi update (nên đặt, update sai bị từ chối)
+WEBHOOK_CERT = ""                # Đường dẫn chứng chỉ TLS (.pem) nếu bot tự phục vụ HTTPS, bỏ trống nếu qua proxy
+WEBHOOK_KEY = ""                 # Đường dẫn khóa riêng TLS tương ứng
+
+# Số tin nhắn (update) xử lý song song: lệnh tra cứu không phải chờ nhau; các lệnh ghi cùng file năm học
+# (/change, /swap, lệnh cán bộ, /auto_schedule...) vẫn xếp hàng lần lượt. Đặt 1 để xử lý tuần tự như trước.
+CONCURRENT_UPDATES = 16
+
 # Cấu hình thời gian gửi thông báo
 NOTIFICATION_TIME = "15:00"
 
+# Chế độ xếp lịch tự động hàng tháng: 'round_robin' (vòng tròn) hoặc 'balanced' (cân bằng tổng số buổi cả năm)
+AUTO_SCHEDULE_MODE = "round_robin"
+
+# Số bản sao file năm học giữ lại trong thư mục lich-truc-ban/.backup (mỗi lần lưu giữ lại phiên bản trước đó)
+SCHEDULE_BACKUP_COUNT = 10
+
 # Cấu hình ánh xạ tĩnh (Nếu không dùng /register)
 TELEGRAM_CHAT_IDS = {
     # "Tên Cán Bộ": "ChatID"
@@ -0,0 +1,55 @@
+# contact_directory.py
+# Danh bạ liên hệ cán bộ trong bộ nhớ: gộp bảng officers_contact và TELEGRAM_CHAT_IDS trong config,
+# tra theo tên (đã chuẩn hóa) hoặc Telegram ID trong O(1) thay vì truy vấn DB cho từng người nhận
+
+from schedule_index import normalize_name
+
+
+class ContactDirectory:
+    """Mỗi liên hệ là bộ (id, name, telegram_id, phone, email) như một dòng officers_contact;
+    liên hệ chỉ có trong config có id = None.
+    - Tên: liên hệ trong DB có Telegram ID được ưu tiên, sau đó mới đến TELEGRAM_CHAT_IDS (như trước đây)
+    - Telegram ID: dòng DB đăng ký sớm nhất được dùng (giống truy vấn get_officer_by_telegram_id)
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._by_name = {}
+        self._by_telegram_id = {}
+
+    def load(self, rows, static_chat_ids=None):
+        """Lập lại danh bạ từ các dòng officers_contact (theo id tăng dần) và ánh xạ tĩnh {tên: chat_id}"""
+        by_name, by_telegram_id = {}, {}
+        for row in sorted(rows, key=lambda r: r[0]):
+            key = normalize_name(row[1])
+            if row[2] or key not in by_name:
+                by_name[key] = row
+            if row[2]:
+                by_telegram_id.setdefault(str(row[2]), row)
+
+        for name, chat_id in (static_chat_ids or {}).items():
+            key = normalize_name(name)
+            if not chat_id or (key in by_name and by_name[key][2]):
+                continue
+            row = (None, name, str(chat_id), None, None)
+            by_name[key] = row
+            by_telegram_id.setdefault(str(chat_id), row)
+
+        self._by_name, self._by_telegram_id = by_name, by_telegram_id
+        self.loaded = True
+
+    def get(self, name):
+        """Liên hệ theo tên (không phân biệt hoa thường/dạng Unicode), hoặc None"""
+        return self._by_name.get(normalize_name(name or ''))
+
+    def chat_id_for(self, name):
+        """Telegram chat_id để gửi thông báo cho cán bộ, hoặc None nếu chưa đăng ký"""
+        contact = self.get(name)
+        return contact[2] if contact and contact[2] else None
+
+    def by_telegram_id(self, telegram_id):
+        """Liên hệ đã đăng ký với Telegram ID này, hoặc None"""
+        return self._by_telegram_id.get(str(telegram_id))
+
+    def __len__(self):
+        return len(self._by_name)
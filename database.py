@@ -5,14 +5,23 @@ import sqlite3
 from datetime import datetime
 import config
 
+# Thứ tự cột của các bảng nhật ký (dùng làm tiêu đề khi xuất file)
+NOTIFICATION_LOG_COLUMNS = ('id', 'date', 'shift', 'officer_name', 'notification_time', 'status', 'message')
+SCHEDULE_CHANGE_LOG_COLUMNS = ('id', 'change_date', 'duty_date', 'shift', 'old_officer', 'new_officer', 'reason', 'approved_by')
+
+
 class DatabaseManager:
     def __init__(self):
         self.db_file = config.DATABASE_FILE
         self.init_database()
     
+    def _connect(self):
+        """Kết nối SQLite cho một thao tác (mỗi hàm tự mở/commit/đóng; xem async_database cho chế độ dùng chung)"""
+        return sqlite3.connect(self.db_file)
+
     def init_database(self):
         """Khởi tạo database và các bảng cần thiết"""
-        conn = sqlite3.connect(self.db_file)
+        conn = self._connect()
         cursor = conn.cursor()
         
         # Bảng lưu nhật ký thông báo
@@ -62,6 +71,51 @@ class DatabaseManager:
             )
         ''')
 
+        # Bảng lưu vị trí vòng tròn xếp lịch ở cuối mỗi tháng đã xếp (để tháng sau nối tiếp, không cần dò lại sheet)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rotation_state (
+                schedule_file TEXT NOT NULL,
+                month TEXT NOT NULL,
+                officer_index INTEGER NOT NULL,
+                leader_index INTEGER NOT NULL,
+                roster_size INTEGER NOT NULL,
+                roster_hash TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (schedule_file, month)
+            )
+        ''')
+
+        # Bảng lưu file_id Telegram của các file đã upload (theo mã băm nội dung) để gửi lại không cần upload
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS telegram_file_cache (
+                content_hash TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                file_id TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (content_hash, filename)
+            )
+        ''')
+
+        # Bảng ngày nghỉ (lễ, Tết, nghỉ bù...) nhập từ file ICS/CSV, dùng lập lịch ngày làm việc
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS holidays (
+                day TEXT PRIMARY KEY,
+                name TEXT,
+                source TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # Chỉ mục cho phân trang keyset (lịch sử mới nhất trước, con trỏ = (thời gian, id))
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_notification_log_time_id
+            ON notification_log (notification_time, id)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_schedule_change_log_time_id
+            ON schedule_change_log (change_date, id)
+        ''')
+
         # Migration: xóa cột facebook_id nếu còn tồn tại từ phiên bản cũ
         cursor.execute('PRAGMA table_info(officers_contact)')
         columns = [col[1] for col in cursor.fetchall()]
@@ -87,7 +141,7 @@ class DatabaseManager:
     
     def log_notification(self, date, shift, officer_name, status, message=""):
         """Ghi log thông báo"""
-        conn = sqlite3.connect(self.db_file)
+        conn = self._connect()
         cursor = conn.cursor()
         cursor.execute('''
             INSERT INTO notification_log (date, shift, officer_name, status, message)
@@ -98,7 +152,7 @@ class DatabaseManager:
     
     def log_schedule_change(self, duty_date, shift, old_officer, new_officer, reason="", approved_by=""):
         """Ghi log đổi lịch trực"""
-        conn = sqlite3.connect(self.db_file)
+        conn = self._connect()
         cursor = conn.cursor()
         cursor.execute('''
             INSERT INTO schedule_change_log (duty_date, shift, old_officer, new_officer, reason, approved_by)
@@ -107,9 +161,22 @@ class DatabaseManager:
         conn.commit()
         conn.close()
     
+    def log_schedule_changes(self, changes):
+        """Ghi nhiều dòng log đổi lịch [(duty_date, shift, old_officer, new_officer, reason, approved_by)]
+        trong một giao dịch"""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany('''
+                    INSERT INTO schedule_change_log (duty_date, shift, old_officer, new_officer, reason, approved_by)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', changes)
+        finally:
+            conn.close()
+
     def add_or_update_officer_contact(self, name, telegram_id=None, phone=None, email=None):
         """Thêm hoặc cập nhật thông tin liên hệ cán bộ"""
-        conn = sqlite3.connect(self.db_file)
+        conn = self._connect()
         cursor = conn.cursor()
         cursor.execute('''
             INSERT OR REPLACE INTO officers_contact (name, telegram_id, phone, email)
@@ -118,18 +185,61 @@ class DatabaseManager:
         conn.commit()
         conn.close()
     
+    def register_officer_telegram(self, name, telegram_id):
+        """Gắn Telegram ID cho cán bộ (/register), giữ nguyên SĐT/email đã có.
+        Không ghi đè nếu tên đã gắn với một Telegram ID khác: trả về False, đăng ký được trả về True."""
+        conn = self._connect()
+        try:
+            with conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO officers_contact (name, telegram_id) VALUES (?, ?)
+                    ON CONFLICT(name) DO UPDATE SET telegram_id = excluded.telegram_id
+                    WHERE officers_contact.telegram_id IS NULL OR officers_contact.telegram_id = ''
+                          OR officers_contact.telegram_id = excluded.telegram_id
+                ''', (name, telegram_id))
+                registered = cursor.rowcount > 0
+        finally:
+            conn.close()
+        return registered
+
+    def import_officer_contacts(self, contacts):
+        """Thêm/cập nhật nhiều liên hệ [(name, telegram_id, phone)] trong một giao dịch.
+        Giá trị None giữ nguyên thông tin đã có (VD: file nhập không có cột SĐT)."""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany('''
+                    INSERT INTO officers_contact (name, telegram_id, phone)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(name) DO UPDATE SET
+                        telegram_id = COALESCE(excluded.telegram_id, telegram_id),
+                        phone = COALESCE(excluded.phone, phone)
+                ''', contacts)
+        finally:
+            conn.close()
+
     def get_officer_contact(self, name):
         """Lấy thông tin liên hệ của cán bộ"""
-        conn = sqlite3.connect(self.db_file)
+        conn = self._connect()
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM officers_contact WHERE name = ?', (name,))
         result = cursor.fetchone()
         conn.close()
         return result
     
+    def get_all_officer_contacts(self):
+        """Tất cả liên hệ cán bộ (theo id), dùng để lập danh bạ trong bộ nhớ (contact_directory)"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, name, telegram_id, phone, email FROM officers_contact ORDER BY id')
+        rows = cursor.fetchall()
+        conn.close()
+        return rows
+
     def get_officer_by_telegram_id(self, telegram_id):
         """Lấy thông tin cán bộ qua Telegram ID"""
-        conn = sqlite3.connect(self.db_file)
+        conn = self._connect()
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM officers_contact WHERE telegram_id = ?', (str(telegram_id),))
         result = cursor.fetchone()
@@ -139,7 +249,7 @@ class DatabaseManager:
     def rename_officer_contact(self, old_name, new_name):
         """Đổi tên trong officers_contact (khi admin sửa tên cán bộ bị ghi sai).
         Trả về 'renamed', 'not_found', hoặc 'conflict' (tên mới đã được đăng ký bởi người khác)."""
-        conn = sqlite3.connect(self.db_file)
+        conn = self._connect()
         cursor = conn.cursor()
         cursor.execute('SELECT id FROM officers_contact WHERE name = ?', (old_name,))
         if not cursor.fetchone():
@@ -158,7 +268,7 @@ class DatabaseManager:
 
     def add_available_year(self, year, filename):
         """Đăng ký một năm học có file template tương ứng (không tự đổi is_current)"""
-        conn = sqlite3.connect(self.db_file)
+        conn = self._connect()
         cursor = conn.cursor()
         cursor.execute('''
             INSERT INTO available_years (year, filename, is_current)
@@ -170,7 +280,7 @@ class DatabaseManager:
 
     def set_current_year(self, year):
         """Đặt một năm học làm năm hiện tại (is_current=True), các năm khác về False"""
-        conn = sqlite3.connect(self.db_file)
+        conn = self._connect()
         cursor = conn.cursor()
         cursor.execute('SELECT 1 FROM available_years WHERE year = ?', (year,))
         if not cursor.fetchone():
@@ -183,7 +293,7 @@ class DatabaseManager:
 
     def get_current_year_row(self):
         """Lấy (year, filename) của năm đang được quản lý hiện tại, hoặc None"""
-        conn = sqlite3.connect(self.db_file)
+        conn = self._connect()
         cursor = conn.cursor()
         cursor.execute('SELECT year, filename FROM available_years WHERE is_current = 1 LIMIT 1')
         result = cursor.fetchone()
@@ -192,7 +302,7 @@ class DatabaseManager:
 
     def get_all_years(self):
         """Lấy toàn bộ danh sách năm học đã có template: [(year, filename, is_current), ...]"""
-        conn = sqlite3.connect(self.db_file)
+        conn = self._connect()
         cursor = conn.cursor()
         cursor.execute('SELECT year, filename, is_current FROM available_years ORDER BY year')
         results = cursor.fetchall()
@@ -202,7 +312,7 @@ class DatabaseManager:
 
     def get_notification_history(self, start_date=None, end_date=None):
         """Lấy lịch sử thông báo"""
-        conn = sqlite3.connect(self.db_file)
+        conn = self._connect()
         cursor = conn.cursor()
         
         if start_date and end_date:
@@ -220,7 +330,7 @@ class DatabaseManager:
     
     def get_schedule_change_history(self, start_date=None, end_date=None):
         """Lấy lịch sử đổi lịch"""
-        conn = sqlite3.connect(self.db_file)
+        conn = self._connect()
         cursor = conn.cursor()
         
         if start_date and end_date:
@@ -235,3 +345,242 @@ class DatabaseManager:
         results = cursor.fetchall()
         conn.close()
         return results
+
+    def _iter_rows(self, query, params=(), chunk_size=500):
+        """Đọc kết quả truy vấn theo từng lô chunk_size dòng (fetchmany) thay vì fetchall,
+        giữ bộ nhớ ổn định dù bảng có nhiều năm dữ liệu."""
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
+
+    def iter_notification_history(self, start_time=None, end_time=None, chunk_size=500):
+        """Duyệt toàn bộ nhật ký thông báo (cũ -> mới), lọc theo notification_time nếu có.
+        start_time/end_time dạng 'YYYY-MM-DD HH:MM:SS' theo UTC (cùng định dạng và múi giờ CURRENT_TIMESTAMP)."""
+        query = f"SELECT {', '.join(NOTIFICATION_LOG_COLUMNS)} FROM notification_log"
+        conditions, params = [], []
+        if start_time:
+            conditions.append('notification_time >= ?')
+            params.append(start_time)
+        if end_time:
+            conditions.append('notification_time <= ?')
+            params.append(end_time)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY notification_time, id'
+        return self._iter_rows(query, params, chunk_size)
+
+    def iter_schedule_change_history(self, start_time=None, end_time=None, chunk_size=500):
+        """Duyệt toàn bộ nhật ký đổi lịch (cũ -> mới), lọc theo change_date (UTC) nếu có."""
+        query = f"SELECT {', '.join(SCHEDULE_CHANGE_LOG_COLUMNS)} FROM schedule_change_log"
+        conditions, params = [], []
+        if start_time:
+            conditions.append('change_date >= ?')
+            params.append(start_time)
+        if end_time:
+            conditions.append('change_date <= ?')
+            params.append(end_time)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY change_date, id'
+        return self._iter_rows(query, params, chunk_size)
+
+    def _history_page(self, table, time_column, columns, cursor=None, direction='older', page_size=10):
+        """Phân trang keyset trên (time_column, id), sắp xếp mới nhất trước.
+        - cursor=None: trang mới nhất
+        - direction='older': các dòng cũ hơn con trỏ; direction='newer': các dòng mới hơn con trỏ
+        Mỗi trang là một lần quét khoảng trên chỉ mục (time_column, id), chi phí không phụ thuộc số trang đã lật.
+        Trả về dict: rows (mới -> cũ), older_cursor / newer_cursor (None nếu không còn trang theo hướng đó)."""
+        if direction not in ('older', 'newer'):
+            raise ValueError(f"direction không hợp lệ: {direction}")
+
+        select = f"SELECT {', '.join(columns)} FROM {table}"
+        conn = self._connect()
+        cursor_db = conn.cursor()
+        if cursor is None:
+            cursor_db.execute(
+                f"{select} ORDER BY {time_column} DESC, id DESC LIMIT ?",
+                (page_size + 1,)
+            )
+        elif direction == 'older':
+            cursor_db.execute(
+                f"{select} WHERE ({time_column}, id) < (?, ?) ORDER BY {time_column} DESC, id DESC LIMIT ?",
+                (cursor[0], cursor[1], page_size + 1)
+            )
+        else:
+            cursor_db.execute(
+                f"{select} WHERE ({time_column}, id) > (?, ?) ORDER BY {time_column} ASC, id ASC LIMIT ?",
+                (cursor[0], cursor[1], page_size + 1)
+            )
+        rows = cursor_db.fetchall()
+        conn.close()
+
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if cursor is not None and direction == 'newer':
+            rows.reverse()
+
+        time_idx = columns.index(time_column)
+        newest_key = (rows[0][time_idx], rows[0][0]) if rows else None
+        oldest_key = (rows[-1][time_idx], rows[-1][0]) if rows else None
+
+        if cursor is None:
+            older_cursor, newer_cursor = (oldest_key if has_more else None), None
+        elif direction == 'older':
+            older_cursor, newer_cursor = (oldest_key if has_more else None), newest_key
+        else:
+            older_cursor, newer_cursor = oldest_key, (newest_key if has_more else None)
+
+        return {'rows': rows, 'older_cursor': older_cursor, 'newer_cursor': newer_cursor}
+
+    def get_notification_history_page(self, cursor=None, direction='older', page_size=10):
+        """Một trang nhật ký thông báo (keyset theo notification_time, id). Xem _history_page."""
+        return self._history_page('notification_log', 'notification_time', NOTIFICATION_LOG_COLUMNS,
+                                  cursor, direction, page_size)
+
+    def get_schedule_change_history_page(self, cursor=None, direction='older', page_size=10):
+        """Một trang nhật ký đổi lịch (keyset theo change_date, id). Xem _history_page."""
+        return self._history_page('schedule_change_log', 'change_date', SCHEDULE_CHANGE_LOG_COLUMNS,
+                                  cursor, direction, page_size)
+
+    def save_rotation_state(self, schedule_file, month, officer_index, leader_index, roster_size, roster_hash):
+        """Lưu vị trí vòng tròn ở cuối tháng month ('m-yyyy') của file năm học schedule_file"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO rotation_state
+                (schedule_file, month, officer_index, leader_index, roster_size, roster_hash, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(schedule_file, month) DO UPDATE SET
+                officer_index = excluded.officer_index,
+                leader_index = excluded.leader_index,
+                roster_size = excluded.roster_size,
+                roster_hash = excluded.roster_hash,
+                updated_at = excluded.updated_at
+        ''', (schedule_file, month, officer_index, leader_index, roster_size, roster_hash))
+        conn.commit()
+        conn.close()
+
+    def get_rotation_state(self, schedule_file, month):
+        """Vị trí vòng tròn cuối tháng month dạng dict, hoặc None nếu chưa lưu"""
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM rotation_state WHERE schedule_file = ? AND month = ?', (schedule_file, month))
+        row = cursor.fetchone()
+        conn.close()
+        return dict(row) if row else None
+
+    def get_rotation_states(self, schedule_file):
+        """Tất cả vị trí vòng tròn đã lưu của một file năm học (theo thứ tự tháng)"""
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM rotation_state WHERE schedule_file = ?', (schedule_file,))
+        rows = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        rows.sort(key=lambda r: tuple(reversed([int(x) for x in r['month'].split('-')])))
+        return rows
+
+    def delete_rotation_state(self, schedule_file, month=None):
+        """Xóa vị trí vòng tròn của một tháng (hoặc cả file năm học nếu month=None). Trả về số dòng đã xóa."""
+        conn = self._connect()
+        cursor = conn.cursor()
+        if month is None:
+            cursor.execute('DELETE FROM rotation_state WHERE schedule_file = ?', (schedule_file,))
+        else:
+            cursor.execute('DELETE FROM rotation_state WHERE schedule_file = ? AND month = ?', (schedule_file, month))
+        deleted = cursor.rowcount
+        conn.commit()
+        conn.close()
+        return deleted
+
+    def get_cached_file_id(self, content_hash, filename):
+        """file_id Telegram đã lưu cho file có nội dung (mã băm) và tên file này, hoặc None"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT file_id FROM telegram_file_cache WHERE content_hash = ? AND filename = ?',
+            (content_hash, filename)
+        )
+        row = cursor.fetchone()
+        conn.close()
+        return row[0] if row else None
+
+    def save_cached_file_id(self, content_hash, filename, file_id):
+        """Lưu file_id Telegram trả về sau khi upload file"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO telegram_file_cache (content_hash, filename, file_id, updated_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(content_hash, filename) DO UPDATE SET
+                file_id = excluded.file_id,
+                updated_at = excluded.updated_at
+        ''', (content_hash, filename, file_id))
+        conn.commit()
+        conn.close()
+
+    def delete_cached_file_id(self, content_hash, filename):
+        """Xóa file_id đã lưu (khi Telegram không còn nhận file_id này)"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute(
+            'DELETE FROM telegram_file_cache WHERE content_hash = ? AND filename = ?',
+            (content_hash, filename)
+        )
+        conn.commit()
+        conn.close()
+
+    def save_holidays(self, holidays, source=""):
+        """Lưu nhiều ngày nghỉ [(date, tên)] trong một giao dịch (ngày đã có thì cập nhật tên)"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.executemany('''
+            INSERT INTO holidays (day, name, source, updated_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(day) DO UPDATE SET
+                name = excluded.name,
+                source = excluded.source,
+                updated_at = excluded.updated_at
+        ''', [(day.strftime('%Y-%m-%d'), name, source) for day, name in holidays])
+        conn.commit()
+        conn.close()
+
+    def get_holidays(self, start_date=None, end_date=None):
+        """Các ngày nghỉ trong khoảng [start_date, end_date] (date), sắp theo ngày: [(date, tên)]"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        query = 'SELECT day, name FROM holidays WHERE 1=1'
+        params = []
+        if start_date:
+            query += ' AND day >= ?'
+            params.append(start_date.strftime('%Y-%m-%d'))
+        if end_date:
+            query += ' AND day <= ?'
+            params.append(end_date.strftime('%Y-%m-%d'))
+        cursor.execute(query + ' ORDER BY day', params)
+        rows = cursor.fetchall()
+        conn.close()
+        return [(datetime.strptime(day, '%Y-%m-%d').date(), name or '') for day, name in rows]
+
+    def delete_holidays(self, start_date, end_date=None):
+        """Xóa các ngày nghỉ trong khoảng [start_date, end_date]. Trả về số ngày đã xóa."""
+        end_date = end_date or start_date
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute(
+            'DELETE FROM holidays WHERE day >= ? AND day <= ?',
+            (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
+        )
+        deleted = cursor.rowcount
+        conn.commit()
+        conn.close()
+        return deleted
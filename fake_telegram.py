@@ -0,0 +1,583 @@
+# fake_telegram.py
+# Máy chủ Bot API giả lập chạy cục bộ (không cần token thật, không cần mạng) để chạy thử DutyBot:
+# ghi lại các lời gọi sendMessage/sendDocument..., phát update giả qua getUpdates hoặc webhook,
+# đo độ trễ/thứ tự trả lời và chạy các job (thông báo hàng ngày, xếp lịch tháng) với ngày cố định.
+#   python fake_telegram.py webhook                     -> chạy thử đường webhook
+#   python fake_telegram.py replay --users 20 --duration 30 --rate today=2 --rate change=0.1
+#   python fake_telegram.py jobs --date 24/03/2026      -> chạy 2 job như thể hôm nay là 24/03/2026
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import AsyncExitStack, contextmanager
+from datetime import datetime, timedelta
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+SEND_METHODS = ('sendMessage', 'sendDocument', 'editMessageText')
+MAX_POLL_WAIT = 1.0  # getUpdates chờ tối đa (giây) dù bot xin timeout dài hơn, để dừng nhanh
+ADMIN_USER_ID = 990001  # người dùng giả gửi lệnh ghi (được thêm tạm vào ADMIN_IDS, xem BotSession)
+CHAT_ID_BASE = 5_000_000  # mỗi update giả một chat riêng (CHAT_ID_BASE + số thứ tự) để gắn trả lời với update
+FAKE_BOT_USER = {'id': 999000, 'is_bot': True, 'first_name': 'Trực ban (giả lập)', 'username': 'fake_truc_ban_bot'}
+
+
+def _decode_value(value):
+    """Tham số dạng form: đối tượng/mảng được Bot API gửi dưới dạng chuỗi JSON"""
+    if isinstance(value, str) and value[:1] in ('{', '['):
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+    return value
+
+
+def _parse_params(content_type, body):
+    """Tham số của một lời gọi Bot API: JSON, form urlencoded hoặc multipart (có file đính kèm)"""
+    content_type = content_type or ''
+    if not body:
+        return {}
+    if content_type.startswith('application/json'):
+        return json.loads(body)
+    if content_type.startswith('multipart/form-data'):
+        message = BytesParser(policy=HTTP).parsebytes(b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+        params = {}
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            payload = part.get_payload(decode=True) or b''
+            if part.get_filename():
+                params[name] = {'filename': part.get_filename(), 'size': len(payload)}
+            else:
+                params[name] = _decode_value(payload.decode('utf-8'))
+        return params
+    return {k: _decode_value(v[-1]) for k, v in parse_qs(body.decode('utf-8')).items()}
+
+
+class FakeTelegramServer:
+    """Bot API giả lập trên 127.0.0.1 (cổng ngẫu nhiên), chạy trong thread riêng.
+    - base_url: truyền cho bot.build_application(..., base_url=...) thay cho api.telegram.org
+    - calls: mọi lời gọi [(thời điểm, tên hàm, tham số)]; sent(): các tin bot đã gửi
+    - make_update(): tạo update tin nhắn giả; push_update() đưa vào hàng chờ getUpdates (bot chạy polling),
+      record_delivery() ghi nhận update đẩy qua webhook; report(): độ trễ và thứ tự trả lời
+    - api_delay: thời gian (giây) mỗi lời gọi gửi tin mất thêm, mô phỏng độ trễ mạng tới Telegram
+    """
+
+    def __init__(self, token='123456:FAKE', api_delay=0.0):
+        self.token = token
+        self.api_delay = api_delay
+        self.calls = []
+        self.webhook = None
+        self.delivered = {}  # update_id -> (thời điểm đưa vào, update)
+        self._pending_updates = []
+        self._cond = threading.Condition()
+        self._message_ids = itertools.count(1)
+        self._update_ids = itertools.count(1)
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._httpd.server_address[1]
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='fake-telegram', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    # --- Bot API ---
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _handle(self):
+                parts = urlparse(self.path).path.strip('/').split('/')
+                if len(parts) != 2 or parts[0] != f"bot{server.token}":
+                    return self._reply(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+                length = int(self.headers.get('Content-Length') or 0)
+                params = _parse_params(self.headers.get('Content-Type'), self.rfile.read(length))
+                self._reply(200, {'ok': True, 'result': server.handle_call(parts[1], params)})
+
+            def _reply(self, status, payload):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # bot đã ngắt kết nối (VD: getUpdates đang chờ lúc dừng bot)
+
+            do_GET = do_POST = _handle
+
+            def log_message(self, format, *args):
+                pass  # không in mỗi request ra console
+
+        return Handler
+
+    def handle_call(self, method, params):
+        """Kết quả của một lời gọi Bot API (giống định dạng Telegram ở mức bot cần dùng)"""
+        if method == 'getUpdates':
+            return self._get_updates(int(params.get('offset') or 0), float(params.get('timeout') or 0))
+        if self.api_delay and method in SEND_METHODS:
+            time.sleep(self.api_delay)  # mỗi request một thread: các lời gọi đồng thời chờ song song
+        with self._cond:
+            self.calls.append((time.monotonic(), method, params))
+            self._cond.notify_all()
+
+        if method == 'getMe':
+            return FAKE_BOT_USER
+        if method == 'setWebhook':
+            self.webhook = params.get('url')
+            return True
+        if method == 'deleteWebhook':
+            self.webhook = None
+            return True
+        if method in SEND_METHODS:
+            return self._message(params, method)
+        return True
+
+    def _get_updates(self, offset, timeout):
+        """getUpdates: bỏ các update đã xác nhận (update_id < offset), chờ (long polling) nếu chưa có update mới"""
+        deadline = time.monotonic() + min(timeout, MAX_POLL_WAIT)
+        with self._cond:
+            while True:
+                self._pending_updates = [u for u in self._pending_updates if u['update_id'] >= offset]
+                remaining = deadline - time.monotonic()
+                if self._pending_updates or remaining <= 0:
+                    return self._pending_updates[:100]
+                self._cond.wait(remaining)
+
+    def _message(self, params, method):
+        chat_id = params.get('chat_id')
+        chat_id = int(chat_id) if str(chat_id).lstrip('-').isdigit() else chat_id
+        message = {
+            'message_id': int(params.get('message_id') or next(self._message_ids)),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': FAKE_BOT_USER,
+        }
+        if method == 'sendDocument':
+            document = params.get('document')
+            file_id = document if isinstance(document, str) else f"fake-file-{message['message_id']}"
+            name = document.get('filename') if isinstance(document, dict) else 'document'
+            message['document'] = {'file_id': file_id, 'file_unique_id': file_id, 'file_name': name}
+            if params.get('caption'):
+                message['caption'] = params['caption']
+        else:
+            message['text'] = params.get('text', '')
+        return message
+
+    # --- Dữ liệu ghi lại / update giả ---
+
+    def sent(self, chat_id=None, method=None):
+        """Các tin bot đã gửi [(thời điểm, tên hàm, tham số)], lọc theo chat_id/tên hàm nếu có"""
+        with self._cond:
+            calls = list(self.calls)
+        return [c for c in calls
+                if c[1] in SEND_METHODS
+                and (method is None or c[1] == method)
+                and (chat_id is None or str(c[2].get('chat_id')) == str(chat_id))]
+
+    def wait_for_sent(self, count, chat_id=None, timeout=10.0):
+        """Chờ (trong thread) tới khi bot gửi đủ count tin (cho chat_id nếu có). Trả về danh sách tin."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while len(self.sent(chat_id)) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+        return self.sent(chat_id)
+
+    def wait_for_chats(self, chat_ids, timeout=30.0):
+        """Chờ tới khi mọi chat trong chat_ids đều đã nhận ít nhất một tin. Trả về các chat còn chưa nhận."""
+        pending = {str(c) for c in chat_ids}
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                pending -= {str(c[2].get('chat_id')) for c in self.sent()}
+                remaining = deadline - time.monotonic()
+                if not pending or remaining <= 0:
+                    return pending
+                self._cond.wait(remaining)
+
+    def record_delivery(self, update):
+        """Ghi nhận thời điểm update được đưa tới bot (dùng cho report)"""
+        with self._cond:
+            self.delivered[update['update_id']] = (time.monotonic(), update)
+
+    def push_update(self, update):
+        """Đưa update vào hàng chờ getUpdates (bot chạy polling sẽ nhận ở lần hỏi tiếp theo)"""
+        with self._cond:
+            self.delivered[update['update_id']] = (time.monotonic(), update)
+            self._pending_updates.append(update)
+            self._cond.notify_all()
+
+    def report(self):
+        """Độ trễ (từ lúc đưa update tới tin trả lời đầu tiên trong chat của update) theo lệnh và thứ tự trả lời.
+        Trả về {'commands': {lệnh: {'count', 'p50', 'p95', 'max'}}, 'answered', 'unanswered',
+        'out_of_order': số lần một người dùng nhận trả lời cho lệnh gửi sau trước lệnh gửi trước}"""
+        first_reply = {}
+        for sent_at, _, params in self.sent():
+            first_reply.setdefault(str(params.get('chat_id')), sent_at)
+        with self._cond:
+            delivered = sorted(self.delivered.items())
+
+        latencies, replies_by_user, unanswered = {}, {}, 0
+        for _, (delivered_at, update) in delivered:
+            message = update['message']
+            replied_at = first_reply.get(str(message['chat']['id']))
+            if replied_at is None:
+                unanswered += 1
+                continue
+            latencies.setdefault(message['text'].split()[0], []).append(replied_at - delivered_at)
+            replies_by_user.setdefault(message['from']['id'], []).append(replied_at)
+
+        def percentile(values, q):
+            return values[min(len(values) - 1, int(q * len(values)))]
+
+        commands = {}
+        for command, values in sorted(latencies.items()):
+            values.sort()
+            commands[command] = {'count': len(values), 'p50': percentile(values, 0.5),
+                                 'p95': percentile(values, 0.95), 'max': values[-1]}
+        out_of_order = sum(1 for replies in replies_by_user.values()
+                           for earlier, later in zip(replies, replies[1:]) if later < earlier)
+        return {'commands': commands, 'answered': len(delivered) - unanswered, 'unanswered': unanswered,
+                'out_of_order': out_of_order}
+
+    def make_update(self, text, user_id, chat_id=None, full_name='Cán bộ thử'):
+        """Update tin nhắn văn bản giả (VD: '/today') từ người dùng user_id"""
+        chat_id = chat_id or user_id
+        entities = []
+        if text.startswith('/'):
+            entities.append({'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])})
+        return {
+            'update_id': next(self._update_ids),
+            'message': {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': {'id': user_id, 'is_bot': False, 'first_name': full_name},
+                'text': text,
+                'entities': entities,
+            },
+        }
+
+
+@contextmanager
+def sandbox_workspace():
+    """Chạy bot trên bản sao thư mục lịch trực và database trong thư mục tạm (không đụng dữ liệu thật):
+    tạm đổi config.SCHEDULE_FOLDER / DATABASE_FILE, khôi phục và xóa thư mục tạm khi xong"""
+    import config
+
+    saved = (config.SCHEDULE_FOLDER, config.DATABASE_FILE)
+    workdir = tempfile.mkdtemp(prefix='qltb-fake-')
+    try:
+        folder = os.path.join(workdir, 'lich-truc-ban')
+        if os.path.isdir(config.SCHEDULE_FOLDER):
+            shutil.copytree(config.SCHEDULE_FOLDER, folder, ignore=shutil.ignore_patterns('.backup', '*.lock'))
+        else:
+            os.makedirs(folder)
+        database = os.path.join(workdir, os.path.basename(config.DATABASE_FILE))
+        if os.path.exists(config.DATABASE_FILE):
+            shutil.copy2(config.DATABASE_FILE, database)
+        config.SCHEDULE_FOLDER, config.DATABASE_FILE = folder, database
+        yield workdir
+    finally:
+        config.SCHEDULE_FOLDER, config.DATABASE_FILE = saved
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+async def post_webhook(url, update, secret_token=None, client=None):
+    """Đẩy một update vào máy chủ webhook của bot như Telegram làm. Trả về mã HTTP."""
+    import httpx
+
+    headers = {'X-Telegram-Bot-Api-Secret-Token': secret_token} if secret_token else {}
+    if client is not None:
+        return (await client.post(url, json=update, headers=headers)).status_code
+    async with httpx.AsyncClient() as client:
+        response = await client.post(url, json=update, headers=headers)
+    return response.status_code
+
+
+class BotSession:
+    """DutyBot chạy với Bot API giả lập trên bản sao dữ liệu (sandbox_workspace), nhận update qua
+    getUpdates (mode='polling') hoặc webhook có secret token (mode='webhook'). ADMIN_USER_ID được thêm tạm
+    vào ADMIN_IDS để gửi lệnh ghi. Dùng: async with BotSession() as session: await session.deliver(...)"""
+
+    def __init__(self, mode='polling', api_delay=0.0, concurrent_updates=None, port=8765,
+                 secret_token='fake-secret-token'):
+        if mode not in ('polling', 'webhook'):
+            raise ValueError(f"Chế độ không hợp lệ: {mode}")
+        self.mode = mode
+        self.api_delay = api_delay
+        self.concurrent_updates = concurrent_updates
+        self.secret_token = secret_token
+        self.webhook_url = f"http://127.0.0.1:{port}/telegram"
+        self.port = port
+        self.server = self.bot_logic = self.app = None
+        self._chat_ids = itertools.count(CHAT_ID_BASE)
+        self._http = None
+        self._stack = AsyncExitStack()
+
+    async def __aenter__(self):
+        try:
+            await self._start()
+        except BaseException:
+            await self._stack.aclose()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._stack.aclose()
+
+    async def _start(self):
+        import config
+        import bot
+
+        stack = self._stack
+        stack.enter_context(sandbox_workspace())
+        admins = getattr(config, 'ADMIN_IDS', [])
+        config.ADMIN_IDS = list(admins) + [str(ADMIN_USER_ID)]
+        stack.callback(setattr, config, 'ADMIN_IDS', admins)
+
+        self.server = stack.enter_context(FakeTelegramServer(config.TELEGRAM_BOT_TOKEN, api_delay=self.api_delay))
+        self.bot_logic = bot.DutyBot()
+        stack.push_async_callback(self.bot_logic.db.close)
+        self.app = bot.build_application(self.bot_logic, base_url=self.server.base_url,
+                                         concurrent_updates=self.concurrent_updates)
+        await stack.enter_async_context(self.app)
+        await self.app.start()
+        stack.push_async_callback(self.app.stop)
+
+        if self.mode == 'webhook':
+            import httpx
+
+            await self.app.updater.start_webhook(listen='127.0.0.1', port=self.port, url_path='telegram',
+                                                 webhook_url=self.webhook_url, secret_token=self.secret_token)
+            self._http = await stack.enter_async_context(httpx.AsyncClient())
+        else:
+            await self.app.updater.start_polling(poll_interval=0.0, timeout=int(MAX_POLL_WAIT))
+        stack.push_async_callback(self.app.updater.stop)
+
+    def make_update(self, text, user_id):
+        """Update giả của user_id trong một chat riêng (để report() gắn được tin trả lời với update)"""
+        return self.server.make_update(text, user_id, chat_id=next(self._chat_ids))
+
+    async def deliver(self, update):
+        """Đưa update tới bot theo chế độ của phiên (hàng chờ getUpdates hoặc POST webhook)"""
+        if self.mode == 'webhook':
+            self.server.record_delivery(update)
+            status = await post_webhook(self.webhook_url, update, self.secret_token, self._http)
+            if status != 200:
+                raise RuntimeError(f"Webhook trả về HTTP {status}")
+        else:
+            self.server.push_update(update)
+
+    async def register_officers(self, chat_id_base=7_000_000):
+        """Gán Telegram ID giả cho các cán bộ trong DS trực chưa có liên hệ (trong DB bản sao),
+        để thấy được tin thông báo khi chạy job. Trả về số cán bộ đã gán."""
+        contacts = await self.bot_logic.refresh_contacts()
+        added = 0
+        for i, name in enumerate(self.bot_logic.schedule_mgr.get_roster().names()):
+            if not contacts.chat_id_for(name):
+                await self.bot_logic.db.add_or_update_officer_contact(name, telegram_id=str(chat_id_base + i))
+                added += 1
+        await self.bot_logic.refresh_contacts()
+        return added
+
+
+# --- Lưu lượng giả ---
+
+DEFAULT_RATES = {'today': 2.0, 'search': 1.0, 'change': 0.1}  # lệnh / người dùng / phút
+COMMAND_KINDS = ('today', 'tomorrow', 'check', 'search', 'change')
+
+
+def schedule_sample(schedule_mgr):
+    """(các ngày có người trực, DS trực) của năm học hiện tại, dùng để sinh tham số cho lệnh giả"""
+    index = schedule_mgr.get_year_index()
+    days = sorted(d for d, info in index.days.items() if info['morning'] or info['afternoon']) if index else []
+    names = schedule_mgr.get_officer_list()
+    if not days or not names:
+        raise SystemExit("❌ File năm học hiện tại chưa có lịch trực/DS trực để chạy thử.")
+    return days, names
+
+
+def command_text(kind, rng, days, names):
+    """Nội dung một lệnh giả loại kind ('today', 'tomorrow', 'check', 'search', 'change')"""
+    day = rng.choice(days)
+    if kind == 'today':
+        return '/today'
+    if kind == 'tomorrow':
+        return '/tomorrow'
+    if kind == 'check':
+        return f"/check {day.strftime('%d/%m/%Y')}"
+    if kind == 'search':
+        return f"/search {rng.choice(names)} {day.month}/{day.year}"
+    if kind == 'change':
+        shift = rng.choice(['sáng', 'chiều'])
+        return f'/change {day.strftime("%d/%m/%Y")} {shift} "{rng.choice(names)}" "Chạy thử tải"'
+    raise ValueError(f"Loại lệnh giả không hỗ trợ: {kind}")
+
+
+def plan_traffic(schedule_mgr, users, duration, rates=None, seed=2025):
+    """Lịch phát lệnh giả [(giây kể từ lúc bắt đầu, user_id, lệnh)] trong duration giây: mỗi người dùng gửi
+    mỗi loại lệnh theo phân phối Poisson với tần suất rates {loại: lệnh/phút}. Lệnh 'change' (cần quyền Admin)
+    do ADMIN_USER_ID gửi thay. Cùng seed và cùng dữ liệu -> cùng lịch phát."""
+    rng = random.Random(seed)
+    days, names = schedule_sample(schedule_mgr)
+    plan = []
+    for user in range(users):
+        for kind, per_minute in (rates or DEFAULT_RATES).items():
+            if per_minute <= 0:
+                continue
+            user_id = ADMIN_USER_ID if kind == 'change' else 1000 + user
+            at = rng.expovariate(per_minute / 60)
+            while at < duration:
+                plan.append((at, user_id, command_text(kind, rng, days, names)))
+                at += rng.expovariate(per_minute / 60)
+    plan.sort(key=lambda item: item[0])
+    return plan
+
+
+async def replay(session, plan, timeout=60.0):
+    """Phát các lệnh theo lịch plan (theo thời gian thực), chờ bot trả lời hết (tối đa timeout giây
+    sau lệnh cuối) rồi trả về session.server.report()"""
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    chat_ids = []
+    for at, user_id, text in plan:
+        delay = started + at - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        update = session.make_update(text, user_id)
+        chat_ids.append(update['message']['chat']['id'])
+        await session.deliver(update)
+    await asyncio.to_thread(session.server.wait_for_chats, chat_ids, timeout)
+    return session.server.report()
+
+
+async def drive_jobs(session, today):
+    """Chạy job thông báo hàng ngày và job xếp lịch tháng như thể hôm nay là today (không phụ thuộc đồng hồ máy).
+    Trả về {'daily': [tin đã gửi], 'monthly': [tin đã gửi]}."""
+    server, bot_logic, bot = session.server, session.bot_logic, session.app.bot
+    before = len(server.sent())
+    await bot_logic.send_daily_notifications(bot, today + timedelta(days=1))
+    middle = len(server.sent())
+    await bot_logic.run_monthly_auto_schedule(bot, today)
+    sent = server.sent()
+    return {'daily': sent[before:middle], 'monthly': sent[middle:]}
+
+
+async def run_webhook_check(commands=('/start', '/today', '/tomorrow', '/help')):
+    """Chạy DutyBot ở chế độ webhook với Bot API giả lập: gửi các lệnh qua webhook (kèm secret token),
+    kiểm tra bot trả lời và update sai secret token bị từ chối. Trả về (số lệnh được trả lời, mã HTTP khi sai secret)."""
+    async with BotSession(mode='webhook') as session:
+        updates = [session.make_update(text, user_id=1000 + i) for i, text in enumerate(commands)]
+        for update in updates:
+            await session.deliver(update)
+        rejected = await post_webhook(session.webhook_url, session.make_update('/today', user_id=1), 'sai')
+        pending = await asyncio.to_thread(session.server.wait_for_chats,
+                                          [u['message']['chat']['id'] for u in updates], 10.0)
+        assert session.server.webhook == session.webhook_url, session.server.webhook
+    return len(updates) - len(pending), rejected
+
+
+# --- Dòng lệnh ---
+
+def _parse_rate(text):
+    kind, _, value = text.partition('=')
+    if kind not in COMMAND_KINDS:
+        raise argparse.ArgumentTypeError(f"loại lệnh phải là một trong {', '.join(COMMAND_KINDS)}")
+    return kind, float(value)
+
+
+def _print_sent(title, sent):
+    print(f"{title}: {len(sent)} tin")
+    for _, method, params in sent:
+        text = params.get('text') or params.get('caption') or ''
+        print(f"  -> {params.get('chat_id')} [{method}] {text.splitlines()[0] if text else ''}")
+
+
+async def _main(args):
+    if args.command == 'replay':
+        async with BotSession(mode=args.mode, api_delay=args.api_delay, concurrent_updates=args.concurrency) as session:
+            plan = plan_traffic(session.bot_logic.schedule_mgr, args.users, args.duration,
+                                dict(args.rate) if args.rate else None, args.seed)
+            print(f"▶️ Phát {len(plan)} lệnh trong {args.duration:.0f}s ({args.users} người dùng, {args.mode})...")
+            report = await replay(session, plan, args.timeout)
+        print(f"{'Lệnh':<10} {'Số lệnh':>8} {'p50 (ms)':>10} {'p95 (ms)':>10} {'max (ms)':>10}")
+        for command, stats in report['commands'].items():
+            print(f"{command:<10} {stats['count']:>8} {stats['p50'] * 1000:>10.0f} "
+                  f"{stats['p95'] * 1000:>10.0f} {stats['max'] * 1000:>10.0f}")
+        print(f"Đã trả lời {report['answered']}, chưa trả lời {report['unanswered']}, "
+              f"trả lời sai thứ tự (theo người dùng): {report['out_of_order']}")
+    elif args.command == 'jobs':
+        today = datetime.strptime(args.date, '%d/%m/%Y') if args.date else datetime.now()
+        async with BotSession() as session:
+            added = await session.register_officers()
+            print(f"📅 Chạy job như thể hôm nay là {today.strftime('%d/%m/%Y')} "
+                  f"(gán Telegram ID giả cho {added} cán bộ)")
+            sent = await drive_jobs(session, today)
+        _print_sent("Thông báo hàng ngày", sent['daily'])
+        _print_sent("Xếp lịch tự động hàng tháng", sent['monthly'])
+    else:
+        replied, rejected = await run_webhook_check()
+        print(f"✅ Webhook: bot đã trả lời {replied} lệnh; update sai secret token -> HTTP {rejected}")
+
+
+def main():
+    import logging
+
+    parser = argparse.ArgumentParser(description="Chạy thử DutyBot với Bot API giả lập (không cần mạng/token thật)")
+    sub = parser.add_subparsers(dest='command')
+    sub.add_parser('webhook', help="kiểm tra đường webhook (mặc định)")
+    replay_parser = sub.add_parser('replay', help="phát lưu lượng giả, đo độ trễ và thứ tự trả lời")
+    replay_parser.add_argument('--users', type=int, default=10)
+    replay_parser.add_argument('--duration', type=float, default=20.0, help="thời gian phát (giây)")
+    replay_parser.add_argument('--rate', type=_parse_rate, action='append',
+                               help="loại=lệnh/người/phút, VD: --rate today=2 --rate change=0.1")
+    replay_parser.add_argument('--mode', choices=('polling', 'webhook'), default='polling')
+    replay_parser.add_argument('--api-delay', type=float, default=0.05)
+    replay_parser.add_argument('--concurrency', type=int, default=None, help="mặc định CONCURRENT_UPDATES")
+    replay_parser.add_argument('--seed', type=int, default=2025)
+    replay_parser.add_argument('--timeout', type=float, default=60.0)
+    jobs_parser = sub.add_parser('jobs', help="chạy job thông báo hàng ngày và xếp lịch tháng với ngày cố định")
+    jobs_parser.add_argument('--date', help="ngày coi là hôm nay (dd/mm/yyyy), mặc định hôm nay")
+    args = parser.parse_args()
+
+    from logging_setup import configure_logging
+    configure_logging()
+    logging.disable(logging.INFO)  # chỉ giữ cảnh báo/lỗi
+    asyncio.run(_main(args))
+
+
+if __name__ == '__main__':
+    main()
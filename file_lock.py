@@ -0,0 +1,226 @@
+# file_lock.py
+# Khóa đọc/ghi cho file Excel năm học: nhiều người đọc cùng lúc, người ghi độc quyền và xếp hàng,
+# áp dụng cả giữa các tiến trình (khóa tư vấn trên file .lock cạnh file Excel) và giữa các thread trong bot
+
+import os
+import threading
+import time as time_module
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+DEFAULT_LOCK_TIMEOUT = 30.0   # giây chờ tối đa để lấy khóa ghi
+POLL_INTERVAL = 0.05          # giây giữa các lần thử lại khóa liên tiến trình
+
+
+class LockTimeout(TimeoutError):
+    """Hết thời gian chờ khóa (file đang được thao tác khác ghi quá lâu)"""
+
+
+class _InterProcessLock:
+    """Khóa tư vấn trên file <file>.lock: fcntl.flock (chia sẻ/độc quyền) trên POSIX;
+    Windows (msvcrt) chỉ có khóa độc quyền nên chỉ dùng cho người ghi."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def acquire(self, exclusive, deadline):
+        if fcntl is None and not exclusive:
+            return  # Windows: người đọc dựa vào việc lưu file nguyên tử (atomic_save), không cần khóa
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        while True:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(self._fd, (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | fcntl.LOCK_NB)
+                else:
+                    msvcrt.locking(self._fd, msvcrt.LK_NBLCK, 1)
+                return
+            except OSError:
+                if time_module.monotonic() >= deadline:
+                    os.close(self._fd)
+                    self._fd = None
+                    raise LockTimeout(f"Hết thời gian chờ khóa file {os.path.basename(self.path)}")
+                time_module.sleep(POLL_INTERVAL)
+
+    def release(self):
+        if self._fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+
+class WorkbookLock:
+    """Khóa đọc/ghi cho một file.
+    - read(): nhiều người đọc đồng thời; nhường người ghi đang xếp hàng (tránh người ghi chờ mãi)
+    - write(): độc quyền; gọi lồng nhau trong cùng thread được phép (VD: hàm ghi gọi hàm ghi khác),
+      đọc trong lúc chính thread đó đang ghi cũng được phép
+    - metrics(): số lần lấy khóa, số người đang chờ, thời gian chờ tổng/lớn nhất, số lần hết thời gian chờ
+    """
+
+    def __init__(self, filepath, timeout=DEFAULT_LOCK_TIMEOUT):
+        self.filepath = filepath
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = None          # thread đang giữ khóa ghi
+        self._write_depth = 0
+        self._waiting_writers = 0
+        self._process_pending = False  # người đọc đầu tiên đang lấy khóa liên tiến trình
+        self._process_lock = _InterProcessLock(f"{filepath}.lock")
+        self._metrics = {
+            'read_acquired': 0,
+            'write_acquired': 0,
+            'read_timeouts': 0,
+            'write_timeouts': 0,
+            'write_wait_total': 0.0,
+            'write_wait_max': 0.0,
+            'max_queue': 0,
+        }
+
+    def metrics(self):
+        with self._cond:
+            data = dict(self._metrics)
+            data['readers'] = self._readers
+            data['writer_active'] = self._writer is not None
+            data['queued_writers'] = self._waiting_writers
+            return data
+
+    def _deadline(self, timeout):
+        return time_module.monotonic() + (self.timeout if timeout is None else timeout)
+
+    @contextmanager
+    def read(self, timeout=None):
+        me = threading.get_ident()
+        deadline = self._deadline(timeout)
+        first = False
+        with self._cond:
+            if self._writer == me:
+                # Thread đang ghi đọc lại file của chính nó
+                nested = True
+            else:
+                nested = False
+                # Chờ cả lúc người đọc đầu tiên còn đang lấy khóa liên tiến trình cho nhóm
+                while self._writer is not None or self._waiting_writers or self._process_pending:
+                    remaining = deadline - time_module.monotonic()
+                    if remaining <= 0:
+                        self._metrics['read_timeouts'] += 1
+                        raise LockTimeout(f"Hết thời gian chờ đọc file {os.path.basename(self.filepath)}")
+                    self._cond.wait(remaining)
+                self._readers += 1
+                first = self._readers == 1
+                if first:
+                    self._process_pending = True
+                else:
+                    self._metrics['read_acquired'] += 1
+
+        if first:
+            # Người đọc đầu tiên giữ khóa chia sẻ liên tiến trình thay cho cả nhóm;
+            # lấy khóa (có thể phải chờ) ngoài _cond để không chặn metrics()/người đọc khác vào hàng
+            try:
+                self._process_lock.acquire(False, deadline)
+            except LockTimeout:
+                with self._cond:
+                    self._readers -= 1
+                    self._process_pending = False
+                    self._metrics['read_timeouts'] += 1
+                    self._cond.notify_all()
+                raise
+            with self._cond:
+                self._process_pending = False
+                self._metrics['read_acquired'] += 1
+                self._cond.notify_all()
+        try:
+            yield
+        finally:
+            if not nested:
+                with self._cond:
+                    self._readers -= 1
+                    if self._readers == 0:
+                        self._process_lock.release()
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self, timeout=None):
+        me = threading.get_ident()
+        deadline = self._deadline(timeout)
+        started = time_module.monotonic()
+        with self._cond:
+            if self._writer == me:
+                self._write_depth += 1
+                nested = True
+            else:
+                nested = False
+                self._waiting_writers += 1
+                self._metrics['max_queue'] = max(self._metrics['max_queue'], self._waiting_writers)
+                try:
+                    while self._writer is not None or self._readers:
+                        remaining = deadline - time_module.monotonic()
+                        if remaining <= 0:
+                            self._metrics['write_timeouts'] += 1
+                            raise LockTimeout(f"Hết thời gian chờ ghi file {os.path.basename(self.filepath)}")
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting_writers -= 1
+                    self._cond.notify_all()
+                self._writer = me
+                self._write_depth = 1
+
+        if not nested:
+            try:
+                self._process_lock.acquire(True, deadline)
+            except LockTimeout:
+                with self._cond:
+                    self._writer = None
+                    self._write_depth = 0
+                    self._metrics['write_timeouts'] += 1
+                    self._cond.notify_all()
+                raise
+            waited = time_module.monotonic() - started
+            with self._cond:
+                self._metrics['write_acquired'] += 1
+                self._metrics['write_wait_total'] += waited
+                self._metrics['write_wait_max'] = max(self._metrics['write_wait_max'], waited)
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._write_depth -= 1
+                if self._write_depth == 0:
+                    self._process_lock.release()
+                    self._writer = None
+                    self._cond.notify_all()
+
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def get_workbook_lock(filepath, timeout=DEFAULT_LOCK_TIMEOUT):
+    """Khóa dùng chung (trong tiến trình) cho một file, theo đường dẫn tuyệt đối"""
+    key = os.path.abspath(filepath)
+    with _locks_guard:
+        lock = _locks.get(key)
+        if lock is None:
+            lock = _locks[key] = WorkbookLock(key, timeout)
+        return lock
+
+
+def all_lock_metrics():
+    """{tên file: metrics} của mọi file đã từng khóa trong tiến trình"""
+    with _locks_guard:
+        locks = list(_locks.values())
+    return {os.path.basename(lock.filepath): lock.metrics() for lock in locks}
@@ -0,0 +1,78 @@
+# history_export.py
+# Xuất nhật ký thông báo / đổi lịch ra file CSV hoặc Excel theo kiểu streaming (ghi dần từng dòng)
+
+import csv
+import os
+import tempfile
+from datetime import datetime
+
+from database import NOTIFICATION_LOG_COLUMNS, SCHEDULE_CHANGE_LOG_COLUMNS
+
+
+# kind -> (tên hàm duyệt trong DatabaseManager, tiêu đề cột, tên file)
+HISTORY_KINDS = {
+    'noti': ('iter_notification_history', NOTIFICATION_LOG_COLUMNS, 'NhatKy_ThongBao'),
+    'change': ('iter_schedule_change_history', SCHEDULE_CHANGE_LOG_COLUMNS, 'NhatKy_DoiLich'),
+}
+EXPORT_FORMATS = ('csv', 'xlsx')
+
+
+def _write_csv(path, columns, rows):
+    count = 0
+    # utf-8-sig để Excel trên Windows mở đúng tiếng Việt
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def _write_xlsx(path, columns, rows):
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    # write_only: openpyxl ghi thẳng từng dòng ra file tạm, không giữ cả bảng trong bộ nhớ
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Nhật ký')
+    header = []
+    for col in columns:
+        cell = WriteOnlyCell(ws, value=col)
+        cell.font = Font(bold=True)
+        header.append(cell)
+    ws.append(header)
+
+    count = 0
+    for row in rows:
+        ws.append(list(row))
+        count += 1
+    wb.save(path)
+    return count
+
+
+def export_history(db, kind, fmt='csv', start_time=None, end_time=None, chunk_size=500):
+    """Ghi nhật ký ra file tạm, đọc SQLite theo lô chunk_size dòng.
+    Trả về (đường dẫn file, tên file gợi ý, số dòng). Người gọi chịu trách nhiệm xóa file sau khi gửi."""
+    if kind not in HISTORY_KINDS:
+        raise ValueError(f"Loại nhật ký không hợp lệ: {kind} (chỉ dùng: {', '.join(HISTORY_KINDS)})")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Định dạng không hợp lệ: {fmt} (chỉ dùng: {', '.join(EXPORT_FORMATS)})")
+
+    iter_name, columns, base_name = HISTORY_KINDS[kind]
+    rows = getattr(db, iter_name)(start_time, end_time, chunk_size=chunk_size)
+
+    fd, path = tempfile.mkstemp(suffix=f'.{fmt}', prefix=f'{base_name}_')
+    os.close(fd)
+    try:
+        if fmt == 'csv':
+            count = _write_csv(path, columns, rows)
+        else:
+            count = _write_xlsx(path, columns, rows)
+    except Exception:
+        os.remove(path)
+        raise
+
+    filename = f"{base_name}_{datetime.now().strftime('%Y%m%d_%H%M')}.{fmt}"
+    return path, filename, count
@@ -0,0 +1,155 @@
+# holiday_calendar.py
+# Lịch ngày nghỉ (lễ, Tết, nghỉ bù...): đọc file ICS/CSV và lập bảng ngày làm việc theo năm học (tra cứu O(1))
+
+import csv
+import io
+from datetime import date as date_type, datetime, timedelta
+
+
+# Năm học bắt đầu từ tháng 8 (giống các sheet tháng do /start_new_year tạo: 8/năm -> 6/năm+1)
+SCHOOL_YEAR_START_MONTH = 8
+HOLIDAY_DATE_FORMATS = ('%d/%m/%Y', '%Y-%m-%d', '%Y/%m/%d', '%d-%m-%Y')
+
+
+def school_year_of(day):
+    """Năm bắt đầu của năm học chứa ngày day (VD: 15/01/2026 -> 2025)"""
+    return day.year if day.month >= SCHOOL_YEAR_START_MONTH else day.year - 1
+
+
+def school_year_bounds(school_year):
+    """Ngày đầu và ngày cuối của năm học (1/8/năm -> 31/7/năm+1)"""
+    start = date_type(school_year, SCHOOL_YEAR_START_MONTH, 1)
+    return start, date_type(school_year + 1, SCHOOL_YEAR_START_MONTH, 1) - timedelta(days=1)
+
+
+def _parse_date(text):
+    text = (text or '').strip()
+    for fmt in HOLIDAY_DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Ngày không hợp lệ: '{text}'")
+
+
+def _expand(start, end, name):
+    """Các ngày từ start đến end (tính cả hai đầu)"""
+    if end < start:
+        raise ValueError(f"Ngày kết thúc trước ngày bắt đầu: {start} > {end}")
+    return [(start + timedelta(days=i), name) for i in range((end - start).days + 1)]
+
+
+def parse_holiday_csv(text):
+    """CSV: ngày[,đến ngày][,tên] — có hoặc không có dòng tiêu đề.
+    VD: '01/01/2026,,Tết Dương lịch' hoặc '16/02/2026,22/02/2026,Tết Nguyên đán'. Trả về [(date, tên)]."""
+    holidays = []
+    for line_no, row in enumerate(csv.reader(io.StringIO(text)), start=1):
+        row = [c.strip() for c in row]
+        if not row or not row[0] or row[0].startswith('#'):
+            continue
+        try:
+            start = _parse_date(row[0])
+        except ValueError:
+            if line_no == 1:
+                continue  # dòng tiêu đề
+            raise ValueError(f"Dòng {line_no}: ngày không hợp lệ '{row[0]}'")
+        end = _parse_date(row[1]) if len(row) > 1 and row[1] else start
+        name = row[2] if len(row) > 2 else ''
+        holidays.extend(_expand(start, end, name))
+    return holidays
+
+
+def _unfold_ics(text):
+    """Ghép các dòng bị gập (dòng tiếp theo bắt đầu bằng khoảng trắng) theo RFC 5545"""
+    lines = []
+    for raw in text.splitlines():
+        if raw[:1] in (' ', '\t') and lines:
+            lines[-1] += raw[1:]
+        else:
+            lines.append(raw)
+    return lines
+
+
+def _parse_ics_date(value):
+    value = value.strip()
+    return datetime.strptime(value[:8], '%Y%m%d').date()
+
+
+def parse_holiday_ics(text):
+    """ICS (VD: xuất từ Google Calendar): mỗi VEVENT là một ngày nghỉ, DTEND (nếu có) là ngày kết thúc
+    không tính (theo chuẩn iCalendar). Trả về [(date, tên)]."""
+    holidays = []
+    event = None
+    for line in _unfold_ics(text):
+        if line == 'BEGIN:VEVENT':
+            event = {}
+        elif line == 'END:VEVENT' and event is not None:
+            if 'DTSTART' in event:
+                start = _parse_ics_date(event['DTSTART'])
+                end = _parse_ics_date(event['DTEND']) - timedelta(days=1) if 'DTEND' in event else start
+                holidays.extend(_expand(start, max(start, end), event.get('SUMMARY', '')))
+            event = None
+        elif event is not None and ':' in line:
+            key, value = line.split(':', 1)
+            key = key.split(';', 1)[0].upper()  # bỏ tham số, VD: DTSTART;VALUE=DATE
+            if key in ('DTSTART', 'DTEND'):
+                event[key] = value
+            elif key == 'SUMMARY':
+                event[key] = value.replace('\\,', ',').replace('\\;', ';').strip()
+    return holidays
+
+
+def parse_holiday_file(filename, content):
+    """Đọc file ngày nghỉ theo phần mở rộng (.ics hoặc .csv). content: bytes hoặc str."""
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+    if filename.lower().endswith('.ics'):
+        return parse_holiday_ics(content)
+    if filename.lower().endswith('.csv'):
+        return parse_holiday_csv(content)
+    raise ValueError("Chỉ hỗ trợ file .ics hoặc .csv")
+
+
+class WorkingDayCalendar:
+    """Bảng ngày làm việc của một năm học (1/8 -> 31/7 năm sau), lập sẵn một lần:
+    mỗi ngày một byte (1 = ngày làm việc: Thứ 2-6 và không phải ngày nghỉ), tra cứu theo chỉ số ngày."""
+
+    def __init__(self, school_year, holidays=None):
+        self.school_year = school_year
+        self.start, self.end = school_year_bounds(school_year)
+        self.holidays = {}
+        n_days = (self.end - self.start).days + 1
+        self._bitmap = bytearray(1 if (self.start + timedelta(days=i)).weekday() < 5 else 0 for i in range(n_days))
+        for day, name in (holidays or {}).items():
+            if self.start <= day <= self.end:
+                self.holidays[day] = name
+                self._bitmap[(day - self.start).days] = 0
+
+    def _offset(self, day):
+        if isinstance(day, datetime):
+            day = day.date()
+        offset = (day - self.start).days
+        return offset if 0 <= offset < len(self._bitmap) else None
+
+    def is_working_day(self, day):
+        """True nếu là ngày làm việc. Ngày ngoài năm học: chỉ xét Thứ 2-6."""
+        offset = self._offset(day)
+        if offset is None:
+            return day.weekday() < 5
+        return bool(self._bitmap[offset])
+
+    def holiday_name(self, day):
+        """Tên ngày nghỉ (chuỗi, có thể rỗng) nếu day là ngày nghỉ trong lịch, ngược lại None"""
+        if isinstance(day, datetime):
+            day = day.date()
+        return self.holidays.get(day)
+
+    def working_days(self, start, end):
+        """Các ngày làm việc trong [start, end]"""
+        days = []
+        day = start
+        while day <= end:
+            if self.is_working_day(day):
+                days.append(day)
+            day += timedelta(days=1)
+        return days
@@ -0,0 +1,79 @@
+# load_test.py
+# Đo thông lượng xử lý lệnh của DutyBot với Bot API giả lập (fake_telegram.py), không cần mạng/token thật:
+# cùng một luồng lệnh giả (/today, /tomorrow, /check, /search và một ít /change của admin) chạy với
+# xử lý tuần tự và xử lý song song (CONCURRENT_UPDATES), trên bản sao dữ liệu (không đụng file thật).
+# VD: python load_test.py --users 20 --rounds 5 --api-delay 0.05 --writes 3
+
+import argparse
+import asyncio
+import logging
+import random
+import time
+
+import config
+from fake_telegram import ADMIN_USER_ID, CHAT_ID_BASE, FakeTelegramServer, command_text, sandbox_workspace, schedule_sample
+
+
+def build_traffic(server, schedule_mgr, users, rounds, writes, seed=2025):
+    """Danh sách update giả (mỗi update một chat riêng để biết lệnh nào đã được trả lời)"""
+    rng = random.Random(seed)
+    days, names = schedule_sample(schedule_mgr)
+
+    texts = []
+    for _ in range(rounds):
+        for user in range(users):
+            kind = rng.choice(['today', 'tomorrow', 'check', 'search'])
+            texts.append((1000 + user, command_text(kind, rng, days, names)))
+    for _ in range(writes):
+        position = rng.randrange(len(texts) + 1)
+        texts.insert(position, (ADMIN_USER_ID, command_text('change', rng, days, names)))
+
+    return [server.make_update(text, user_id=user_id, chat_id=CHAT_ID_BASE + i) for i, (user_id, text) in enumerate(texts)]
+
+
+async def run_once(concurrent_updates, args):
+    """Chạy một lượt: trả về (số update, thời gian xử lý hết, số update chưa được trả lời)"""
+    import bot
+    from telegram import Update
+
+    with sandbox_workspace(), FakeTelegramServer(config.TELEGRAM_BOT_TOKEN, api_delay=args.api_delay) as server:
+        bot_logic = bot.DutyBot()
+        app = bot.build_application(bot_logic, base_url=server.base_url, concurrent_updates=concurrent_updates)
+        updates = build_traffic(server, bot_logic.schedule_mgr, args.users, args.rounds, args.writes)
+        async with app:
+            await app.start()
+            started = time.monotonic()
+            for data in updates:
+                await app.update_queue.put(Update.de_json(data, app.bot))
+            pending = await asyncio.to_thread(
+                server.wait_for_chats, [u['message']['chat']['id'] for u in updates], args.timeout)
+            elapsed = time.monotonic() - started
+            await app.stop()
+    return len(updates), elapsed, len(pending)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Đo thông lượng DutyBot: tuần tự so với song song")
+    parser.add_argument('--users', type=int, default=20, help="số người dùng giả")
+    parser.add_argument('--rounds', type=int, default=5, help="số lệnh mỗi người gửi")
+    parser.add_argument('--writes', type=int, default=3, help="số lệnh /change xen vào")
+    parser.add_argument('--api-delay', type=float, default=0.05, help="độ trễ mỗi lời gọi gửi tin (giây)")
+    parser.add_argument('--concurrency', type=int, default=int(getattr(config, 'CONCURRENT_UPDATES', 16)) or 16,
+                        help="số update xử lý song song")
+    parser.add_argument('--timeout', type=float, default=300.0)
+    args = parser.parse_args()
+
+    config.ADMIN_IDS = list(getattr(config, 'ADMIN_IDS', [])) + [str(ADMIN_USER_ID)]
+    logging.disable(logging.INFO)  # chỉ giữ cảnh báo/lỗi
+
+    results = []
+    for label, concurrent_updates in (("Tuần tự", 1), (f"Song song ({args.concurrency})", args.concurrency)):
+        count, elapsed, pending = await run_once(concurrent_updates, args)
+        results.append(elapsed)
+        missing = f", {pending} lệnh không được trả lời" if pending else ""
+        print(f"{label:<16} {count} lệnh trong {elapsed:.2f}s ({count / elapsed:.1f} lệnh/s){missing}")
+    print(f"⚡ Nhanh hơn {results[0] / results[1]:.1f} lần")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
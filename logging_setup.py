@@ -0,0 +1,44 @@
+# logging_setup.py
+# Cấu hình logging cho bot: mức log và định dạng (văn bản cho người đọc, hoặc JSON mỗi dòng một bản ghi
+# để đưa vào hệ thống thu thập log)
+
+import json
+import logging
+from datetime import datetime, timezone
+
+import config
+
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Thuộc tính có sẵn của LogRecord; các thuộc tính khác là trường truyền qua extra={...}
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Mỗi bản ghi một dòng JSON: time, level, logger, message, các trường extra và exception (nếu có)"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging():
+    """Áp dụng LOG_LEVEL ('DEBUG', 'INFO'...) và LOG_FORMAT ('text' hoặc 'json') trong config.py"""
+    level = getattr(logging, str(getattr(config, 'LOG_LEVEL', 'INFO')).upper(), logging.INFO)
+    handler = logging.StreamHandler()
+    if str(getattr(config, 'LOG_FORMAT', 'text')).lower() == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    logging.basicConfig(level=level, handlers=[handler], force=True)
@@ -0,0 +1,117 @@
+# name_matcher.py
+# So khớp tên cán bộ gần đúng: không phân biệt dấu tiếng Việt, chấp nhận gõ sai chính tả (chỉ mục trigram)
+
+from schedule_index import fold_name
+
+
+# Ngưỡng điểm tương đồng (0..1)
+MIN_SUGGEST_SCORE = 0.35   # Dưới ngưỡng này không đưa vào danh sách gợi ý
+AUTO_ACCEPT_SCORE = 0.75   # Từ ngưỡng này (và không bị trùng điểm) coi như người dùng gõ thiếu dấu/sai chính tả
+AMBIGUOUS_MARGIN = 0.05    # Hai tên hơn kém nhau ít hơn mức này coi như khớp ngang nhau
+
+
+def _trigrams(folded):
+    """Tập trigram của tên đã bỏ dấu (có đệm khoảng trắng đầu/cuối, giữ cả trigram nối giữa các từ
+    để phân biệt thứ tự từ: 'tuan anh' khác 'anh tuan')"""
+    padded = f"  {folded} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _prefix_match(q_tokens, tokens):
+    """Mọi từ của truy vấn là tiền tố của một từ trong tên"""
+    return all(any(t.startswith(q) for t in tokens) for q in q_tokens)
+
+
+class NameMatcher:
+    """Chỉ mục trigram trên danh sách tên (lập một lần), trả lời truy vấn top-k theo độ tương đồng.
+
+    Điểm tương đồng:
+    - 1.0 nếu trùng hoàn toàn sau khi bỏ dấu ('Nguyen Van A' == 'Nguyễn Văn A')
+    - Hệ số Dice trên trigram (chịu được gõ sai/thiếu vài ký tự)
+    - Được cộng điểm nếu mọi từ của truy vấn là tiền tố của một từ trong tên ('Hải', 'tuan anh')
+    Các tên cùng điểm giữ theo thứ tự đưa vào (VD: thứ tự trong DS trực).
+    """
+
+    def __init__(self, names=()):
+        self._names = []
+        self._tokens = []
+        self._grams = []
+        self._by_folded = {}
+        self._gram_postings = {}
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, name):
+        """Thêm một tên vào chỉ mục (bỏ qua nếu đã có tên trùng khi bỏ dấu)"""
+        display = str(name).strip()
+        folded = fold_name(display)
+        if not folded or folded in self._by_folded:
+            return
+        entry_id = len(self._names)
+        grams = _trigrams(folded)
+        self._names.append(display)
+        self._tokens.append(folded.split())
+        self._grams.append(len(grams))
+        self._by_folded[folded] = entry_id
+        for gram in grams:
+            self._gram_postings.setdefault(gram, []).append(entry_id)
+
+    def exact(self, query):
+        """Tên trùng khớp hoàn toàn sau khi bỏ dấu, hoặc None"""
+        entry_id = self._by_folded.get(fold_name(query or ''))
+        return self._names[entry_id] if entry_id is not None else None
+
+    def top_k(self, query, k=5, min_score=MIN_SUGGEST_SCORE):
+        """Trả về tối đa k cặp (tên, điểm) có điểm >= min_score, sắp xếp giảm dần theo điểm"""
+        q_folded = fold_name(query or '')
+        if not q_folded:
+            return []
+
+        exact_id = self._by_folded.get(q_folded)
+        if exact_id is not None:
+            return [(self._names[exact_id], 1.0)]
+
+        q_grams = _trigrams(q_folded)
+        common = {}
+        for gram in q_grams:
+            for entry_id in self._gram_postings.get(gram, ()):
+                common[entry_id] = common.get(entry_id, 0) + 1
+
+        q_tokens = q_folded.split()
+        scored = []
+        for entry_id, shared in common.items():
+            score = 2.0 * shared / (len(q_grams) + self._grams[entry_id])
+            if _prefix_match(q_tokens, self._tokens[entry_id]):
+                score = max(score, 0.8 + 0.15 * score)
+            if score >= min_score:
+                scored.append((-score, entry_id))
+
+        scored.sort()
+        return [(self._names[entry_id], -neg_score) for neg_score, entry_id in scored[:k]]
+
+    def best_match(self, query, min_score=AUTO_ACCEPT_SCORE):
+        """Tên khớp tốt nhất nếu đủ tin cậy (điểm >= min_score và bỏ xa tên đứng thứ hai), hoặc None"""
+        matches = self.top_k(query, k=2, min_score=min_score)
+        if not matches:
+            return None
+        if len(matches) > 1 and matches[0][1] - matches[1][1] < AMBIGUOUS_MARGIN:
+            return None
+        return matches[0][0]
+
+    def first_match(self, query):
+        """Tên đầu tiên (theo thứ tự đưa vào) khớp truy vấn: trùng khi bỏ dấu > khớp một phần tên > gần đúng nhất.
+        Dùng khi người dùng chỉ gõ một phần tên và muốn lấy người đứng trước trong danh sách."""
+        exact = self.exact(query)
+        if exact:
+            return exact
+        q_tokens = fold_name(query or '').split()
+        if not q_tokens:
+            return None
+        for name, tokens in zip(self._names, self._tokens):
+            if _prefix_match(q_tokens, tokens):
+                return name
+        matches = self.top_k(query, k=1)
+        return matches[0][0] if matches else None
@@ -0,0 +1,77 @@
+# officer_import.py
+# Đọc file nhập danh sách cán bộ hàng loạt (.csv hoặc .xlsx), mỗi dòng: Họ tên, Miễn ('x'), Lý do, Telegram ID, SĐT
+
+import csv
+import io
+import re
+import unicodedata
+
+
+IMPORT_COLUMNS = ('name', 'exempt', 'reason', 'telegram_id', 'phone')
+EXEMPT_VALUES = {'x', '1', 'có', 'co', 'yes', 'true', 'miễn', 'mien'}
+TELEGRAM_ID_PATTERN = re.compile(r'^-?\d{5,}$')
+PHONE_PATTERN = re.compile(r'^\+?[\d .\-()]{8,20}$')
+
+
+def _cell_text(value):
+    """Giá trị ô -> chuỗi (số nguyên đọc từ Excel dạng 123.0 -> '123')"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return unicodedata.normalize('NFC', str(value)).strip()
+
+
+def _is_header(values):
+    first = values[0].lower() if values else ''
+    return first in ('họ tên', 'ho ten', 'tên', 'ten', 'name', 'họ tên trực ban')
+
+
+def _read_rows(filename, content):
+    """Các dòng dữ liệu (số dòng trong file, [5 ô dạng chuỗi]), bỏ dòng trống và dòng tiêu đề"""
+    lower = filename.lower()
+    if lower.endswith('.csv'):
+        if isinstance(content, bytes):
+            content = content.decode('utf-8-sig')
+        raw_rows = enumerate(csv.reader(io.StringIO(content)), start=1)
+    elif lower.endswith('.xlsx'):
+        from openpyxl import load_workbook
+        wb = load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+        try:
+            ws = wb['DS trực'] if 'DS trực' in wb.sheetnames else wb.worksheets[0]
+            raw_rows = list(enumerate(ws.iter_rows(max_col=len(IMPORT_COLUMNS), values_only=True), start=1))
+        finally:
+            wb.close()
+    else:
+        raise ValueError("Chỉ hỗ trợ file .csv hoặc .xlsx")
+
+    rows = []
+    for line_no, raw in raw_rows:
+        values = [_cell_text(v) for v in raw][:len(IMPORT_COLUMNS)]
+        values += [''] * (len(IMPORT_COLUMNS) - len(values))
+        if not any(values) or values[0].startswith('#'):
+            continue
+        if not rows and _is_header(values):
+            continue
+        rows.append((line_no, values))
+    return rows
+
+
+def parse_officer_file(filename, content):
+    """Đọc file nhập cán bộ. Trả về [{'line', 'name', 'exempt', 'reason', 'telegram_id', 'phone', 'error'}];
+    'error' là thông báo lỗi của dòng (None nếu hợp lệ). Kiểm tra trùng tên/DS trực do ScheduleManager thực hiện."""
+    records = []
+    for line_no, values in _read_rows(filename, content):
+        record = dict(zip(IMPORT_COLUMNS, values))
+        record['line'] = line_no
+        record['exempt'] = record['exempt'].lower() in EXEMPT_VALUES
+        record['error'] = None
+
+        if len(record['name']) < 2:
+            record['error'] = "Họ tên trống hoặc quá ngắn"
+        elif record['telegram_id'] and not TELEGRAM_ID_PATTERN.match(record['telegram_id']):
+            record['error'] = f"Telegram ID không hợp lệ: '{record['telegram_id']}'"
+        elif record['phone'] and not PHONE_PATTERN.match(record['phone']):
+            record['error'] = f"SĐT không hợp lệ: '{record['phone']}'"
+        records.append(record)
+    return records
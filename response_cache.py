@@ -0,0 +1,53 @@
+# response_cache.py
+# Bộ nhớ đệm câu trả lời của các lệnh chỉ đọc (/today, /tomorrow, /check, /search): nhiều cán bộ hỏi cùng
+# một câu (VD: ngay sau thông báo 15h) thì chỉ tính và định dạng một lần
+
+from collections import OrderedDict
+
+
+MAX_RESPONSES = 512  # số câu trả lời giữ tối đa (bỏ câu ít dùng nhất khi đầy)
+
+
+class ResponseCache:
+    """Câu trả lời đã định dạng theo khóa (lệnh, tham số đã chuẩn hóa, cán bộ...).
+    Mọi câu trả lời gắn với một phiên bản (ngày hiện tại + phiên bản lịch trực): khi phiên bản đổi
+    (có ghi lịch, đổi năm học, nhập ngày nghỉ, sang ngày mới) toàn bộ bộ nhớ đệm bị bỏ."""
+
+    def __init__(self, max_entries=MAX_RESPONSES):
+        self.max_entries = max_entries
+        self._version = None
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _check_version(self, version):
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def get(self, key, version):
+        """Câu trả lời đã lưu cho key ở phiên bản version, hoặc None"""
+        self._check_version(version)
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, version, value):
+        """Lưu câu trả lời (bỏ qua nếu version là None: chưa xác định được phiên bản lịch trực)"""
+        if version is None:
+            return
+        self._check_version(version)
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
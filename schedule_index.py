@@ -0,0 +1,449 @@
+# schedule_index.py
+# Chỉ mục lịch trực theo năm học: tra cứu theo ngày / theo tên cán bộ mà không cần quét lại các sheet tháng
+
+import bisect
+import re
+import unicodedata
+from datetime import datetime, date as date_type, timedelta
+
+
+MONTH_SHEET_PATTERN = re.compile(r'^(\d{1,2})-(\d{4})$')
+
+# Cột dữ liệu trong sheet tháng (openpyxl, bắt đầu từ 1): C=Sáng, D=Chiều, E=Lãnh đạo
+ROLE_COLUMNS = ((3, 'Sáng'), (4, 'Chiều'), (5, 'Lãnh đạo'))
+ROLE_ORDER = {role: i for i, (_, role) in enumerate(ROLE_COLUMNS)}
+
+# Giá trị ô không phải tên người (ô trống, đánh dấu, ghi chú ngày nghỉ)
+NON_NAME_VALUES = {'', 'x', '-', 'nan', 'none'}
+NON_NAME_KEYWORDS = ('nghỉ', 'tết', 'thứ 7', 'chủ nhật')
+
+# Công thức thường gặp ở cột Ngày: '=A5+1', '=$A$5+7', '=DATE(2025,9,1)' (dùng khi ô chưa có giá trị đã tính,
+# VD: file vừa được openpyxl lưu giữ nguyên công thức, Excel chưa mở lại để tính)
+CELL_REF_FORMULA = re.compile(r'^=\s*\$?A\$?(\d+)\s*(?:([+-])\s*(\d+))?\s*$', re.IGNORECASE)
+DATE_FUNC_FORMULA = re.compile(
+    r'^=\s*DATE\(\s*(\d{4})\s*,\s*(\d{1,2})\s*,\s*(\d{1,2})\s*\)\s*(?:([+-])\s*(\d+))?\s*$', re.IGNORECASE
+)
+
+
+def normalize_name(name):
+    """Chuẩn hóa tên để so sánh (Unicode NFC + strip + lowercase), tránh lỗi trùng tên
+    do khác dạng dựng sẵn Unicode (dấu tiếng Việt tổ hợp/dựng sẵn) hoặc khoảng trắng thừa."""
+    return unicodedata.normalize('NFC', str(name)).strip().lower()
+
+
+def fold_name(name):
+    """Bỏ dấu tiếng Việt + gộp khoảng trắng (VD: 'Nguyễn  Văn Đạt' -> 'nguyen van dat'),
+    dùng để tìm kiếm khi người dùng gõ không dấu."""
+    decomposed = unicodedata.normalize('NFD', normalize_name(name))
+    stripped = ''.join(ch for ch in decomposed if unicodedata.category(ch) != 'Mn')
+    return ' '.join(stripped.replace('đ', 'd').split())
+
+
+def is_officer_name(value):
+    """True nếu giá trị ô là tên người (không phải ô trống/ghi chú nghỉ lễ)"""
+    if value is None:
+        return False
+    text = normalize_name(value)
+    if text in NON_NAME_VALUES:
+        return False
+    return not any(keyword in text for keyword in NON_NAME_KEYWORDS)
+
+
+def parse_cell_date(value):
+    """Đọc giá trị ô Ngày (datetime hoặc chuỗi dd/mm/yyyy, yyyy/mm/dd, yyyy-mm-dd) -> date, hoặc None"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date_type):
+        return value
+    if isinstance(value, str):
+        text = value.strip()
+        for fmt in ('%d/%m/%Y', '%Y/%m/%d', '%Y-%m-%d'):
+            try:
+                return datetime.strptime(text, fmt).date()
+            except ValueError:
+                continue
+    return None
+
+
+def resolve_date_formula(formula, resolved_rows):
+    """Tính giá trị ngày của công thức đơn giản ở cột Ngày.
+    resolved_rows: {số dòng: date} các ô cột A phía trên đã biết giá trị. Trả về date hoặc None."""
+    if not isinstance(formula, str):
+        return None
+    match = CELL_REF_FORMULA.match(formula.strip())
+    if match:
+        base = resolved_rows.get(int(match.group(1)))
+        offset = int(match.group(3) or 0) * (-1 if match.group(2) == '-' else 1)
+    else:
+        match = DATE_FUNC_FORMULA.match(formula.strip())
+        if not match:
+            return None
+        try:
+            base = date_type(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+        except ValueError:
+            return None
+        offset = int(match.group(5) or 0) * (-1 if match.group(4) == '-' else 1)
+    if base is None:
+        return None
+    return base + timedelta(days=offset)
+
+
+def needs_formula_dates(rows):
+    """True nếu sheet tháng có ô Ngày trống nhưng có Thứ (rows: các dòng từ dòng 5) -> có thể là công thức
+    chưa có giá trị đã tính (file vừa được openpyxl lưu)"""
+    return any(row and row[0] is None and len(row) > 1 and row[1] for row in rows)
+
+
+def resolve_formula_dates(filepath, sheet_names):
+    """Đọc công thức cột Ngày (bản không data_only) của các sheet cần và tự tính ngày: {sheet: {dòng: date}}"""
+    from openpyxl import load_workbook
+
+    overrides = {}
+    wb = load_workbook(filepath, read_only=True)
+    try:
+        for sheet_name in sheet_names:
+            resolved = {}
+            for row_idx, (value,) in enumerate(
+                wb[sheet_name].iter_rows(min_row=1, max_col=1, values_only=True), start=1
+            ):
+                duty_date = parse_cell_date(value) or resolve_date_formula(value, resolved)
+                if duty_date is not None:
+                    resolved[row_idx] = duty_date
+            overrides[sheet_name] = {r: d for r, d in resolved.items() if r >= 5}
+    finally:
+        wb.close()
+    return overrides
+
+
+def _as_date(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+class DsTrucRoster:
+    """Mô hình sheet 'DS trực' (dòng 1 là tiêu đề; cột A=STT, B=Họ tên, C=Miễn 'x', D=Lý do):
+    - entries: các dòng có tên theo thứ tự dòng: {'row', 'stt', 'name', 'exempt', 'reason'}
+    - tên đã chuẩn hóa -> các dòng; STT lớn nhất và dòng dữ liệu cuối được tính sẵn
+    Các hàm add/remove/set_exempt/rename cập nhật mô hình theo đúng thao tác vừa ghi vào sheet."""
+
+    def __init__(self):
+        self.entries = []
+        self.max_stt = 0
+        self.last_row = 1  # dòng 1 là header
+        self._rows_by_name = {}
+
+    @classmethod
+    def from_rows(cls, rows):
+        """rows: giá trị (A, B, C, D) của từng dòng từ dòng 2 (VD: iter_rows(min_row=2, max_col=4, values_only=True))"""
+        roster = cls()
+        for row_idx, row in enumerate(rows, start=2):
+            row = tuple(row) + (None,) * (4 - len(row))
+            stt, name, exempt, reason = row[:4]
+            if isinstance(stt, (int, float)):
+                roster.max_stt = max(roster.max_stt, int(stt))
+            if name is None or not str(name).strip():
+                continue
+            try:
+                stt = int(stt) if stt is not None else None
+            except (TypeError, ValueError):
+                pass
+            roster.entries.append({
+                'row': row_idx,
+                'stt': stt,
+                'name': unicodedata.normalize('NFC', str(name)).strip(),
+                'exempt': exempt is not None and str(exempt).strip().lower() == 'x',
+                'reason': str(reason).strip() if reason is not None else '',
+            })
+            roster.last_row = row_idx
+        roster._reindex()
+        return roster
+
+    @classmethod
+    def load(cls, filepath):
+        """Đọc sheet 'DS trực' của một file (read-only); file không có sheet này thì trả về DS rỗng"""
+        from openpyxl import load_workbook
+
+        wb = load_workbook(filepath, read_only=True, data_only=True)
+        try:
+            if 'DS trực' not in wb.sheetnames:
+                return cls()
+            return cls.from_rows(wb['DS trực'].iter_rows(min_row=2, max_col=4, values_only=True))
+        finally:
+            wb.close()
+
+    def _reindex(self):
+        self._rows_by_name = {}
+        for entry in self.entries:
+            self._rows_by_name.setdefault(normalize_name(entry['name']), []).append(entry['row'])
+
+    def find_rows(self, name_normalized):
+        """Các dòng có tên (đã chuẩn hóa) khớp"""
+        return list(self._rows_by_name.get(name_normalized, []))
+
+    def entry_at(self, row_idx):
+        return next((e for e in self.entries if e['row'] == row_idx), None)
+
+    def names(self):
+        return [e['name'] for e in self.entries]
+
+    def active_names(self):
+        """Tên các cán bộ không bị miễn trực, theo thứ tự trong sheet"""
+        return [e['name'] for e in self.entries if not e['exempt']]
+
+    def add(self, row_idx, stt, name):
+        self.entries.append({'row': row_idx, 'stt': stt, 'name': name, 'exempt': False, 'reason': ''})
+        self.max_stt = max(self.max_stt, stt)
+        self.last_row = max(self.last_row, row_idx)
+        self._rows_by_name.setdefault(normalize_name(name), []).append(row_idx)
+
+    def remove(self, row_idx):
+        """Xóa dòng row_idx (ws.delete_rows): các dòng phía dưới dịch lên một dòng"""
+        self.entries = [e for e in self.entries if e['row'] != row_idx]
+        for entry in self.entries:
+            if entry['row'] > row_idx:
+                entry['row'] -= 1
+        self.last_row = self.entries[-1]['row'] if self.entries else 1
+        self.max_stt = max((e['stt'] for e in self.entries if isinstance(e['stt'], int)), default=0)
+        self._reindex()
+
+    def set_exempt(self, row_idx, exempt, reason=''):
+        entry = self.entry_at(row_idx)
+        if entry is not None:
+            entry['exempt'] = exempt
+            entry['reason'] = reason or ''
+
+    def rename(self, row_idx, new_name):
+        entry = self.entry_at(row_idx)
+        if entry is not None:
+            entry['name'] = new_name
+            self._reindex()
+
+
+class YearScheduleIndex:
+    """Ảnh chụp toàn bộ lịch trực của một file năm học, lập chỉ mục một lần khi nạp file:
+    - days: ngày -> thông tin ca trực (sheet, dòng, thứ, sáng, chiều, lãnh đạo)
+    - postings: tên đã chuẩn hóa -> danh sách (ngày, vai trò) đã sắp xếp theo ngày
+    - cells: tên đã chuẩn hóa -> các ô chứa tên đó trong sheet tháng [(ngày, sheet, dòng, cột)] theo ngày,
+      summary_rows: tên đã chuẩn hóa -> các dòng trong sheet 'Tổng' (đổi/thay tên chỉ cần sửa đúng các ô này)
+    - month_sheets: tên các sheet tháng (m-yyyy) theo thứ tự trong file
+    - token -> tên: từng từ trong tên (cả dạng có dấu và không dấu) để tra theo một phần tên
+    """
+
+    def __init__(self, filepath, version=None):
+        self.filepath = filepath
+        self.version = version
+        self.days = {}
+        self.postings = {}
+        self.display_names = {}
+        self.cells = {}
+        self.summary_rows = {}
+        self.month_sheets = []
+        self.roster = DsTrucRoster()
+        self._token_names = {}
+        self._sorted_tokens = []
+
+    @classmethod
+    def build(cls, filepath, version=None):
+        """Đọc file Excel (read-only) và lập chỉ mục cho tất cả các sheet tháng"""
+        from openpyxl import load_workbook
+
+        index = cls(filepath, version)
+        wb = load_workbook(filepath, read_only=True, data_only=True)
+        try:
+            month_rows = {}
+            unresolved = []
+            for sheet_name in wb.sheetnames:
+                if MONTH_SHEET_PATTERN.match(sheet_name):
+                    rows = [
+                        tuple(row) + (None,) * (5 - len(row))
+                        for row in wb[sheet_name].iter_rows(min_row=5, max_col=5, values_only=True)
+                    ]
+                    month_rows[sheet_name] = rows
+                    index.month_sheets.append(sheet_name)
+                    if needs_formula_dates(rows):
+                        unresolved.append(sheet_name)
+            if 'DS trực' in wb.sheetnames:
+                index._index_roster(wb['DS trực'])
+            if 'Tổng' in wb.sheetnames:
+                index._index_summary(wb['Tổng'])
+        finally:
+            wb.close()
+
+        date_overrides = resolve_formula_dates(filepath, unresolved) if unresolved else {}
+        for sheet_name, rows in month_rows.items():
+            index._index_month_sheet(sheet_name, rows, date_overrides.get(sheet_name, {}))
+        index._finalize()
+        return index
+
+    def _index_month_sheet(self, sheet_name, rows, date_overrides=None):
+        date_overrides = date_overrides or {}
+        last_date = None
+        for row_idx, row in enumerate(rows, start=5):
+            duty_date = parse_cell_date(row[0]) or date_overrides.get(row_idx)
+            if duty_date is None:
+                # Ô Ngày gộp (merged) -> dòng thuộc về ngày phía trên
+                if last_date is None or not any(row[2:5]):
+                    continue
+                duty_date = last_date
+            last_date = duty_date
+
+            # Ngày có ở nhiều sheet (sheet tháng kéo sang đầu tháng sau): ưu tiên sheet của chính tháng đó
+            known = self.days.get(duty_date)
+            if known is None or (sheet_name == f"{duty_date.month}-{duty_date.year}" and known['sheet'] != sheet_name):
+                self.days[duty_date] = {
+                    'sheet': sheet_name,
+                    'row': row_idx,
+                    'day_of_week': str(row[1]).strip() if row[1] is not None else '',
+                    'morning': row[2],
+                    'afternoon': row[3],
+                    'leader': row[4],
+                }
+
+            for col, role in ROLE_COLUMNS:
+                value = row[col - 1]
+                if not is_officer_name(value):
+                    continue
+                display = unicodedata.normalize('NFC', str(value)).strip()
+                key = normalize_name(display)
+                self.display_names.setdefault(key, display)
+                self.postings.setdefault(key, []).append((duty_date, role))
+                self.cells.setdefault(key, []).append((duty_date, sheet_name, row_idx, col))
+
+    def _index_roster(self, ws):
+        """Mô hình sheet 'DS trực' (STT, tên, miễn trực theo từng dòng)"""
+        self.roster = DsTrucRoster.from_rows(ws.iter_rows(min_row=2, max_col=4, values_only=True))
+
+    def _index_summary(self, ws):
+        """Các dòng tên cán bộ trong sheet 'Tổng' (cột B, từ dòng 6; dòng 5 là tiêu đề)"""
+        for row_idx, (value,) in enumerate(ws.iter_rows(min_row=6, min_col=2, max_col=2, values_only=True), start=6):
+            if value is not None and str(value).strip():
+                self.summary_rows.setdefault(normalize_name(value), []).append(row_idx)
+
+    @property
+    def roster_names(self):
+        """Danh sách tên trong sheet 'DS trực', giữ nguyên thứ tự"""
+        return self.roster.names()
+
+    def all_names(self):
+        """Tất cả tên đã biết: DS trực trước (theo STT), sau đó là các tên chỉ xuất hiện trong sheet tháng"""
+        names = list(self.roster_names)
+        known = {normalize_name(n) for n in names}
+        names.extend(display for key, display in sorted(self.display_names.items()) if key not in known)
+        return names
+
+    def _finalize(self):
+        for key, postings in self.postings.items():
+            postings.sort(key=lambda p: (p[0], ROLE_ORDER[p[1]]))
+            self.cells[key].sort()
+        self._build_tokens()
+
+    def _build_tokens(self):
+        self._token_names = {}
+        for key in self.postings:
+            for token in set(key.split()) | set(fold_name(key).split()):
+                self._token_names.setdefault(token, set()).add(key)
+        self._sorted_tokens = sorted(self._token_names)
+
+    def get_cells(self, name_key, start_date=None, end_date=None):
+        """Các ô (ngày, sheet, dòng, cột) chứa tên đã chuẩn hóa, lọc theo khoảng ngày"""
+        cells = self.cells.get(name_key, [])
+        start_date, end_date = _as_date(start_date), _as_date(end_date)
+        lo = bisect.bisect_left(cells, (start_date,)) if start_date else 0
+        hi = bisect.bisect_right(cells, (end_date, '\uffff')) if end_date else len(cells)
+        return cells[lo:hi]
+
+    def rename(self, old_key, new_name):
+        """Cập nhật chỉ mục sau khi mọi ô của old_key (sheet tháng, 'Tổng', 'DS trực') đã được ghi thành new_name"""
+        new_key = normalize_name(new_name)
+        postings = self.postings.pop(old_key, [])
+        cells = self.cells.pop(old_key, [])
+        self.display_names.pop(old_key, None)
+        if postings:
+            self.postings.setdefault(new_key, []).extend(postings)
+            self.postings[new_key].sort(key=lambda p: (p[0], ROLE_ORDER[p[1]]))
+            self.cells.setdefault(new_key, []).extend(cells)
+            self.cells[new_key].sort()
+            self.display_names[new_key] = new_name
+        if old_key in self.summary_rows:
+            self.summary_rows.setdefault(new_key, []).extend(self.summary_rows.pop(old_key))
+
+        role_fields = {col: field for (col, _), field in zip(ROLE_COLUMNS, ('morning', 'afternoon', 'leader'))}
+        for duty_date, sheet_name, row_idx, col in cells:
+            day = self.days.get(duty_date)
+            if day is not None and day['sheet'] == sheet_name and day['row'] == row_idx:
+                day[role_fields[col]] = new_name
+
+        for row_idx in self.roster.find_rows(old_key):
+            self.roster.rename(row_idx, new_name)
+        self._build_tokens()
+
+    def _names_with_token_prefix(self, prefix):
+        names = set()
+        start = bisect.bisect_left(self._sorted_tokens, prefix)
+        for token in self._sorted_tokens[start:]:
+            if not token.startswith(prefix):
+                break
+            names |= self._token_names[token]
+        return names
+
+    def lookup_names(self, name_query):
+        """Tìm các tên (đã chuẩn hóa) khớp với truy vấn.
+        Khớp nguyên tên trước; nếu không có thì mỗi từ của truy vấn phải là tiền tố của một từ trong tên
+        (không phân biệt hoa thường, gõ có dấu hoặc không dấu đều được)."""
+        query = normalize_name(name_query or '')
+        if not query:
+            return []
+        if query in self.postings:
+            return [query]
+
+        candidates = None
+        for token in query.split():
+            # Gõ có dấu -> khớp chính xác dấu; gõ không dấu -> khớp cả tên có dấu
+            matched = self._names_with_token_prefix(token)
+            if fold_name(token) == token:
+                matched |= self._names_with_token_prefix(fold_name(token))
+            candidates = matched if candidates is None else candidates & matched
+            if not candidates:
+                return []
+        return sorted(candidates)
+
+    def get_postings(self, name_key, start_date=None, end_date=None):
+        """Các (ngày, vai trò) của một tên đã chuẩn hóa, lọc theo khoảng ngày bằng tìm kiếm nhị phân"""
+        postings = self.postings.get(name_key, [])
+        start_date, end_date = _as_date(start_date), _as_date(end_date)
+        lo = bisect.bisect_left(postings, (start_date,)) if start_date else 0
+        hi = bisect.bisect_right(postings, (end_date, '\uffff')) if end_date else len(postings)
+        return postings[lo:hi]
+
+    def search(self, name_query, start_date=None, end_date=None):
+        """Lịch trực của (các) cán bộ khớp truy vấn trong khoảng ngày (mặc định: cả năm học).
+        Trả về [{'date': 'dd/mm/yyyy', 'day_of_week': ..., 'roles': [...], 'names': [...]}] theo thứ tự ngày."""
+        by_date = {}
+        for key in self.lookup_names(name_query):
+            for duty_date, role in self.get_postings(key, start_date, end_date):
+                roles, names = by_date.setdefault(duty_date, ([], []))
+                if role not in roles:
+                    roles.append(role)
+                if self.display_names[key] not in names:
+                    names.append(self.display_names[key])
+
+        results = []
+        for duty_date in sorted(by_date):
+            roles, names = by_date[duty_date]
+            roles.sort(key=ROLE_ORDER.get)
+            results.append({
+                'date': duty_date.strftime('%d/%m/%Y'),
+                'day_of_week': self.days.get(duty_date, {}).get('day_of_week', ''),
+                'roles': roles,
+                'names': names,
+            })
+        return results
+
+    def date_range(self):
+        """(ngày đầu, ngày cuối) có trong file, hoặc (None, None) nếu file chưa có dữ liệu"""
+        if not self.days:
+            return None, None
+        return min(self.days), max(self.days)
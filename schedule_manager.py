@@ -5,10 +5,23 @@ import pandas as pd
 import os
 import re
 import glob
+import hashlib
+import secrets
+import functools
+import logging
 import unicodedata
 from datetime import datetime, timedelta
 import config
 from database import DatabaseManager
+from schedule_index import YearScheduleIndex, DsTrucRoster, normalize_name as _normalize_name, is_officer_name
+from name_matcher import NameMatcher
+from schedule_optimizer import BalancedScheduler
+from atomic_save import save_workbook_atomic, list_backups, restore_backup
+from file_lock import get_workbook_lock, all_lock_metrics, LockTimeout
+from officer_import import parse_officer_file
+from holiday_calendar import WorkingDayCalendar, school_year_of, school_year_bounds, parse_holiday_file
+
+logger = logging.getLogger(__name__)
 
 
 def get_schedule_filename(year):
@@ -16,18 +29,47 @@ def get_schedule_filename(year):
     return f"LichTrucBan_{year}-{year + 1}.xlsx"
 
 
-def _normalize_name(name):
-    """Chuẩn hóa tên để so sánh (Unicode NFC + strip + lowercase), tránh lỗi trùng tên
-    do khác dạng dựng sẵn Unicode (dấu tiếng Việt tổ hợp/dựng sẵn) hoặc khoảng trắng thừa."""
-    return unicodedata.normalize('NFC', str(name)).strip().lower()
+SCHEDULE_FILENAME_PATTERN = re.compile(r'^LichTrucBan_(\d{4})-(\d{4})(?:_.*)?\.xlsx$')
 
+# Các chế độ xếp lịch tự động: vòng tròn cố định / cân bằng theo tổng số buổi cả năm
+SCHEDULE_MODES = ('round_robin', 'balanced')
 
-SCHEDULE_FILENAME_PATTERN = re.compile(r'^LichTrucBan_(\d{4})-(\d{4})(?:_.*)?\.xlsx$')
+# Thời gian giữ bản xếp thử (/auto_schedule_preview) chờ xác nhận ghi
+PREVIEW_TTL = timedelta(hours=1)
+
+# Thông báo khi không lấy được khóa ghi file năm học (thao tác ghi khác chạy quá lâu)
+LOCK_BUSY_MESSAGE = "File lịch trực đang được cập nhật bởi thao tác khác, vui lòng thử lại sau ít phút."
+
+
+def _exclusive_write(on_timeout=lambda message: (False, message)):
+    """Chạy hàm ghi file năm học khi đang giữ khóa ghi (xem file_lock): các thao tác đọc-sửa-lưu
+    không chen nhau (kể cả giữa các tiến trình bot). Hết thời gian chờ -> trả về on_timeout(thông báo)."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            filepath = self.get_master_schedule_path()
+            if not filepath:
+                return method(self, *args, **kwargs)
+            lock = get_workbook_lock(filepath)
+            try:
+                with lock.write():
+                    return method(self, *args, **kwargs)
+            except LockTimeout as e:
+                logger.warning("⏱️ %s: %s", method.__name__, e,
+                               extra={'operation': method.__name__, 'lock_metrics': lock.metrics()})
+                return on_timeout(LOCK_BUSY_MESSAGE)
+        return wrapper
+    return decorator
 
 
 class ScheduleManager:
     def __init__(self):
         self.db = DatabaseManager()
+        self._year_index = None
+        self._name_matcher = None
+        self._schedule_previews = {}  # token -> bản xếp thử chờ ghi (xem preview_auto_schedule)
+        self._working_day_calendars = {}  # năm học -> WorkingDayCalendar (lập lại khi nhập ngày nghỉ)
+        self._holidays_generation = 0  # tăng mỗi lần nhập/xóa ngày nghỉ (xem schedule_version)
         self._seed_available_years_if_empty()
 
     def _seed_available_years_if_empty(self):
@@ -64,20 +106,90 @@ class ScheduleManager:
             path = os.path.join(config.SCHEDULE_FOLDER, filename)
             if os.path.exists(path):
                 return path
-            print(f"⚠️ File của năm hiện tại ({filename}) không tồn tại trên đĩa.")
+            logger.warning("⚠️ File của năm hiện tại (%s) không tồn tại trên đĩa.", filename)
 
         # Fallback cuối cùng: tìm file Excel bất kỳ trong thư mục (tránh 'chết cứng' nếu DB trống bất thường)
-        print("⚠️ Không xác định được năm hiện tại từ DB, dùng fallback tìm file bất kỳ. Hãy dùng /set_current_year.")
+        logger.warning("⚠️ Không xác định được năm hiện tại từ DB, dùng fallback tìm file bất kỳ. Hãy dùng /set_current_year.")
         files = glob.glob(os.path.join(config.SCHEDULE_FOLDER, "*.xlsx"))
         if files:
             return files[0]
         return None
     
+    def get_year_index(self):
+        """Chỉ mục lịch trực của năm hiện tại (ngày -> ca trực, tên -> các ngày trực).
+        Được lập khi nạp file năm học và tự lập lại khi file thay đổi trên đĩa (mtime/kích thước)."""
+        filepath = self.get_master_schedule_path()
+        if not filepath:
+            return None
+
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        index = self._year_index
+        if index is not None and index.filepath == filepath and index.version == version:
+            return index
+        stale = index if index is not None and index.filepath == filepath else None
+
+        try:
+            # Khóa đọc: không đọc file giữa lúc tiến trình khác đang thay file; người đọc sau dùng lại chỉ mục.
+            # Đã có chỉ mục cũ thì không chờ (hàm được gọi từ vòng lặp sự kiện của bot): đang có người ghi
+            # thì dùng tạm chỉ mục cũ, lần gọi sau khi ghi xong sẽ lập lại
+            with get_workbook_lock(filepath).read(timeout=0 if stale is not None else None):
+                index = YearScheduleIndex.build(filepath, version)
+        except LockTimeout as e:
+            logger.warning("⏱️ %s, dùng tạm chỉ mục cũ", e)
+            return stale
+        except Exception as e:
+            logger.exception("Lỗi lập chỉ mục file %s: %s", filepath, e)
+            return None
+
+        logger.info("📚 Đã lập chỉ mục %d ngày, %d cán bộ từ %s", len(index.days), len(index.postings),
+                    os.path.basename(filepath),
+                    extra={'schedule_file': os.path.basename(filepath), 'days': len(index.days),
+                           'officers': len(index.postings)})
+        self._year_index = index
+        return index
+
+    def schedule_version(self):
+        """Phiên bản dữ liệu lịch trực: (file năm học, phiên bản chỉ mục, lần nhập ngày nghỉ).
+        Đổi khi file năm học được ghi/thay, khi đổi năm học hoặc nhập/xóa ngày nghỉ; None nếu chưa có file năm học."""
+        index = self.get_year_index()
+        if index is None:
+            return None
+        return (index.filepath, index.version, self._holidays_generation)
+
+    def get_name_matcher(self):
+        """Bộ so khớp tên gần đúng trên DS trực + mọi tên xuất hiện trong các sheet tháng của năm hiện tại.
+        Lập lại cùng lúc với chỉ mục năm (khi file thay đổi)."""
+        index = self.get_year_index()
+        if index is None:
+            return NameMatcher()
+
+        cached = self._name_matcher
+        if cached is not None and cached[0] is index:
+            return cached[1]
+
+        matcher = NameMatcher(index.all_names())
+        self._name_matcher = (index, matcher)
+        return matcher
+
+    def suggest_officer_names(self, query, k=5):
+        """Gợi ý tối đa k tên gần đúng nhất: [(tên, điểm), ...]"""
+        return self.get_name_matcher().top_k(query, k=k)
+
+    def resolve_officer_name(self, query):
+        """Đưa tên người dùng gõ (thiếu dấu/sai chính tả nhẹ) về đúng tên đã có trong file.
+        Trả về tên chuẩn nếu khớp đủ tin cậy, ngược lại None."""
+        return self.get_name_matcher().best_match(query)
+
     def read_schedule_for_date(self, date):
         """Đọc lịch trực từ file Excel (Sheet tương ứng)"""
         filepath = self.get_master_schedule_path()
         if not filepath:
-            print(f"Không tìm thấy file lịch trực trong {config.SCHEDULE_FOLDER}")
+            logger.warning("Không tìm thấy file lịch trực trong %s", config.SCHEDULE_FOLDER)
             return None
             
         sheet_name = self.get_schedule_sheet_name(date)
@@ -91,7 +203,7 @@ class ScheduleManager:
                 if sheet_name_alt in xl.sheet_names:
                     sheet_name = sheet_name_alt
                 else:
-                    print(f"Không tìm thấy sheet {sheet_name} trong file {filepath}")
+                    logger.warning("Không tìm thấy sheet %s trong file %s", sheet_name, filepath)
                     return None
             
             # Đọc dữ liệu với header ở dòng 4 (index 3)
@@ -101,7 +213,7 @@ class ScheduleManager:
             # Chuẩn hóa tên cột để dễ xử lý (lấy theo index vì tên cột có thể thay đổi)
             # Index: 0=Date, 1=Day, 2=Morning, 3=Afternoon, 4=Leader
             if len(df.columns) < 5:
-                print("File Excel không đủ số cột yêu cầu")
+                logger.warning("File Excel không đủ số cột yêu cầu (sheet %s)", sheet_name)
                 return None
                 
             # Đổi tên cột tạm thời để truy cập
@@ -113,144 +225,97 @@ class ScheduleManager:
             # Xử lý ô gộp (Merged cells) cho cột Ngày: Điền giá trị từ trên xuống
             df['Date'] = df['Date'].ffill()
             
-            print(f"📊 Đã đọc {len(df)} dòng dữ liệu từ sheet {sheet_name}")
+            logger.debug("📊 Đã đọc %d dòng dữ liệu từ sheet %s", len(df), sheet_name,
+                         extra={'sheet': sheet_name, 'rows': len(df)})
             
             return df
         except Exception as e:
-            print(f"Lỗi khi đọc file {filepath} (Sheet {sheet_name}): {str(e)}")
+            logger.exception("Lỗi khi đọc file %s (Sheet %s): %s", filepath, sheet_name, e)
             return None
     
     def get_duty_info_for_date(self, date):
         """Lấy thông tin trực ban cho một ngày cụ thể"""
-        df = self.read_schedule_for_date(date)
-        
-        if df is None:
-            return None
-        
-        # Tìm dòng ứng với ngày
-        # Chuyển đổi cột Date sang datetime để so sánh
-        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-        
-        target_date = pd.Timestamp(date.year, date.month, date.day)
-        
-        # Lọc dữ liệu
-        duty_row = df[df['Date'] == target_date]
-        
-        if duty_row.empty:
+        # Ngày nghỉ trong lịch ngày nghỉ: không cần đọc sheet
+        holiday = self.get_holiday_name(date)
+        if holiday is not None:
+            day_names = ["Thứ Hai", "Thứ Ba", "Thứ Tư", "Thứ Năm", "Thứ Sáu", "Thứ Bảy", "Chủ Nhật"]
+            return {
+                'date': date.strftime('%d/%m/%Y'),
+                'day_of_week': day_names[date.weekday()],
+                'is_off': True,
+                'holiday': holiday,
+                'morning_officer': None,
+                'afternoon_officer': None,
+                'leader': None
+            }
+
+        # Tra từ chỉ mục năm: ô Ngày là công thức (file vừa được openpyxl lưu, chưa có giá trị đã tính)
+        # vẫn được tự tính, ngày dạng chuỗi dd/mm/yyyy đọc đúng thứ tự ngày/tháng
+        _, _, day = self._find_duty_row(date)
+        if day is None:
             return None
-        
-        row = duty_row.iloc[0]
-        
-        # Xử lý các ô merged/empty (Weekend/Holiday)
-        morning = row['Morning'] if pd.notna(row['Morning']) else None
-        afternoon = row['Afternoon'] if pd.notna(row['Afternoon']) else None
-        leader = row['Leader'] if pd.notna(row['Leader']) else None
-        
+
+        morning = str(day['morning']).strip() if day['morning'] is not None else ''
+        afternoon = str(day['afternoon']).strip() if day['afternoon'] is not None else ''
+        leader = str(day['leader']).strip() if day['leader'] is not None else ''
+
         # Nếu không có ai trực (ngày nghỉ/lễ mà không phân công)
         if not morning and not afternoon and not leader:
-             # Có thể trả về None hoặc object báo là ngày nghỉ
-             return {
+            return {
                 'date': date.strftime('%d/%m/%Y'),
-                'day_of_week': row.iloc[1] if pd.notna(row.iloc[1]) else '',
+                'day_of_week': day['day_of_week'],
                 'is_off': True,
                 'morning_officer': None,
                 'afternoon_officer': None,
                 'leader': None
             }
 
-        result = {
+        return {
             'date': date.strftime('%d/%m/%Y'),
-            'day_of_week': row.iloc[1] if pd.notna(row.iloc[1]) else '',
+            'day_of_week': day['day_of_week'],
             'is_off': False,
-            'morning_officer': str(morning).strip() if morning else None,
-            'afternoon_officer': str(afternoon).strip() if afternoon else None,
-            'leader': str(leader).strip() if leader else None
+            'morning_officer': morning or None,
+            'afternoon_officer': afternoon or None,
+            'leader': leader or None
         }
-        
-        return result
     
     def get_tomorrow_duty(self):
         """Lấy thông tin trực ban ngày mai"""
         tomorrow = datetime.now() + timedelta(days=1)
         return self.get_duty_info_for_date(tomorrow)
     
+    @_exclusive_write(lambda message: False)
     def update_schedule(self, date, shift, new_officer, old_officer=None, reason="", changed_by=""):
         """Cập nhật lịch trực (đổi người trực)"""
         if shift not in ['sáng', 'chiều']:
-             print("Ca trực không hợp lệ")
+             logger.warning("Ca trực không hợp lệ: %s", shift)
              return False
 
         filepath = self.get_master_schedule_path()
         if not filepath:
             return False
-            
-        sheet_name = self.get_schedule_sheet_name(date)
         
         try:
-             # Đọc file để lấy index dòng cần sửa
-             # Lưu ý: openpyxl index bắt đầu từ 1.
-             # Pandas read_excel header=3 nghĩa là dữ liệu bắt đầu từ row 5 (index 4 trong 0-based của list, nhưng row 5 trong Excel)
-             
-             # Cập nhật trực tiếp trên file local
+             # Tìm (sheet, dòng) của ngày từ chỉ mục năm (giá trị đã tính, kể cả ô Ngày là công thức),
+             # rồi sửa trên workbook nạp đầy đủ (không data_only) để giữ nguyên công thức trong file
              from openpyxl import load_workbook
              
-             wb = load_workbook(filepath, data_only=True)
-             if sheet_name not in wb.sheetnames:
-                 # Check alt name
-                 alt_name = f"{date.month:02d}-{date.year}"
-                 if alt_name in wb.sheetnames:
-                    sheet_name = alt_name
-                 else:
-                    return False
+             sheet_name, row_idx, day = self._find_duty_row(date)
+             if not sheet_name:
+                 logger.warning("Không tìm thấy ngày %s trong file lịch trực", date)
+                 return False
              
+             wb = load_workbook(filepath)
              ws = wb[sheet_name]
              
-             # Tìm dòng chứa ngày
-             target_row = None
-             date_col_idx = 1 # Column A
-             
-             # Duyệt qua các dòng (bắt đầu từ dòng 5 do header là dòng 4)
-             # So sánh dạng text để tránh lỗi định dạng
-             target_date_str = date.strftime('%d/%m/%Y')
-             
-             for row in ws.iter_rows(min_row=5):
-                 cell_val = row[0].value # Cột A
-                 cell_date_str = None
-
-                 if isinstance(cell_val, datetime):
-                     cell_date_str = cell_val.strftime('%d/%m/%Y')
-                 elif isinstance(cell_val, str):
-                     # Chuẩn hóa về định dạng dd/mm/yyyy
-                     cell_val_clean = cell_val.strip()
-                     # Thử parse và format lại
-                     for fmt in ('%d/%m/%Y', '%Y/%m/%d', '%Y-%m-%d'):
-                         try:
-                             parsed = datetime.strptime(cell_val_clean, fmt)
-                             cell_date_str = parsed.strftime('%d/%m/%Y')
-                             break
-                         except ValueError:
-                             continue
-                     # Nếu không parse được, so sánh trực tiếp
-                     if not cell_date_str:
-                         cell_date_str = cell_val_clean
-                 print(f'cell_date_str: {cell_date_str}')
-                 
-                 if cell_date_str and cell_date_str == target_date_str:
-                     target_row = row
-                     break
-            
-             if not target_row:
-                 print(f"Không tìm thấy ngày {date} trong sheet {sheet_name}")
-                 return False
-             
              # Xác định cột cần sửa
              # A=1, B=2, C=3 (Sáng), D=4 (Chiều)
              if shift == 'sáng':
-                 cell_to_edit = target_row[2] # Cột C
-                 current_val = cell_to_edit.value
+                 cell_to_edit = ws.cell(row=row_idx, column=3) # Cột C
+                 current_val = day['morning']
              else:
-                 cell_to_edit = target_row[3] # Cột D
-                 current_val = cell_to_edit.value
+                 cell_to_edit = ws.cell(row=row_idx, column=4) # Cột D
+                 current_val = day['afternoon']
              
              if old_officer is None:
                  old_officer = current_val
@@ -258,7 +323,7 @@ class ScheduleManager:
              # Cập nhật giá trị
              cell_to_edit.value = new_officer
              
-             wb.save(filepath)
+             save_workbook_atomic(wb, filepath)
              
              # Log
              self.db.log_schedule_change(
@@ -273,45 +338,41 @@ class ScheduleManager:
              return True
              
         except Exception as e:
-            print(f"Lỗi update: {e}")
+            logger.exception("Lỗi update: %s", e)
             return False
 
+    def _find_duty_row(self, date):
+        """(tên sheet, dòng, thông tin ngày trong chỉ mục) của một ngày trực, hoặc (None, None, None).
+        Dò theo chỉ mục năm (đọc giá trị đã tính của ô Ngày) nên không cần nạp workbook data_only để ghi."""
+        index = self.get_year_index()
+        if index is None:
+            return None, None, None
+        duty_date = date.date() if isinstance(date, datetime) else date
+        day = index.days.get(duty_date)
+        if day is None:
+            return None, None, None
+        return day['sheet'], day['row'], day
+
     def get_statistics(self, start_date, end_date):
-        """Thống kê số buổi trực"""
+        """Thống kê số buổi trực (Sáng/Chiều) của từng cán bộ trong khoảng ngày, tra từ chỉ mục năm"""
+        index = self.get_year_index()
+        if index is None:
+            return {}
+
         stats = {}
-        # Duyệt qua các tháng trong khoảng thời gian
-        # Để đơn giản, duyệt qua từng ngày (hơi chậm nếu range lớn nhưng chính xác)
-        # Tối ưu: Duyệt qua từng tháng, đọc sheet tương ứng 1 lần
-        
-        current_month_start = start_date.replace(day=1)
-        
-        while current_month_start <= end_date:
-            # Xác định sheet của tháng này
-            df = self.read_schedule_for_date(current_month_start)
-            
-            if df is not None:
-                # Lọc các ngày trong tháng nằm trong khoảng start-end
-                df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-                mask = (df['Date'] >= pd.Timestamp(start_date)) & (df['Date'] <= pd.Timestamp(end_date))
-                df_filtered = df[mask]
-                
-                for _, row in df_filtered.iterrows():
-                     morning = row['Morning']
-                     afternoon = row['Afternoon']
-                     
-                     if pd.notna(morning):
-                         stats[morning] = stats.get(morning, 0) + 1
-                     if pd.notna(afternoon):
-                         stats[afternoon] = stats.get(afternoon, 0) + 1
-            
-            # Sang tháng tiếp theo
-            if current_month_start.month == 12:
-                current_month_start = current_month_start.replace(year=current_month_start.year+1, month=1)
-            else:
-                current_month_start = current_month_start.replace(month=current_month_start.month+1)
-                
+        for key in index.cells:
+            count = sum(
+                1 for duty_date, sheet, _, col in index.get_cells(key, start_date, end_date)
+                # Chỉ đếm ô Sáng/Chiều ở sheet chứa ngày đó (ngày có ở hai sheet tháng không bị đếm hai lần);
+                # ngày nghỉ trong lịch ngày nghỉ: ô ghi chú không phải buổi trực
+                if col in (3, 4) and sheet == index.days[duty_date]['sheet']
+                and self.get_holiday_name(duty_date) is None
+            )
+            if count:
+                stats[index.display_names[key]] = count
         return stats
 
+    @_exclusive_write()
     def generate_full_report(self):
         """Cập nhật bảng thống kê tổng hợp vào sheet 'Tổng' của file Excel
         (sheet này cũng chính là sheet được start_new_year khởi tạo ban đầu)"""
@@ -320,9 +381,11 @@ class ScheduleManager:
             return False, "Không tìm thấy file Excel"
 
         try:
-            xl = pd.ExcelFile(filepath)
-            # Lấy danh sách các sheet tháng (có format m-yyyy)
-            month_sheets = [s for s in xl.sheet_names if '-' in s and s.split('-')[0].isdigit()]
+            # Đếm từ chỉ mục năm (ô Ngày là công thức vẫn được tự tính, không phụ thuộc giá trị Excel đã lưu)
+            index = self.get_year_index()
+            if index is None:
+                return False, "Không đọc được file Excel"
+            month_sheets = list(index.month_sheets)
 
             if not month_sheets:
                 return False, "Không tìm thấy dữ liệu các tháng"
@@ -334,44 +397,28 @@ class ScheduleManager:
 
             month_sheets.sort(key=sheet_sort_key)
 
-            all_officers = set()
-            monthly_data = {} # {sheet_name: {officer: count}}
-
-            for sheet in month_sheets:
-                # Đọc dữ liệu tháng
-                df = pd.read_excel(filepath, sheet_name=sheet, header=3)
-                if len(df.columns) < 4: continue
-
-                counts = {}
-                # Duyệt qua từng dòng để kiểm tra ô gộp (Nghỉ lễ/Tết)
-                # Thông thường ô gộp sẽ có giá trị Sáng == Chiều
-                for _, row in df.iterrows():
-                    morning = str(row.iloc[2]).strip() if pd.notna(row.iloc[2]) else ""
-                    afternoon = str(row.iloc[3]).strip() if pd.notna(row.iloc[3]) else ""
+            monthly_data = {sheet: {} for sheet in month_sheets}  # {sheet_name: {tên chuẩn hóa: count}}
 
-                    # Nếu Sáng == Chiều và không rỗng -> Thường là ô gộp (Nghỉ lễ/Tết) -> Bỏ qua
-                    if morning == afternoon and morning != "":
+            for key, cells in index.cells.items():
+                shifts = {}  # (sheet, dòng, ngày) -> các cột Sáng/Chiều chứa tên
+                for duty_date, sheet, row_idx, col in cells:
+                    if col in (3, 4):
+                        shifts.setdefault((sheet, row_idx, duty_date), set()).add(col)
+                for (sheet, _, duty_date), cols in shifts.items():
+                    # Sáng == Chiều -> Thường là ô gộp (Nghỉ lễ/Tết) -> Bỏ qua
+                    if len(cols) > 1:
                         continue
-
-                    # Danh sách các từ khóa cần bỏ qua (không phải tên người)
-                    blacklist = ['x', '-', 'nghỉ', 'nan', 'thứ 7', 'chủ nhật', 'tết']
-
-                    # Thống kê Sáng
-                    if morning and not any(word in morning.lower() for word in blacklist):
-                        counts[morning] = counts.get(morning, 0) + 1
-                        all_officers.add(morning)
-
-                    # Thống kê Chiều
-                    if afternoon and not any(word in afternoon.lower() for word in blacklist):
-                        counts[afternoon] = counts.get(afternoon, 0) + 1
-                        all_officers.add(afternoon)
-
-                monthly_data[sheet] = counts
+                    # Ngày nghỉ trong lịch ngày nghỉ -> Bỏ qua
+                    if self.get_holiday_name(duty_date) is not None:
+                        continue
+                    counts = monthly_data.setdefault(sheet, {})
+                    counts[key] = counts.get(key, 0) + 1
 
             # Thứ tự cán bộ: theo "DS trực" (giữ nguyên STT); ai không có trong DS trực thì thêm cuối, không có STT
             roster = self._read_ds_truc_roster(filepath)
-            roster_names = {o['name'] for o in roster}
-            extra_officers = sorted(o for o in all_officers if o not in roster_names)
+            roster_keys = {_normalize_name(o['name']) for o in roster}
+            counted = {key for counts in monthly_data.values() for key in counts}
+            extra_officers = sorted(index.display_names[key] for key in counted if key not in roster_keys)
             ordered = [(o['stt'], o['name']) for o in roster] + [(None, name) for name in extra_officers]
 
             # Ghi vào sheet "Tổng": header dòng 5 (STT, Họ tên, các tháng dạng ngày, Tổng cộng), dòng cuối = tổng cột
@@ -403,7 +450,7 @@ class ScheduleManager:
                 ws.cell(row=row_idx, column=2, value=name)
                 total = 0
                 for j, sheet in enumerate(month_sheets):
-                    count = monthly_data[sheet].get(name, 0)
+                    count = monthly_data[sheet].get(_normalize_name(name), 0)
                     ws.cell(row=row_idx, column=3 + j, value=count)
                     col_totals[j] += count
                     total += count
@@ -415,11 +462,11 @@ class ScheduleManager:
                 ws.cell(row=row_idx, column=3 + j, value=col_total)
             ws.cell(row=row_idx, column=total_col, value=sum(col_totals))
 
-            wb.save(filepath)
+            save_workbook_atomic(wb, filepath)
             return True, "Đã cập nhật bảng thống kê vào sheet 'Tổng'."
 
         except Exception as e:
-            print(f"Lỗi generate report: {e}")
+            logger.exception("Lỗi generate report: %s", e)
             return False, str(e)
 
     # def export_statistics_to_excel(self, start_date, end_date, output_file):
@@ -431,91 +478,163 @@ class ScheduleManager:
         """
         if date is None:
             date = datetime.now()
-            
-        df = self.read_schedule_for_date(date)
-        if df is None:
+
+        month_start = date.replace(day=1)
+        next_month = (month_start + timedelta(days=32)).replace(day=1)
+        month_end = next_month - timedelta(days=1)
+
+        if name_query and name_query.strip():
+            return self.search_officer_schedule(name_query, month_start, month_end)
+
+        index = self.get_year_index()
+        if index is None:
             return []
-            
+
         results = []
-        search_by_name = name_query and name_query.strip()
-        if search_by_name:
-            name_query = name_query.lower().strip()
-        
-        # Chuẩn hóa cột Date
-        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-        
-        for index, row in df.iterrows():
-            duty_date = row['Date']
-            
-            # Debug: In giá trị ngày đọc được
-            # print(f"DEBUG: Index {index}, Date: {duty_date}, Type: {type(duty_date)}")
-            
-            # Chuyển đổi sang datetime nếu chưa phải
-            if not isinstance(duty_date, datetime) and pd.notna(duty_date):
-                try:
-                    # Thử parse chuỗi ngày (ưu tiên ngày trước tháng)
-                    duty_date = pd.to_datetime(duty_date, dayfirst=True, errors='coerce')
-                except:
-                    pass
-
-            # Nếu ko parse được ngày (NaT), bỏ qua dòng đó
-            if pd.isna(duty_date):
+        blacklist = ['nan', '', 'x', '-', 'none']
+        for duty_date in sorted(d for d in index.days if month_start.date() <= d <= month_end.date()):
+            day = index.days[duty_date]
+            morning = str(day['morning'] or '').strip()
+            afternoon = str(day['afternoon'] or '').strip()
+            leader = str(day['leader'] or '').strip()
+
+            # Bỏ qua dòng nếu hoàn toàn không có ai trực
+            if all(v.lower() in blacklist for v in (morning, afternoon, leader)):
                 continue
 
-            # Check Morning
-            morning_raw = str(row.get('Morning', ''))
-            morning = morning_raw.lower().strip()
-            # Check Afternoon
-            afternoon_raw = str(row.get('Afternoon', ''))
-            afternoon = afternoon_raw.lower().strip()
-            # Check Leader
-            leader_raw = str(row.get('Leader', ''))
-            leader = leader_raw.lower().strip()
-            
-            if search_by_name:
-                # Lọc theo tên
-                matched_role = []
-                if name_query in morning:
-                    matched_role.append('Sáng')
-                if name_query in afternoon:
-                    matched_role.append('Chiều')
-                if name_query in leader:
-                    matched_role.append('Lãnh đạo')
-                    
-                if matched_role:
-                    res_item = {
-                        'date': duty_date.strftime('%d/%m/%Y'),
-                        'day_of_week': row.iloc[1] if pd.notna(row.iloc[1]) else '',
-                        'roles': matched_role
-                    }
-                    print(f"✨ Tìm thấy: {res_item}")
-                    results.append(res_item)
-            else:
-                # Khi xem toàn bộ lịch tháng:
-                # Bỏ qua dòng nếu hoàn toàn không có ai trực
-                blacklist = ['nan', '', 'x', '-']
-                has_data = (
-                    morning not in blacklist or
-                    afternoon not in blacklist or
-                    leader not in blacklist
-                )
-                if has_data:
-                    res_item = {
-                        'date': duty_date.strftime('%d/%m/%Y'),
-                        'day_of_week': row.iloc[1] if pd.notna(row.iloc[1]) else '',
-                        'morning': morning_raw.strip() if morning not in blacklist else '',
-                        'afternoon': afternoon_raw.strip() if afternoon not in blacklist else '',
-                        'leader': leader_raw.strip() if leader not in blacklist else '',
-                    }
-                    print(f"📅 Dòng dữ liệu: {res_item['date']} | S: {res_item['morning']} | C: {res_item['afternoon']} | LD: {res_item['leader']}")
-                    results.append(res_item)
-                    
+            results.append({
+                'date': duty_date.strftime('%d/%m/%Y'),
+                'day_of_week': day['day_of_week'],
+                'morning': morning if morning.lower() not in blacklist else '',
+                'afternoon': afternoon if afternoon.lower() not in blacklist else '',
+                'leader': leader if leader.lower() not in blacklist else '',
+            })
+
         return results
 
+    def search_officer_schedule(self, name_query, start_date=None, end_date=None):
+        """Tìm lịch trực của cán bộ theo tên trong khoảng ngày bất kỳ (mặc định: cả năm học hiện tại).
+        Tra trực tiếp trên chỉ mục tên -> ngày trực (không quét lại các sheet tháng);
+        hỗ trợ gõ một phần tên và gõ không dấu (VD: 'An', 'hieu', 'Trung Hiếu')."""
+        index = self.get_year_index()
+        if index is None or not name_query or not name_query.strip():
+            return []
+        return index.search(name_query, start_date, end_date)
+
+    @_exclusive_write(lambda message: (False, message, []))
+    def replace_range(self, name, start_date, end_date, substitute='auto', reason="", changed_by=""):
+        """Thay một cán bộ ở mọi ca Sáng/Chiều trong khoảng [start_date, end_date] (VD: nghỉ phép dài ngày).
+        - substitute: tên người thay, hoặc 'auto' để chọn cho từng ca người đang có ít buổi trực nhất trong năm
+          (trong DS trực, không bị miễn, chưa trực ngày đó)
+        Các ô cần sửa lấy từ chỉ mục năm; ghi file một lần và ghi log đổi lịch một lần.
+        Trả về (success, message, [(ngày, ca, người thay)])."""
+        filepath = self.get_master_schedule_path()
+        if not filepath:
+            return False, "Không tìm thấy file Excel", []
+        index = self.get_year_index()
+        if index is None:
+            return False, "Không đọc được file lịch trực.", []
+
+        start_date = start_date.date() if isinstance(start_date, datetime) else start_date
+        end_date = end_date.date() if isinstance(end_date, datetime) else end_date
+        if end_date < start_date:
+            return False, "Ngày kết thúc phải sau ngày bắt đầu.", []
+
+        officer = self.resolve_officer_name(name)
+        if not officer:
+            return False, f"Không tìm thấy cán bộ '{name}' trong lịch trực.", []
+        officer_key = _normalize_name(officer)
+
+        shift_names = {3: 'sáng', 4: 'chiều'}
+        cells = [c for c in index.get_cells(officer_key, start_date, end_date) if c[3] in shift_names]
+        leader_cells = len(index.get_cells(officer_key, start_date, end_date)) - len(cells)
+        if not cells:
+            return False, (
+                f"'{officer}' không có ca trực Sáng/Chiều nào từ {start_date.strftime('%d/%m/%Y')} "
+                f"đến {end_date.strftime('%d/%m/%Y')}."
+            ), []
+
+        def on_duty(duty_date):
+            day = index.days.get(duty_date, {})
+            return {_normalize_name(v) for v in (day.get('morning'), day.get('afternoon')) if is_officer_name(v)}
+
+        auto = str(substitute).strip().lower() == 'auto'
+        if auto:
+            candidates = [n for n in self.get_officer_list() if _normalize_name(n) != officer_key]
+            if not candidates:
+                return False, "Không có cán bộ nào khác trong DS trực để thay.", []
+            # Số buổi Sáng/Chiều đã trực trong năm (cùng số liệu sheet 'Tổng'), cộng dần khi phân thay
+            counts = {
+                n: sum(1 for _, role in index.postings.get(_normalize_name(n), []) if role != 'Lãnh đạo')
+                for n in candidates
+            }
+        else:
+            substitute = self.get_name_matcher().exact(substitute) or unicodedata.normalize('NFC', str(substitute)).strip()
+            if _normalize_name(substitute) == officer_key:
+                return False, "Người thay trùng với người nghỉ.", []
+
+        changes = []
+        skipped = []
+        assigned = {}  # ngày -> tên đã phân thay trong lượt này (tránh một người trực cả 2 ca)
+        for duty_date, sheet_name, row_idx, col in cells:
+            busy = on_duty(duty_date) | {_normalize_name(n) for n in assigned.get(duty_date, [])}
+            if auto:
+                available = [n for n in candidates if _normalize_name(n) not in busy]
+                if not available:
+                    skipped.append((duty_date, shift_names[col]))
+                    continue
+                # Ít buổi nhất trước; bằng nhau thì theo thứ tự DS trực
+                chosen = min(available, key=lambda n: counts[n])
+                counts[chosen] += 1
+            else:
+                if _normalize_name(substitute) in busy:
+                    skipped.append((duty_date, shift_names[col]))
+                    continue
+                chosen = substitute
+            assigned.setdefault(duty_date, []).append(chosen)
+            changes.append((duty_date, sheet_name, row_idx, col, chosen))
+
+        if not changes:
+            return False, "Không phân thay được ca nào (người thay đều đã có lịch trực các ngày này).", []
+
+        try:
+            from openpyxl import load_workbook
+            wb = load_workbook(filepath)
+            for duty_date, sheet_name, row_idx, col, chosen in changes:
+                cell = wb[sheet_name].cell(row=row_idx, column=col)
+                if cell.value is None or _normalize_name(cell.value) != officer_key:
+                    # Chỉ mục không khớp file (không xảy ra khi đang giữ khóa ghi): không ghi gì cả
+                    self._year_index = None
+                    return False, "File lịch vừa thay đổi, vui lòng thử lại.", []
+                cell.value = chosen
+            save_workbook_atomic(wb, filepath)
+        except PermissionError:
+            return False, "Không thể ghi file Excel — file có thể đang mở ở chương trình khác trên máy chủ.", []
+        except Exception as e:
+            logger.exception("Lỗi replace_range: %s", e)
+            return False, str(e), []
+
+        reason = reason or f"Thay {officer} từ {start_date.strftime('%d/%m/%Y')} đến {end_date.strftime('%d/%m/%Y')}"
+        self.db.log_schedule_changes([
+            (duty_date.strftime('%d/%m/%Y'), shift_names[col], officer, chosen, reason, changed_by)
+            for duty_date, _, _, col, chosen in changes
+        ])
+
+        message = f"Đã thay '{officer}' ở {len(changes)} ca trực."
+        if skipped:
+            message += (
+                f" ⚠️ {len(skipped)} ca chưa thay được (không có người trống lịch): "
+                + ", ".join(f"{d.strftime('%d/%m')} {shift}" for d, shift in skipped)
+            )
+        if leader_cells:
+            message += f" Lưu ý: {leader_cells} ca Lãnh đạo trực trong khoảng này không thay đổi."
+        return True, message, [(d, shift_names[col], chosen) for d, _, _, col, chosen in changes]
+
+    @_exclusive_write()
     def swap_shifts(self, date1, shift1, date2, shift2, changed_by=""):
         """Đổi chỗ hai ca trực (có thể cùng ngày hoặc khác ngày)"""
         if shift1 not in ['sáng', 'chiều'] or shift2 not in ['sáng', 'chiều']:
-             print("Ca trực không hợp lệ")
+             logger.warning("Ca trực không hợp lệ: %s / %s", shift1, shift2)
              return False, "Ca trực không hợp lệ (chỉ 'sáng' hoặc 'chiều')"
 
         filepath = self.get_master_schedule_path()
@@ -524,62 +643,37 @@ class ScheduleManager:
             
         try:
             from openpyxl import load_workbook
-            # Load with data_only=True to read formula values as dates
-            wb = load_workbook(filepath, data_only=True)
-            
-            # Sheets for both dates
-            sheet_name1 = self.get_schedule_sheet_name(date1)
-            sheet_name2 = self.get_schedule_sheet_name(date2)
-            
-            if sheet_name1 not in wb.sheetnames or sheet_name2 not in wb.sheetnames:
-                return False, "Không tìm thấy sheet tương ứng với tháng/năm"
 
-            ws1 = wb[sheet_name1]
-            ws2 = wb[sheet_name2]
-            
             target_date_str1 = date1.strftime('%d/%m/%Y')
             target_date_str2 = date2.strftime('%d/%m/%Y')
-            
-            row1_idx = None
-            row2_idx = None
-            
-            # Helper to normalize date and find row
-            def find_row_idx(ws, target_str):
-                for i, row in enumerate(ws.iter_rows(min_row=5), start=5):
-                    cell_val = row[0].value
-                    cell_date_str = None
-                    if isinstance(cell_val, datetime):
-                        cell_date_str = cell_val.strftime('%d/%m/%Y')
-                    elif isinstance(cell_val, str):
-                        cell_val_clean = cell_val.strip()
-                        for fmt in ('%d/%m/%Y', '%Y/%m/%d', '%Y-%m-%d'):
-                            try:
-                                cell_date_str = datetime.strptime(cell_val_clean, fmt).strftime('%d/%m/%Y')
-                                break
-                            except ValueError: continue
-                        if not cell_date_str: cell_date_str = cell_val_clean
-                    if cell_date_str == target_str:
-                        return i
-                return None
 
-            row1_idx = find_row_idx(ws1, target_date_str1)
-            row2_idx = find_row_idx(ws2, target_date_str2)
+            # Vị trí hai ngày lấy từ chỉ mục năm (giá trị đã tính của ô Ngày)
+            sheet_name1, row1_idx, day1 = self._find_duty_row(date1)
+            sheet_name2, row2_idx, day2 = self._find_duty_row(date2)
 
             if not row1_idx or not row2_idx:
                 return False, "Không tìm thấy ngày trực trong lịch"
 
+            # Nạp đầy đủ (không data_only) để lưu lại không làm mất công thức trong file
+            wb = load_workbook(filepath)
+            ws1 = wb[sheet_name1]
+            ws2 = wb[sheet_name2]
+
             # Identify columns: C=3 (morning), D=4 (afternoon)
             col1 = 3 if shift1 == 'sáng' else 4
             col2 = 3 if shift2 == 'sáng' else 4
             
-            officer1 = ws1.cell(row=row1_idx, column=col1).value
-            officer2 = ws2.cell(row=row2_idx, column=col2).value
+            # Tên hiển thị (giá trị đã tính) để báo cáo/ghi log; nội dung ô (kể cả công thức) được hoán đổi nguyên vẹn
+            officer1 = day1['morning' if shift1 == 'sáng' else 'afternoon']
+            officer2 = day2['morning' if shift2 == 'sáng' else 'afternoon']
+            content1 = ws1.cell(row=row1_idx, column=col1).value
+            content2 = ws2.cell(row=row2_idx, column=col2).value
             
             # Swap values
-            ws1.cell(row=row1_idx, column=col1, value=officer2)
-            ws2.cell(row=row2_idx, column=col2, value=officer1)
+            ws1.cell(row=row1_idx, column=col1, value=content2)
+            ws2.cell(row=row2_idx, column=col2, value=content1)
             
-            wb.save(filepath)
+            save_workbook_atomic(wb, filepath)
             
             # Log changes
             self.db.log_schedule_change(
@@ -596,251 +690,625 @@ class ScheduleManager:
             return True, f"Đã đổi '{officer1}' ({target_date_str1} {shift1}) với '{officer2}' ({target_date_str2} {shift2})"
             
         except Exception as e:
-            print(f"Lỗi swap: {e}")
+            logger.exception("Lỗi swap: %s", e)
             return False, str(e)
 
     def get_officer_list(self):
         """
-        Đọc danh sách cán bộ từ sheet 'DS trực'
-        Cấu trúc: Cột 2 (Họ tên), Cột 3 (Miễn trực - x)
+        Danh sách cán bộ trực từ sheet 'DS trực' (bỏ những người đánh dấu 'x' ở cột Miễn),
+        lấy từ mô hình DS trực trong chỉ mục năm (không đọc lại file)
         """
-        filepath = self.get_master_schedule_path()
-        if not filepath:
-            return []
-            
-        try:
-            # Đọc sheet 'DS trực', tiêu đề dòng 1
-            df = pd.read_excel(filepath, sheet_name='DS trực', header=0)
-            
-            # Cột 2 là 'Họ tên', Cột 3 là 'Miễn trực' (index 1 và 2)
-            # Lọc những người không có dấu 'x' ở cột Miễn trực
-            valid_officers = []
-            for _, row in df.iterrows():
-                name = str(row.iloc[1]).strip()
-                exemption = str(row.iloc[2]).strip().lower() if pd.notna(row.iloc[2]) else ""
-                
-                if name and name != "nan" and exemption != 'x':
-                    valid_officers.append(name)
-            
-            return valid_officers
-        except Exception as e:
-            print(f"Lỗi đọc DS trực: {e}")
-            return []
+        return self.get_roster().active_names()
 
-    def auto_generate_round_robin(self, month_year, names=None, leaders=None, start_name=None):
+    def get_roster(self):
+        """Mô hình sheet 'DS trực' của năm hiện tại (xem schedule_index.DsTrucRoster)"""
+        index = self.get_year_index()
+        return index.roster if index is not None else DsTrucRoster()
+
+    def auto_generate_round_robin(self, month_year, names=None, leaders=None, start_name=None,
+                                  mode='round_robin', unavailable=None):
         """
         Tự động xếp lịch theo vòng tròn (Round-robin)
         - names: Nếu None, sẽ tự đọc từ sheet 'DS trực'
         - leaders: Danh sách lãnh đạo trực
         - start_name: Tên người bắt đầu xếp lịch (nếu có, sẽ bỏ qua logic nối tiếp tháng trước)
+        - mode: 'round_robin' (mặc định, vòng tròn cố định) hoặc 'balanced' (xếp cân bằng, xem schedule_optimizer)
+        - unavailable: {tên: tập ngày bận} (chỉ dùng với mode='balanced')
         - Bỏ qua Thứ 7, Chủ Nhật
         - Luân phiên sáng/chiều cho mỗi người
         """
+        return self.auto_generate_range(month_year, month_year, names, leaders, start_name, mode, unavailable)
+
+    def auto_generate_range(self, start_month_year, end_month_year, names=None, leaders=None, start_name=None,
+                            mode='round_robin', unavailable=None):
+        """Xếp lịch tự động cho nhiều tháng liên tiếp (VD: '8-2026' -> '6-2027') trong MỘT lần mở/lưu file.
+        Trạng thái vòng tròn (vị trí người trực) được chuyển tiếp từ tháng này sang tháng sau trong bộ nhớ;
+        start_name (nếu có) chỉ áp dụng cho tháng đầu tiên. Trả về (success, message)."""
+        plan, error = self.plan_auto_schedule(start_month_year, end_month_year, names, leaders,
+                                              start_name, mode, unavailable)
+        if error:
+            return False, error
+        return self.apply_schedule_plan(plan)
+
+    def plan_auto_schedule(self, start_month_year, end_month_year, names=None, leaders=None, start_name=None,
+                           mode='round_robin', unavailable=None):
+        """Tính phân công cho khoảng tháng hoàn toàn trong bộ nhớ (không mở file để ghi).
+        Trả về (plan, None) hoặc (None, thông báo lỗi); plan dùng cho apply_schedule_plan."""
+        if mode not in SCHEDULE_MODES:
+            return None, f"Chế độ xếp lịch không hợp lệ: {mode} (chỉ dùng: {', '.join(SCHEDULE_MODES)})"
+
+        try:
+            months = self.month_range(start_month_year, end_month_year)
+        except ValueError as e:
+            return None, str(e)
+
         filepath = self.get_master_schedule_path()
         if not filepath:
-            return False, "Không tìm thấy file Excel"
+            return None, "Không tìm thấy file Excel"
 
         try:
-            from openpyxl import load_workbook
-            from openpyxl.styles import Alignment, Border, Side, Font
-            import calendar
-            
-            # Phân tách month, year
-            m, y = map(int, month_year.split('-'))
-            last_day = calendar.monthrange(y, m)[1]
-            
-            wb = load_workbook(filepath)
-            sheet_name = month_year
-            
-            if sheet_name in wb.sheetnames:
-                # Nếu sheet đã tồn tại, xóa đi để tạo mới hoặc báo lỗi?
-                # Ở đây ta sẽ ghi đè nội dung.
-                ws = wb[sheet_name]
-                # Xóa dữ liệu cũ từ dòng 5
-                for row in ws.iter_rows(min_row=5):
-                    for cell in row:
-                        cell.value = None
-            else:
-                # Tạo sheet mới
-                ws = wb.create_sheet(sheet_name)
-            
-            # Thiết lập header (Template)
-            headers = ["Ngày", "Thứ", "Trực ban 1", "Trực ban 2", "Lãnh đạo trực"]
-            for col, header in enumerate(headers, 1):
-                cell = ws.cell(row=4, column=col, value=header)
-                cell.font = Font(bold=True)
-                cell.alignment = Alignment(horizontal='center')
-
-            # Tiêu đề bảng (Dòng 1-2)
-            ws.merge_cells('A1:E1')
-            ws['A1'] = f"LỊCH TRỰC BAN THÁNG {m} NĂM {y}"
-            ws['A1'].font = Font(size=14, bold=True)
-            ws['A1'].alignment = Alignment(horizontal='center')
-
-            # Logic xếp lịch
-            idx_names = 0
-            idx_leaders = 0
-            use_start_name = False  # Cờ đánh dấu có dùng start_name hay không
-            
             # Nếu names không được cung cấp, lấy từ DS trực
             if not names:
                 names = self.get_officer_list()
                 
             if not names:
-                return False, "Không tìm thấy danh sách cán bộ trong sheet 'DS trực' hoặc danh sách trống."
+                return None, "Không tìm thấy danh sách cán bộ trong sheet 'DS trực' hoặc danh sách trống."
             
             if not leaders:
-                return False, "Danh sách lãnh đạo trực không được để trống."
-            
-            # Nếu có start_name, tìm vị trí trong danh sách và đặt idx_names
-            if start_name:
-                # Tìm kiếm tên (hỗ trợ tìm một phần tên, không phân biệt hoa thường)
-                start_name_lower = start_name.lower().strip()
-                found_idx = None
-                for i, name in enumerate(names):
-                    if start_name_lower in name.lower() or name.lower() in start_name_lower:
-                        found_idx = i
-                        break
-                
-                if found_idx is not None:
-                    # Tính idx_names sao cho người đầu tiên trực sáng ngày đầu = start_name
-                    # Với công thức m_idx = (idx + offset) % N, ta cần m_idx == found_idx khi idx_names == 0
-                    # Đơn giản: idx_names = found_idx * (cần tính ngược từ công thức)
-                    # Công thức sáng: m_idx = (idx_names + (idx_names // n_names if n_names % 2 == 0 else 0)) % n_names
-                    # Khi idx_names nhỏ (< n_names), offset bổ sung = 0, nên m_idx = idx_names % n_names
-                    # Vậy idx_names = found_idx
-                    idx_names = found_idx
-                    use_start_name = True
-                    print(f"Bắt đầu xếp lịch từ: {names[found_idx]} (vị trí {found_idx})")
+                return None, "Danh sách lãnh đạo trực không được để trống."
+
+            # Vị trí vòng tròn chuyển tiếp giữa các tháng (round_robin): lấy từ DB (cuối tháng liền trước) nếu có
+            schedule_file = os.path.basename(filepath)
+            roster_hash = self._roster_signature(names)
+            rotation_cursor = None
+            if mode == 'round_robin' and not start_name:
+                rotation_cursor = self._load_rotation_cursor(schedule_file, months[0], roster_hash)
+            start_cursor = rotation_cursor
+            rotation_cursors = {}
+
+            month_assignments = {}       # (m, y) -> {date: (sáng, chiều, lãnh đạo)}
+            generated = {}               # Các ca đã xếp trong lần chạy này (balanced: cộng vào số buổi đã trực)
+            batch_months = set(months)
+            for i, (m, y) in enumerate(months):
+                if mode == 'balanced':
+                    # Ngày nghỉ lễ đã ghi chú sẵn trong sheet (VD: 'Nghỉ lễ 2/9') được giữ nguyên
+                    holiday_notes = self._read_holiday_notes(m, y)
+                    assignments = self._plan_balanced_month(
+                        m, y, names, leaders, holiday_notes, unavailable,
+                        exclude_months=batch_months, extra_assignments=generated,
+                    )
+                    generated.update(assignments)
                 else:
-                    return False, f"Không tìm thấy '{start_name}' trong danh sách cán bộ."
+                    assignments, error, rotation_cursor = self._plan_round_robin_month(
+                        m, y, names, leaders,
+                        start_name=start_name if i == 0 else None,
+                        start_cursor=rotation_cursor,
+                    )
+                    if error:
+                        return None, error
+                    rotation_cursors[f"{m}-{y}"] = rotation_cursor
+                month_assignments[(m, y)] = assignments
+
+            return {
+                'schedule_file': schedule_file,
+                'mode': mode,
+                'months': months,
+                'assignments': month_assignments,
+                'rotation_cursors': rotation_cursors,
+                'roster_size': len(names),
+                'roster_hash': roster_hash,
+                # Vị trí vòng tròn đã lưu mà lần xếp này tiếp nối (None: xếp từ start_name/dò sheet tháng trước)
+                'saved_cursor_used': mode == 'round_robin' and not start_name,
+                'start_cursor': start_cursor,
+            }, None
 
-            n_names = len(names)
-            n_leaders = len(leaders)
+        except Exception as e:
+            logger.exception("Lỗi auto schedule: %s", e)
+            return None, str(e)
 
-            # --- LOGIC NỐI TIẾP THÁNG TRƯỚC (bỏ qua nếu đã chỉ định start_name) ---
-            if not use_start_name:
-                prev_m = m - 1 if m > 1 else 12
-                prev_y = y if m > 1 else y - 1
-                prev_sheet_name = f"{prev_m}-{prev_y}"
-                
-                if prev_sheet_name in wb.sheetnames:
-                    ws_prev = wb[prev_sheet_name]
-                    last_afternoon = None
-                    
-                    # Quét từ dưới lên để tìm người trực cuối cùng (Dòng 5 trở đi)
-                    # max_row có thể chứa hàng trống, nên ta tìm hàng cuối có dữ liệu
-                    for r in range(ws_prev.max_row, 4, -1):
-                        val_a = ws_prev.cell(row=r, column=4).value # Afternoon
-                        if val_a and not last_afternoon:
-                            last_afternoon = str(val_a).strip()
-                            break
-                    
-                    # Tìm vị trí của người cuối cùng trong danh sách hiện tại
-                    if last_afternoon in names:
-                        try:
-                            last_idx = names.index(last_afternoon)
-                            found_idx = 0
-                            for test_idx in range(n_names * 2): # Quét đủ 1 vòng
-                                 # Tính a_idx của test_idx
-                                 off = (test_idx + 1) // n_names if n_names % 2 == 0 else 0
-                                 if (test_idx + 1 + off) % n_names == last_idx:
-                                     found_idx = test_idx + 2
-                                     break
-                            idx_names = found_idx
-                        except: pass
-                
-            # -----------------------------------
+    @_exclusive_write()
+    def apply_schedule_plan(self, plan):
+        """Ghi phân công đã tính (plan_auto_schedule) vào file Excel: mở file một lần, ghi các sheet tháng,
+        lưu một lần rồi lưu vị trí vòng tròn. Trả về (success, message)."""
+        filepath = self.get_master_schedule_path()
+        if not filepath:
+            return False, "Không tìm thấy file Excel"
+        if os.path.basename(filepath) != plan['schedule_file']:
+            return False, (
+                f"Năm học hiện tại đã đổi sang file {os.path.basename(filepath)} "
+                f"(lịch được xếp cho {plan['schedule_file']}). Hãy xếp lại."
+            )
+
+        try:
+            from openpyxl import load_workbook
+
+            wb = load_workbook(filepath)
+            for m, y in plan['months']:
+                self._write_month_sheet(wb, m, y, plan['assignments'][(m, y)])
+            save_workbook_atomic(wb, filepath)
+
+            for month_key, cursor in plan['rotation_cursors'].items():
+                self.db.save_rotation_state(
+                    plan['schedule_file'], month_key, cursor['officer_index'], cursor['leader_index'],
+                    plan['roster_size'], plan['roster_hash'],
+                )
+
+            months = plan['months']
+            first, last = f"{months[0][0]}-{months[0][1]}", f"{months[-1][0]}-{months[-1][1]}"
+            mode_note = " (chế độ cân bằng)" if plan['mode'] == 'balanced' else ""
+            if len(months) == 1:
+                return True, f"Đã tự động xếp lịch xong cho tháng {first}{mode_note}."
+            return True, f"Đã tự động xếp lịch xong {len(months)} tháng ({first} → {last}){mode_note}."
+
+        except Exception as e:
+            logger.exception("Lỗi auto schedule: %s", e)
+            return False, str(e)
+
+    def preview_auto_schedule(self, start_month_year, end_month_year, names=None, leaders=None, start_name=None,
+                              mode='round_robin', unavailable=None):
+        """Xếp thử (không ghi file): tính phân công, lưu tạm trong bộ nhớ dưới một mã ngắn.
+        Trả về (token, plan) hoặc (None, thông báo lỗi). Ghi thật bằng commit_schedule_preview(token)."""
+        # Phiên bản file năm học lúc xếp thử (lấy trước khi tính để thay đổi giữa chừng cũng bị phát hiện)
+        index = self.get_year_index()
+        index_version = index.version if index is not None else None
+        plan, error = self.plan_auto_schedule(start_month_year, end_month_year, names, leaders,
+                                              start_name, mode, unavailable)
+        if error:
+            return None, error
+
+        now = datetime.now()
+        # Dọn các bản xếp thử đã hết hạn
+        for token in [t for t, p in self._schedule_previews.items() if now - p['created'] > PREVIEW_TTL]:
+            del self._schedule_previews[token]
+
+        token = secrets.token_hex(3)
+        while token in self._schedule_previews:
+            token = secrets.token_hex(3)
+        plan['created'] = now
+        plan['index_version'] = index_version
+        self._schedule_previews[token] = plan
+        return token, plan
+
+    def _preview_is_stale(self, plan):
+        """True nếu file năm học (phiên bản chỉ mục: mtime/kích thước) hoặc vị trí vòng tròn đã lưu mà bản xếp thử
+        tiếp nối đã đổi từ lúc xếp thử (VD: có /change, /swap hoặc một lần xếp lịch khác ghi vào giữa chừng)"""
+        index = self.get_year_index()
+        if index is None or index.version != plan.get('index_version'):
+            return True
+        if plan['saved_cursor_used']:
+            cursor = self._load_rotation_cursor(plan['schedule_file'], plan['months'][0], plan['roster_hash'])
+            if cursor != plan['start_cursor']:
+                return True
+        return False
+
+    @_exclusive_write()
+    def commit_schedule_preview(self, token):
+        """Ghi bản xếp thử đã lưu dưới mã token vào file Excel (một lần lưu). Trả về (success, message).
+        Từ chối nếu lịch đã thay đổi từ lúc xếp thử (kiểm tra khi đang giữ khóa ghi)."""
+        plan = self._schedule_previews.get(token)
+        if plan is None or datetime.now() - plan['created'] > PREVIEW_TTL:
+            self._schedule_previews.pop(token, None)
+            return False, f"Không tìm thấy bản xếp thử '{token}' (sai mã hoặc đã hết hạn)."
+        if self._preview_is_stale(plan):
+            del self._schedule_previews[token]
+            return False, f"Lịch đã thay đổi, hãy xem trước lại (/auto_schedule_preview). Bản xếp thử '{token}' đã bị hủy."
+
+        success, message = self.apply_schedule_plan(plan)
+        if success:
+            del self._schedule_previews[token]
+        return success, message
+
+    @staticmethod
+    def month_range(start_month_year, end_month_year, max_months=24):
+        """['m-yyyy' đầu, 'm-yyyy' cuối] -> [(m, y), ...]. Raise ValueError nếu sai định dạng/khoảng."""
+        try:
+            start_m, start_y = map(int, start_month_year.split('-'))
+            end_m, end_y = map(int, end_month_year.split('-'))
+        except ValueError:
+            raise ValueError(f"Tháng không hợp lệ: {start_month_year} / {end_month_year} (định dạng m-yyyy)")
+        if not (1 <= start_m <= 12 and 1 <= end_m <= 12):
+            raise ValueError(f"Tháng không hợp lệ: {start_month_year} / {end_month_year} (định dạng m-yyyy)")
+
+        count = (end_y * 12 + end_m) - (start_y * 12 + start_m) + 1
+        if count < 1:
+            raise ValueError(f"Tháng kết thúc ({end_month_year}) phải sau tháng bắt đầu ({start_month_year}).")
+        if count > max_months:
+            raise ValueError(f"Khoảng tháng quá dài ({count} tháng, tối đa {max_months}).")
+
+        months = []
+        m, y = start_m, start_y
+        for _ in range(count):
+            months.append((m, y))
+            m, y = (1, y + 1) if m == 12 else (m + 1, y)
+        return months
+
+    def _write_month_sheet(self, wb, m, y, assignments):
+        """Ghi (tạo mới hoặc ghi đè) sheet 'm-yyyy' theo phân công {date: (sáng, chiều, lãnh đạo)}"""
+        from openpyxl.styles import Alignment, Border, Side, Font
+        import calendar
+
+        last_day = calendar.monthrange(y, m)[1]
+        sheet_name = f"{m}-{y}"
             
-            day_names = ["Thứ Hai", "Thứ Ba", "Thứ Tư", "Thứ Năm", "Thứ Sáu", "Thứ Bảy", "Chủ Nhật"]
+        if sheet_name in wb.sheetnames:
+            # Nếu sheet đã tồn tại, xóa đi để tạo mới hoặc báo lỗi?
+            # Ở đây ta sẽ ghi đè nội dung.
+            ws = wb[sheet_name]
+            # Bỏ gộp ô trong vùng dữ liệu (VD: ô 'Nghỉ lễ' gộp Sáng+Chiều), ô gộp không ghi đè được
+            for merged in list(ws.merged_cells.ranges):
+                if merged.min_row >= 5:
+                    ws.unmerge_cells(str(merged))
+            # Xóa dữ liệu cũ từ dòng 5
+            for row in ws.iter_rows(min_row=5):
+                for cell in row:
+                    cell.value = None
+        else:
+            # Tạo sheet mới
+            ws = wb.create_sheet(sheet_name)
+        
+        # Thiết lập header (Template)
+        headers = ["Ngày", "Thứ", "Trực ban 1", "Trực ban 2", "Lãnh đạo trực"]
+        for col, header in enumerate(headers, 1):
+            cell = ws.cell(row=4, column=col, value=header)
+            cell.font = Font(bold=True)
+            cell.alignment = Alignment(horizontal='center')
+
+        # Tiêu đề bảng (Dòng 1-2)
+        ws.merge_cells('A1:E1')
+        ws['A1'] = f"LỊCH TRỰC BAN THÁNG {m} NĂM {y}"
+        ws['A1'].font = Font(size=14, bold=True)
+        ws['A1'].alignment = Alignment(horizontal='center')
+
+        day_names = ["Thứ Hai", "Thứ Ba", "Thứ Tư", "Thứ Năm", "Thứ Sáu", "Thứ Bảy", "Chủ Nhật"]
+        
+        row_idx = 5
+        for day in range(1, last_day + 1):
+            date_obj = datetime(y, m, day)
+            weekday = date_obj.weekday() # 0=Monday, 6=Sunday
             
-            row_idx = 5
-            for day in range(1, last_day + 1):
-                date_obj = datetime(y, m, day)
-                weekday = date_obj.weekday() # 0=Monday, 6=Sunday
-                
-                # RESET LÃNH ĐẠO VÀO THỨ 2 HÀNG TUẦN
-                if weekday == 0:
-                    idx_leaders = 0
-                
-                # Cột A: Ngày (Ghi đối tượng datetime trực tiếp và set format)
-                date_cell = ws.cell(row=row_idx, column=1, value=date_obj)
-                date_cell.number_format = 'dd/mm/yyyy'
-                
-                # Cột B: Thứ
-                ws.cell(row=row_idx, column=2, value=day_names[weekday])
+            # Cột A: Ngày (Ghi đối tượng datetime trực tiếp và set format)
+            date_cell = ws.cell(row=row_idx, column=1, value=date_obj)
+            date_cell.number_format = 'dd/mm/yyyy'
+            
+            # Cột B: Thứ
+            ws.cell(row=row_idx, column=2, value=day_names[weekday])
+            
+            # Cột C, D, E: Sáng, Chiều, Lãnh đạo (cuối tuần/ngày nghỉ: để trống hoặc ghi chú)
+            morning, afternoon, leader = assignments.get(date_obj.date(), ("", "", ""))
+            ws.cell(row=row_idx, column=3, value=morning)
+            ws.cell(row=row_idx, column=4, value=afternoon)
+            ws.cell(row=row_idx, column=5, value=leader)
+            
+            row_idx += 1
+
+        # Căn chỉnh và kẻ bảng
+        border = Border(left=Side(style='thin'), right=Side(style='thin'), 
+                        top=Side(style='thin'), bottom=Side(style='thin'))
+        for r in range(4, row_idx):
+            for c in range(1, 6):
+                ws.cell(row=r, column=c).border = border
+        
+        ws.column_dimensions['A'].width = 15
+        ws.column_dimensions['B'].width = 12
+        ws.column_dimensions['C'].width = 25
+        ws.column_dimensions['D'].width = 25
+        ws.column_dimensions['E'].width = 25
+
+    def _plan_round_robin_month(self, m, y, names, leaders, start_name=None, start_cursor=None):
+        """Phân công vòng tròn cho một tháng.
+        - start_cursor: {'officer_index', 'leader_index'} ở cuối tháng trước (lưu trong DB hoặc vừa xếp
+          trong cùng lượt); nếu có thì không cần dò lại sheet tháng trước.
+        Trả về ({date: (sáng, chiều, lãnh đạo)}, None, vị trí vòng tròn cuối tháng) hoặc (None, thông báo lỗi, None)."""
+        import calendar
+
+        # Logic xếp lịch
+        idx_names = 0
+        idx_leaders = 0
+        use_start_name = False  # Cờ đánh dấu có dùng start_name hay không
+        
+        # Nếu có start_name, tìm vị trí trong danh sách và đặt idx_names
+        if start_name:
+            # Tìm kiếm tên (một phần tên, không phân biệt hoa thường/dấu, chịu được gõ sai nhẹ);
+            # nhiều người khớp như nhau thì lấy người đứng trước trong danh sách
+            match = NameMatcher(names).first_match(start_name)
+            found_idx = None
+            if match:
+                match_key = _normalize_name(match)
+                found_idx = next(i for i, name in enumerate(names) if _normalize_name(name) == match_key)
+            
+            if found_idx is not None:
+                # Tính idx_names sao cho người đầu tiên trực sáng ngày đầu = start_name
+                # Với công thức m_idx = (idx + offset) % N, ta cần m_idx == found_idx khi idx_names == 0
+                # Đơn giản: idx_names = found_idx * (cần tính ngược từ công thức)
+                # Công thức sáng: m_idx = (idx_names + (idx_names // n_names if n_names % 2 == 0 else 0)) % n_names
+                # Khi idx_names nhỏ (< n_names), offset bổ sung = 0, nên m_idx = idx_names % n_names
+                # Vậy idx_names = found_idx
+                idx_names = found_idx
+                use_start_name = True
+                logger.info("Bắt đầu xếp lịch từ: %s (vị trí %d)", names[found_idx], found_idx)
+            else:
+                return None, f"Không tìm thấy '{start_name}' trong danh sách cán bộ.", None
+        elif start_cursor is not None:
+            idx_names = start_cursor['officer_index']
+            idx_leaders = start_cursor['leader_index']
+            use_start_name = True
+
+        n_names = len(names)
+        n_leaders = len(leaders)
+
+        # --- LOGIC NỐI TIẾP THÁNG TRƯỚC (chỉ dùng khi chưa lưu vị trí vòng tròn và không chỉ định start_name) ---
+        if not use_start_name:
+            prev_m = m - 1 if m > 1 else 12
+            prev_y = y if m > 1 else y - 1
+            index = self.get_year_index()
+            
+            if index is not None:
+                last_afternoon = None
                 
-                if weekday < 5: # Thứ 2 đến Thứ 6
-                    # Công thức luân phiên: (idx + (idx // N if N%2==0 else 0)) % N
-                    # Sáng
-                    m_idx = (idx_names + (idx_names // n_names if n_names % 2 == 0 else 0)) % n_names
-                    ws.cell(row=row_idx, column=3, value=names[m_idx])
-                    
-                    # Chiều
-                    a_idx = (idx_names + 1 + ((idx_names + 1) // n_names if n_names % 2 == 0 else 0)) % n_names
-                    ws.cell(row=row_idx, column=4, value=names[a_idx])
-                    
-                    # Lãnh đạo
-                    ws.cell(row=row_idx, column=5, value=leaders[idx_leaders % n_leaders])
-                    
-                    idx_names += 2 # Tăng 2 slot (Sáng + Chiều)
-                    idx_leaders += 1 # Tăng 1 slot cho Lãnh đạo
-                else:
-                    # Cuối tuần: Để trống hoặc ghi chú
-                    ws.cell(row=row_idx, column=3, value="")
-                    ws.cell(row=row_idx, column=4, value="")
-                    ws.cell(row=row_idx, column=5, value="")
+                # Tìm ngày cuối cùng của tháng trước có người trực chiều (từ chỉ mục năm, không cần mở sheet)
+                prev_days = [d for d in index.days if d.month == prev_m and d.year == prev_y]
+                for duty_date in sorted(prev_days, reverse=True):
+                    val_a = index.days[duty_date]['afternoon'] # Afternoon
+                    if val_a:
+                        last_afternoon = str(val_a).strip()
+                        break
                 
-                row_idx += 1
-
-            # Căn chỉnh và kẻ bảng
-            border = Border(left=Side(style='thin'), right=Side(style='thin'), 
-                            top=Side(style='thin'), bottom=Side(style='thin'))
-            for r in range(4, row_idx):
-                for c in range(1, 6):
-                    ws.cell(row=r, column=c).border = border
+                # Tìm vị trí của người cuối cùng trong danh sách hiện tại
+                if last_afternoon in names:
+                    try:
+                        last_idx = names.index(last_afternoon)
+                        found_idx = 0
+                        for test_idx in range(n_names * 2): # Quét đủ 1 vòng
+                             # Tính a_idx của test_idx
+                             off = (test_idx + 1) // n_names if n_names % 2 == 0 else 0
+                             if (test_idx + 1 + off) % n_names == last_idx:
+                                 found_idx = test_idx + 2
+                                 break
+                        idx_names = found_idx
+                    except: pass
+            
+        # -----------------------------------
+
+        assignments = {}
+        debug_trace = logger.isEnabledFor(logging.DEBUG)  # Vết từng ngày: chỉ khi bật LOG_LEVEL = "DEBUG"
+        work_calendar = self.get_working_day_calendar(datetime(y, m, 1).date())
+        last_day = calendar.monthrange(y, m)[1]
+        for day in range(1, last_day + 1):
+            date_obj = datetime(y, m, day).date()
+            weekday = date_obj.weekday() # 0=Monday, 6=Sunday
             
-            ws.column_dimensions['A'].width = 15
-            ws.column_dimensions['B'].width = 12
-            ws.column_dimensions['C'].width = 25
-            ws.column_dimensions['D'].width = 25
-            ws.column_dimensions['E'].width = 25
+            # RESET LÃNH ĐẠO VÀO THỨ 2 HÀNG TUẦN
+            if weekday == 0:
+                idx_leaders = 0
+            
+            holiday = work_calendar.holiday_name(date_obj)
+            if holiday is not None:
+                # Ngày nghỉ lễ (lịch ngày nghỉ): ghi chú vào ô Sáng, không tính lượt vòng tròn
+                assignments[date_obj] = (self._holiday_note(holiday), "", "")
+            elif work_calendar.is_working_day(date_obj): # Thứ 2 đến Thứ 6, không phải ngày nghỉ
+                # Công thức luân phiên: (idx + (idx // N if N%2==0 else 0)) % N
+                # Sáng
+                m_idx = (idx_names + (idx_names // n_names if n_names % 2 == 0 else 0)) % n_names
+                # Chiều
+                a_idx = (idx_names + 1 + ((idx_names + 1) // n_names if n_names % 2 == 0 else 0)) % n_names
+                # Lãnh đạo
+                assignments[date_obj] = (names[m_idx], names[a_idx], leaders[idx_leaders % n_leaders])
+                if debug_trace:
+                    logger.debug("%s: slot %d -> sáng %s, chiều %s, lãnh đạo %s", date_obj, idx_names,
+                                 names[m_idx], names[a_idx], leaders[idx_leaders % n_leaders])
+                
+                idx_names += 2 # Tăng 2 slot (Sáng + Chiều)
+                idx_leaders += 1 # Tăng 1 slot cho Lãnh đạo
+
+        # Rút gọn theo chu kỳ công thức (N lẻ: N slot; N chẵn: N*N slot) để con số lưu DB không tăng mãi
+        period = n_names * n_names if n_names % 2 == 0 else n_names
+        return assignments, None, {'officer_index': idx_names % period, 'leader_index': idx_leaders % n_leaders}
+
+    @staticmethod
+    def _roster_signature(names):
+        """Mã băm danh sách cán bộ (theo thứ tự): vị trí vòng tròn đã lưu chỉ dùng lại khi danh sách không đổi"""
+        joined = '\n'.join(_normalize_name(n) for n in names)
+        return hashlib.sha1(joined.encode('utf-8')).hexdigest()
+
+    def _load_rotation_cursor(self, schedule_file, month, roster_hash):
+        """Vị trí vòng tròn cuối tháng liền trước (m, y) đã lưu trong DB, hoặc None (khi đó dò sheet tháng trước)"""
+        m, y = month
+        prev_month = f"{12 if m == 1 else m - 1}-{y - 1 if m == 1 else y}"
+        state = self.db.get_rotation_state(schedule_file, prev_month)
+        if state is None:
+            return None
+        if state['roster_hash'] != roster_hash:
+            logger.info("⚠️ DS cán bộ đã thay đổi từ khi xếp tháng %s, bỏ qua vị trí vòng tròn đã lưu.", prev_month)
+            return None
+        return {'officer_index': state['officer_index'], 'leader_index': state['leader_index']}
 
-            wb.save(filepath)
-            return True, f"Đã tự động xếp lịch xong cho tháng {month_year}."
+    def list_schedule_backups(self):
+        """Các bản sao gần nhất của file năm hiện tại (tự giữ lại mỗi lần lưu), mới nhất trước:
+        [(tên bản sao, đường dẫn, thời điểm)]"""
+        filepath = self.get_master_schedule_path()
+        if not filepath:
+            return []
+        return list_backups(filepath)
 
-        except Exception as e:
-            print(f"Lỗi auto schedule: {e}")
-            import traceback
-            traceback.print_exc()
+    @_exclusive_write()
+    def restore_schedule_backup(self, backup_name):
+        """Khôi phục file năm hiện tại từ một bản sao. Trả về (success, message)."""
+        filepath = self.get_master_schedule_path()
+        if not filepath:
+            return False, "Không tìm thấy file Excel"
+        try:
+            restore_backup(filepath, backup_name)
+        except FileNotFoundError as e:
             return False, str(e)
+        except PermissionError:
+            return False, "Không thể ghi file Excel — file có thể đang mở ở chương trình khác trên máy chủ."
+        return True, f"Đã khôi phục file {os.path.basename(filepath)} từ bản sao '{backup_name}'."
+
+    def get_lock_metrics(self):
+        """Số liệu khóa file năm học trong tiến trình: {tên file: {số lần đọc/ghi, số người chờ, thời gian chờ, số lần hết giờ}}"""
+        return all_lock_metrics()
+
+    def get_rotation_state(self):
+        """Các vị trí vòng tròn đã lưu của file năm hiện tại: [{'month', 'officer_index', 'leader_index',
+        'roster_size', 'roster_hash', 'updated_at', ...}] theo thứ tự tháng"""
+        filepath = self.get_master_schedule_path()
+        if not filepath:
+            return []
+        return self.db.get_rotation_states(os.path.basename(filepath))
+
+    def reset_rotation_state(self, month_year=None):
+        """Xóa vị trí vòng tròn đã lưu của một tháng (hoặc cả năm nếu month_year=None).
+        Lần xếp tiếp theo sẽ dò lại sheet tháng trước. Trả về (success, message)."""
+        filepath = self.get_master_schedule_path()
+        if not filepath:
+            return False, "Không tìm thấy file Excel"
+        deleted = self.db.delete_rotation_state(os.path.basename(filepath), month_year)
+        if month_year:
+            if not deleted:
+                return False, f"Chưa có vị trí vòng tròn nào được lưu cho tháng {month_year}."
+            return True, f"Đã xóa vị trí vòng tròn của tháng {month_year}."
+        return True, f"Đã xóa {deleted} vị trí vòng tròn đã lưu của năm học hiện tại."
+
+    def get_working_day_calendar(self, day):
+        """Bảng ngày làm việc của năm học chứa ngày day (lập từ bảng holidays một lần, giữ trong bộ nhớ)"""
+        school_year = school_year_of(day)
+        work_calendar = self._working_day_calendars.get(school_year)
+        if work_calendar is None:
+            start, end = school_year_bounds(school_year)
+            work_calendar = WorkingDayCalendar(school_year, dict(self.db.get_holidays(start, end)))
+            self._working_day_calendars[school_year] = work_calendar
+        return work_calendar
+
+    def is_working_day(self, day):
+        """True nếu day là ngày làm việc (Thứ 2-6, không nằm trong lịch ngày nghỉ)"""
+        if isinstance(day, datetime):
+            day = day.date()
+        return self.get_working_day_calendar(day).is_working_day(day)
+
+    def get_holiday_name(self, day):
+        """Tên ngày nghỉ nếu day nằm trong lịch ngày nghỉ (có thể là chuỗi rỗng), ngược lại None"""
+        if isinstance(day, datetime):
+            day = day.date()
+        return self.get_working_day_calendar(day).holiday_name(day)
+
+    @staticmethod
+    def _holiday_note(holiday_name):
+        """Nội dung ghi vào ô Sáng của ngày nghỉ khi xếp lịch"""
+        return f"Nghỉ {holiday_name}" if holiday_name else "Nghỉ lễ"
+
+    def import_holidays(self, filename, content):
+        """Nhập ngày nghỉ từ file .ics/.csv (nội dung bytes) vào DB. Trả về (success, message)."""
+        try:
+            holidays = parse_holiday_file(filename, content)
+        except (ValueError, UnicodeDecodeError) as e:
+            return False, f"Không đọc được file ngày nghỉ: {e}"
+        if not holidays:
+            return False, "File không có ngày nghỉ nào."
+
+        self.db.save_holidays(holidays, source=os.path.basename(filename))
+        self._working_day_calendars.clear()
+        self._holidays_generation += 1
+        first, last = min(d for d, _ in holidays), max(d for d, _ in holidays)
+        return True, (f"Đã nhập {len(holidays)} ngày nghỉ "
+                      f"({first.strftime('%d/%m/%Y')} - {last.strftime('%d/%m/%Y')}).")
+
+    def list_holidays(self, day=None):
+        """Các ngày nghỉ của năm học chứa ngày day (mặc định: hôm nay): [(date, tên)]"""
+        work_calendar = self.get_working_day_calendar(day or datetime.now().date())
+        return sorted(work_calendar.holidays.items())
+
+    def delete_holidays(self, start_date, end_date=None):
+        """Xóa ngày nghỉ trong khoảng [start_date, end_date]. Trả về (success, message)."""
+        deleted = self.db.delete_holidays(start_date, end_date)
+        self._working_day_calendars.clear()
+        self._holidays_generation += 1
+        if not deleted:
+            return False, "Không có ngày nghỉ nào trong khoảng này."
+        return True, f"Đã xóa {deleted} ngày nghỉ."
+
+    def _read_holiday_notes(self, m, y):
+        """Các ngày trong tháng đã được ghi chú nghỉ lễ trong sheet (VD: ô Sáng = 'Nghỉ lễ 2/9').
+        Trả về {date: (sáng, chiều, lãnh đạo)} giữ nguyên nội dung ghi chú."""
+        index = self.get_year_index()
+        if index is None:
+            return {}
+
+        notes = {}
+        for duty_date, day in index.days.items():
+            if duty_date.month != m or duty_date.year != y:
+                continue
+            cells = (day['morning'], day['afternoon'])
+            if any(c is not None and str(c).strip() and not is_officer_name(c) for c in cells):
+                notes[duty_date] = tuple(
+                    str(v).strip() if v is not None else "" for v in (day['morning'], day['afternoon'], day['leader'])
+                )
+        return notes
+
+    def _plan_balanced_month(self, m, y, names, leaders, holiday_notes=None, unavailable=None,
+                             exclude_months=None, extra_assignments=None):
+        """Phân công cân bằng cho một tháng (xem schedule_optimizer.BalancedScheduler).
+        Số buổi đã trực từ đầu năm (cùng số liệu sheet 'Tổng') lấy từ chỉ mục năm, không tính tháng đang xếp
+        và các tháng trong exclude_months (sắp bị ghi đè); extra_assignments là các ca vừa xếp trong cùng lượt."""
+        import calendar
+
+        holiday_notes = dict(holiday_notes or {})
+        work_calendar = self.get_working_day_calendar(datetime(y, m, 1).date())
+        last_day = calendar.monthrange(y, m)[1]
+        month_days = [datetime(y, m, day).date() for day in range(1, last_day + 1)]
+        for day in month_days:
+            holiday = work_calendar.holiday_name(day)
+            if holiday is not None and day not in holiday_notes:
+                holiday_notes[day] = (self._holiday_note(holiday), "", "")
+        work_days = [
+            day for day in month_days
+            if work_calendar.is_working_day(day) and day not in holiday_notes
+        ]
+
+        skipped_months = set(exclude_months or ()) | {(m, y)}
+        baseline, leader_baseline = {}, {}
+        index = self.get_year_index()
+        if index is not None:
+            counted = {_normalize_name(n): n for n in list(names) + list(leaders)}
+            for key, postings in index.postings.items():
+                if key not in counted:
+                    continue
+                for duty_date, role in postings:
+                    if (duty_date.month, duty_date.year) in skipped_months:
+                        continue
+                    target = leader_baseline if role == 'Lãnh đạo' else baseline
+                    target[counted[key]] = target.get(counted[key], 0) + 1
+
+        for morning, afternoon, leader in (extra_assignments or {}).values():
+            for name in (morning, afternoon):
+                if name in names:
+                    baseline[name] = baseline.get(name, 0) + 1
+            if leader in leaders:
+                leader_baseline[leader] = leader_baseline.get(leader, 0) + 1
+
+        scheduler = BalancedScheduler(
+            names, work_days, baseline=baseline, unavailable=unavailable,
+            leaders=leaders, leader_baseline=leader_baseline, seed=y * 100 + m,
+        )
+        assignments = dict(holiday_notes)
+        assignments.update(scheduler.solve())
+        return assignments
 
     def _read_ds_truc_roster(self, filepath=None):
-        """Đọc STT + Họ tên từ sheet 'DS trực' của file chỉ định (mặc định: file năm hiện tại)"""
+        """STT + Họ tên từ sheet 'DS trực' của file chỉ định (mặc định: file năm hiện tại): [{'stt', 'name'}]"""
+        current = self.get_master_schedule_path()
         if filepath is None:
-            filepath = self.get_master_schedule_path()
+            filepath = current
         if not filepath:
             return []
 
         try:
-            df = pd.read_excel(filepath, sheet_name='DS trực', header=0)
-            roster = []
-            for _, row in df.iterrows():
-                name = str(row.iloc[1]).strip() if pd.notna(row.iloc[1]) else ""
-                if not name or name == "nan":
-                    continue
-                stt = row.iloc[0]
-                if pd.notna(stt):
-                    try:
-                        stt = int(stt)
-                    except (TypeError, ValueError):
-                        pass
-                else:
-                    stt = None
-                roster.append({'stt': stt, 'name': name})
-            return roster
+            if os.path.abspath(filepath) == os.path.abspath(current or ''):
+                roster = self.get_roster()
+            else:
+                roster = DsTrucRoster.load(filepath)
+            return [{'stt': e['stt'], 'name': e['name']} for e in roster.entries]
         except Exception as e:
-            print(f"Lỗi đọc DS trực để copy sang năm mới: {e}")
+            logger.exception("Lỗi đọc DS trực: %s", e)
             return []
 
     def _open_ds_truc_worksheet(self):
@@ -858,28 +1326,71 @@ class ScheduleManager:
 
         return wb, wb['DS trực'], filepath
 
-    def _find_officer_rows(self, ws, name_normalized):
-        """Tìm tất cả các dòng (>=2) trong sheet 'DS trực' có tên khớp (đã chuẩn hóa)"""
-        matched_rows = []
-        last_data_row = 1  # dòng 1 là header
-        max_stt = 0
-
-        for row_cells in ws.iter_rows(min_row=2, max_row=ws.max_row):
-            if len(row_cells) < 2:
-                continue
-            name_val = row_cells[1].value
-            stt_val = row_cells[0].value
-
-            if name_val is not None and str(name_val).strip():
-                last_data_row = row_cells[0].row
-                if _normalize_name(name_val) == name_normalized:
-                    matched_rows.append(row_cells[0].row)
-
-            if isinstance(stt_val, (int, float)):
-                max_stt = max(max_stt, int(stt_val))
-
-        return matched_rows, last_data_row, max_stt
-
+    def _open_ds_truc_model(self):
+        """Như _open_ds_truc_worksheet, kèm mô hình DS trực đang dùng (khớp với file vừa mở vì đang giữ khóa ghi).
+        Trả về (wb, ws, filepath, roster)."""
+        index = self.get_year_index()
+        wb, ws, filepath = self._open_ds_truc_worksheet()
+        roster = index.roster if index is not None and index.filepath == filepath else None
+        if roster is None:
+            roster = DsTrucRoster.from_rows(ws.iter_rows(min_row=2, max_col=4, values_only=True))
+        return wb, ws, filepath, roster
+
+    def _find_officer_rows(self, ws, roster, name_normalized):
+        """Các dòng trong sheet 'DS trực' có tên khớp (đã chuẩn hóa), tra từ mô hình DS trực.
+        Nếu ô trong sheet không khớp mô hình (file bị sửa ngoài luồng) thì dựng lại mô hình từ sheet."""
+        rows = roster.find_rows(name_normalized)
+        if all(_normalize_name(ws.cell(row=r, column=2).value or '') == name_normalized for r in rows):
+            return rows, roster
+        logger.warning("Mô hình DS trực không khớp file, đọc lại sheet 'DS trực'")
+        roster = DsTrucRoster.from_rows(ws.iter_rows(min_row=2, max_col=4, values_only=True))
+        return roster.find_rows(name_normalized), roster
+
+    def _index_saved(self, filepath, roster=None):
+        """Sau khi lưu thay đổi đã được cập nhật đồng thời vào chỉ mục năm (DS trực, đổi tên...):
+        gắn mô hình DS trực mới (nếu có) và cập nhật phiên bản chỉ mục theo file mới, không cần lập lại chỉ mục"""
+        index = self._year_index
+        if index is None or index.filepath != filepath:
+            return
+        stat = os.stat(filepath)
+        if roster is not None:
+            index.roster = roster
+        index.version = (stat.st_mtime_ns, stat.st_size)
+        self._name_matcher = None
+
+    def _officer_cells(self, wb, filepath, name_normalized, start_date=None, end_date=None):
+        """Các ô (openpyxl) trong sheet tháng có tên khớp (đã chuẩn hóa), trong khoảng ngày nếu có.
+        Tra từ chỉ mục ngược của chỉ mục năm; trả về (danh sách ô, True nếu đã dùng chỉ mục).
+        Chỉ mục không có/không khớp file đang mở thì quét toàn bộ các sheet tháng như cũ."""
+        index = self._year_index
+        if index is not None and index.filepath == filepath:
+            cells = [
+                wb[sheet_name].cell(row=row_idx, column=col)
+                for _, sheet_name, row_idx, col in index.get_cells(name_normalized, start_date, end_date)
+                if sheet_name in wb.sheetnames
+            ]
+            if all(c.value is not None and _normalize_name(c.value) == name_normalized for c in cells):
+                return cells, True
+            logger.warning("Chỉ mục ô của '%s' không khớp file, quét lại các sheet tháng", name_normalized)
+
+        start_date = start_date.date() if isinstance(start_date, datetime) else start_date
+        end_date = end_date.date() if isinstance(end_date, datetime) else end_date
+        scan = YearScheduleIndex(filepath)
+        month_sheets = [s for s in wb.sheetnames if '-' in s and s.split('-')[0].isdigit()]
+        for sheet_name in month_sheets:
+            rows = [
+                tuple(row) + (None,) * (5 - len(row))
+                for row in wb[sheet_name].iter_rows(min_row=5, max_col=5, values_only=True)
+            ]
+            scan._index_month_sheet(sheet_name, rows)
+        cells = [
+            wb[sheet_name].cell(row=row_idx, column=col)
+            for duty_date, sheet_name, row_idx, col in sorted(scan.cells.get(name_normalized, []))
+            if (not start_date or duty_date >= start_date) and (not end_date or duty_date <= end_date)
+        ]
+        return cells, False
+
+    @_exclusive_write()
     def add_officer(self, name):
         """Thêm cán bộ mới vào sheet 'DS trực'. Trả về (success, message)."""
         name = (name or "").strip()
@@ -892,22 +1403,24 @@ class ScheduleManager:
         name_normalized = _normalize_name(name)
 
         try:
-            wb, ws, filepath = self._open_ds_truc_worksheet()
+            wb, ws, filepath, roster = self._open_ds_truc_model()
         except ValueError as e:
             return False, str(e)
 
         try:
-            matched_rows, last_data_row, max_stt = self._find_officer_rows(ws, name_normalized)
+            matched_rows, roster = self._find_officer_rows(ws, roster, name_normalized)
 
             if matched_rows:
                 return False, f"Cán bộ '{name}' đã có trong danh sách trực (dòng {matched_rows[0]})."
 
-            new_row = last_data_row + 1
-            new_stt = max_stt + 1
+            new_row = roster.last_row + 1
+            new_stt = roster.max_stt + 1
             ws.cell(row=new_row, column=1, value=new_stt)
             ws.cell(row=new_row, column=2, value=name)
 
-            wb.save(filepath)
+            save_workbook_atomic(wb, filepath)
+            roster.add(new_row, new_stt, name)
+            self._index_saved(filepath, roster)
             return True, (
                 f"Đã thêm '{name}' vào DS trực (STT {new_stt}). "
                 f"Chạy /stats để cập nhật sheet 'Tổng'."
@@ -915,9 +1428,10 @@ class ScheduleManager:
         except PermissionError:
             return False, "Không thể ghi file Excel — file có thể đang mở ở chương trình khác trên máy chủ."
         except Exception as e:
-            print(f"Lỗi add_officer: {e}")
+            logger.exception("Lỗi add_officer: %s", e)
             return False, str(e)
 
+    @_exclusive_write()
     def remove_officer(self, name):
         """Xóa cán bộ khỏi sheet 'DS trực'. Trả về (success, message)."""
         name = (name or "").strip()
@@ -927,12 +1441,12 @@ class ScheduleManager:
         name_normalized = _normalize_name(name)
 
         try:
-            wb, ws, filepath = self._open_ds_truc_worksheet()
+            wb, ws, filepath, roster = self._open_ds_truc_model()
         except ValueError as e:
             return False, str(e)
 
         try:
-            matched_rows, _, _ = self._find_officer_rows(ws, name_normalized)
+            matched_rows, roster = self._find_officer_rows(ws, roster, name_normalized)
 
             if not matched_rows:
                 return False, f"Không tìm thấy '{name}' trong DS trực."
@@ -944,7 +1458,9 @@ class ScheduleManager:
                 )
 
             ws.delete_rows(matched_rows[0], 1)
-            wb.save(filepath)
+            save_workbook_atomic(wb, filepath)
+            roster.remove(matched_rows[0])
+            self._index_saved(filepath, roster)
 
             return True, (
                 f"Đã xóa '{name}' khỏi DS trực. "
@@ -955,9 +1471,10 @@ class ScheduleManager:
         except PermissionError:
             return False, "Không thể ghi file Excel — file có thể đang mở ở chương trình khác trên máy chủ."
         except Exception as e:
-            print(f"Lỗi remove_officer: {e}")
+            logger.exception("Lỗi remove_officer: %s", e)
             return False, str(e)
 
+    @_exclusive_write()
     def deactivate_officer(self, name, reason=""):
         """Miễn trực cho 1 cán bộ (đánh dấu 'x' cột Miễn, ghi Lý do nếu có). Trả về (success, message)."""
         name = (name or "").strip()
@@ -968,12 +1485,12 @@ class ScheduleManager:
         name_normalized = _normalize_name(name)
 
         try:
-            wb, ws, filepath = self._open_ds_truc_worksheet()
+            wb, ws, filepath, roster = self._open_ds_truc_model()
         except ValueError as e:
             return False, str(e)
 
         try:
-            matched_rows, _, _ = self._find_officer_rows(ws, name_normalized)
+            matched_rows, roster = self._find_officer_rows(ws, roster, name_normalized)
 
             if not matched_rows:
                 return False, f"Không tìm thấy '{name}' trong DS trực."
@@ -993,7 +1510,9 @@ class ScheduleManager:
             # nên phải gán trực tiếp .value để xóa lý do cũ khi không nhập lý do mới.
             ws.cell(row=row_idx, column=4).value = reason if reason else None
 
-            wb.save(filepath)
+            save_workbook_atomic(wb, filepath)
+            roster.set_exempt(row_idx, True, reason)
+            self._index_saved(filepath, roster)
 
             action = "Đã cập nhật lý do miễn trực" if already_exempt else "Đã miễn trực"
             reason_note = f" (lý do: {reason})" if reason else " (không có lý do cụ thể)"
@@ -1004,9 +1523,10 @@ class ScheduleManager:
         except PermissionError:
             return False, "Không thể ghi file Excel — file có thể đang mở ở chương trình khác trên máy chủ."
         except Exception as e:
-            print(f"Lỗi deactivate_officer: {e}")
+            logger.exception("Lỗi deactivate_officer: %s", e)
             return False, str(e)
 
+    @_exclusive_write()
     def activate_officer(self, name):
         """Bỏ miễn trực, chuyển cán bộ về trạng thái trực bình thường. Trả về (success, message)."""
         name = (name or "").strip()
@@ -1016,12 +1536,12 @@ class ScheduleManager:
         name_normalized = _normalize_name(name)
 
         try:
-            wb, ws, filepath = self._open_ds_truc_worksheet()
+            wb, ws, filepath, roster = self._open_ds_truc_model()
         except ValueError as e:
             return False, str(e)
 
         try:
-            matched_rows, _, _ = self._find_officer_rows(ws, name_normalized)
+            matched_rows, roster = self._find_officer_rows(ws, roster, name_normalized)
 
             if not matched_rows:
                 return False, f"Không tìm thấy '{name}' trong DS trực."
@@ -1044,7 +1564,9 @@ class ScheduleManager:
             ws.cell(row=row_idx, column=3).value = None
             ws.cell(row=row_idx, column=4).value = None
 
-            wb.save(filepath)
+            save_workbook_atomic(wb, filepath)
+            roster.set_exempt(row_idx, False)
+            self._index_saved(filepath, roster)
 
             return True, (
                 f"Đã chuyển '{name}' về trạng thái trực bình thường (bỏ miễn trực). "
@@ -1053,9 +1575,10 @@ class ScheduleManager:
         except PermissionError:
             return False, "Không thể ghi file Excel — file có thể đang mở ở chương trình khác trên máy chủ."
         except Exception as e:
-            print(f"Lỗi activate_officer: {e}")
+            logger.exception("Lỗi activate_officer: %s", e)
             return False, str(e)
 
+    @_exclusive_write()
     def rename_officer(self, old_name, new_name):
         """Sửa lại tên cán bộ (VD: ghi sai chính tả). Đồng bộ tên trong sheet 'Tổng', các sheet tháng
         (Trực sáng/chiều/Lãnh đạo) và danh sách liên hệ Telegram (officers_contact) nếu có.
@@ -1073,12 +1596,12 @@ class ScheduleManager:
         new_normalized = _normalize_name(new_name)
 
         try:
-            wb, ws, filepath = self._open_ds_truc_worksheet()
+            wb, ws, filepath, roster = self._open_ds_truc_model()
         except ValueError as e:
             return False, str(e)
 
         try:
-            matched_rows, _, _ = self._find_officer_rows(ws, old_normalized)
+            matched_rows, roster = self._find_officer_rows(ws, roster, old_normalized)
 
             if not matched_rows:
                 return False, f"Không tìm thấy '{old_name}' trong DS trực."
@@ -1097,36 +1620,42 @@ class ScheduleManager:
                 return True, f"Tên '{new_name}' đã đúng như hiện tại, không có gì để cập nhật."
 
             # Kiểm tra tên mới có trùng với MỘT NGƯỜI KHÁC không (loại trừ chính dòng đang sửa)
-            other_matches = [r for r in self._find_officer_rows(ws, new_normalized)[0] if r != row_idx]
+            other_matches = [r for r in roster.find_rows(new_normalized) if r != row_idx]
             if other_matches:
                 return False, f"Tên '{new_name}' đã có sẵn trong DS trực (dòng {other_matches[0]}) — không thể đổi trùng."
 
             ws.cell(row=row_idx, column=2, value=new_name)
 
             # Đồng bộ tên trong sheet "Tổng" (nếu có) để không cần chờ /stats chạy lại
+            # (chỉ sửa đúng các dòng/ô chứa tên cũ, tra từ chỉ mục năm)
+            index = self._year_index if self._year_index is not None and self._year_index.filepath == filepath else None
             renamed_in_tong = 0
             if 'Tổng' in wb.sheetnames:
                 ws_tong = wb['Tổng']
-                for row_cells in ws_tong.iter_rows(min_row=6, max_row=ws_tong.max_row):
-                    if len(row_cells) < 2:
-                        continue
-                    name_val = row_cells[1].value
-                    if name_val is not None and _normalize_name(name_val) == old_normalized:
-                        row_cells[1].value = new_name
-                        renamed_in_tong += 1
+                tong_rows = index.summary_rows.get(old_normalized, []) if index is not None else None
+                if tong_rows is None or any(
+                    _normalize_name(ws_tong.cell(row=r, column=2).value or '') != old_normalized for r in tong_rows
+                ):
+                    tong_rows = [
+                        r for r in range(6, ws_tong.max_row + 1)
+                        if ws_tong.cell(row=r, column=2).value is not None
+                        and _normalize_name(ws_tong.cell(row=r, column=2).value) == old_normalized
+                    ]
+                    index = None
+                for r in tong_rows:
+                    ws_tong.cell(row=r, column=2).value = new_name
+                    renamed_in_tong += 1
 
             # Đồng bộ tên trong các sheet tháng (cột Trực sáng/chiều/Lãnh đạo)
-            renamed_in_months = 0
-            month_sheets = [s for s in wb.sheetnames if '-' in s and s.split('-')[0].isdigit()]
-            for sheet_name in month_sheets:
-                ws_month = wb[sheet_name]
-                for row_cells in ws_month.iter_rows(min_row=5, max_row=ws_month.max_row):
-                    for cell in row_cells[2:5]:  # Cột C, D, E
-                        if cell.value is not None and _normalize_name(cell.value) == old_normalized:
-                            cell.value = new_name
-                            renamed_in_months += 1
-
-            wb.save(filepath)
+            month_cells, from_index = self._officer_cells(wb, filepath, old_normalized)
+            for cell in month_cells:
+                cell.value = new_name
+            renamed_in_months = len(month_cells)
+
+            save_workbook_atomic(wb, filepath)
+            if index is not None and from_index and roster is index.roster:
+                index.rename(old_normalized, new_name)
+                self._index_saved(filepath)
 
             # Đồng bộ tên trong danh sách liên hệ Telegram (nếu đã /register dưới tên cũ)
             contact_note = ""
@@ -1155,9 +1684,109 @@ class ScheduleManager:
         except PermissionError:
             return False, "Không thể ghi file Excel — file có thể đang mở ở chương trình khác trên máy chủ."
         except Exception as e:
-            print(f"Lỗi rename_officer: {e}")
+            logger.exception("Lỗi rename_officer: %s", e)
             return False, str(e)
 
+    @_exclusive_write(lambda message: (False, message, []))
+    def import_officers(self, filename, content):
+        """Nhập/cập nhật hàng loạt cán bộ từ file .csv/.xlsx (Họ tên, Miễn, Lý do, Telegram ID, SĐT):
+        thêm người mới vào cuối 'DS trực', cập nhật Miễn/Lý do của người đã có; ghi file một lần và
+        ghi liên hệ Telegram/SĐT vào officers_contact trong một giao dịch. Dòng lỗi được bỏ qua.
+        Trả về (success, message, [(dòng, trạng thái 'added'/'updated'/'unchanged'/'error', chi tiết)])."""
+        try:
+            records = parse_officer_file(filename, content)
+        except (ValueError, UnicodeDecodeError, KeyError) as e:
+            return False, f"Không đọc được file: {e}", []
+        if not records:
+            return False, "File không có dòng dữ liệu nào.", []
+
+        try:
+            wb, ws, filepath, roster = self._open_ds_truc_model()
+        except ValueError as e:
+            return False, str(e), []
+
+        try:
+            report = []
+            contacts = []
+            seen = {}
+            sheet_changed = False
+            for record in records:
+                line = record['line']
+                if record['error']:
+                    report.append((line, 'error', record['error']))
+                    continue
+
+                name = record['name']
+                key = _normalize_name(name)
+                if key in seen:
+                    report.append((line, 'error', f"Trùng tên với dòng {seen[key]} trong file"))
+                    continue
+                seen[key] = line
+
+                matched_rows, roster = self._find_officer_rows(ws, roster, key)
+                if len(matched_rows) > 1:
+                    report.append((line, 'error', f"'{name}' có {len(matched_rows)} dòng trùng trong DS trực {matched_rows}"))
+                    continue
+
+                reason = record['reason'] if record['exempt'] else ''
+                if matched_rows:
+                    row_idx = matched_rows[0]
+                    entry = roster.entry_at(row_idx)
+                    name = entry['name']
+                    if entry['exempt'] != record['exempt'] or entry['reason'] != reason:
+                        ws.cell(row=row_idx, column=3).value = 'x' if record['exempt'] else None
+                        ws.cell(row=row_idx, column=4).value = reason or None
+                        roster.set_exempt(row_idx, record['exempt'], reason)
+                        sheet_changed = True
+                        status = 'updated'
+                        detail = f"{'Miễn trực' if record['exempt'] else 'Trực bình thường'}: '{name}' (dòng {row_idx})"
+                    else:
+                        status, detail = 'unchanged', f"'{name}' đã có trong DS trực (dòng {row_idx})"
+                else:
+                    row_idx = roster.last_row + 1
+                    stt = roster.max_stt + 1
+                    ws.cell(row=row_idx, column=1, value=stt)
+                    ws.cell(row=row_idx, column=2, value=name)
+                    if record['exempt']:
+                        ws.cell(row=row_idx, column=3, value='x')
+                        if reason:
+                            ws.cell(row=row_idx, column=4, value=reason)
+                    roster.add(row_idx, stt, name)
+                    roster.set_exempt(row_idx, record['exempt'], reason)
+                    sheet_changed = True
+                    status, detail = 'added', f"Thêm '{name}' (STT {stt})"
+
+                if record['telegram_id'] or record['phone']:
+                    contacts.append((name, record['telegram_id'] or None, record['phone'] or None))
+                    detail += ", cập nhật liên hệ"
+                    if status == 'unchanged':
+                        status = 'updated'
+                report.append((line, status, detail))
+
+            if sheet_changed:
+                save_workbook_atomic(wb, filepath)
+                self._index_saved(filepath, roster)
+            if contacts:
+                self.db.import_officer_contacts(contacts)
+
+            counts = {status: sum(1 for _, s, _ in report if s == status)
+                      for status in ('added', 'updated', 'unchanged', 'error')}
+            message = (
+                f"Đã xử lý {len(report)} dòng: thêm {counts['added']}, cập nhật {counts['updated']}, "
+                f"không đổi {counts['unchanged']}, lỗi {counts['error']}."
+            )
+            if counts['added']:
+                message += " Chạy /stats để cập nhật sheet 'Tổng'."
+            return counts['error'] < len(report), message, report
+        except PermissionError:
+            self._year_index = None  # Mô hình DS trực đã sửa trong bộ nhớ nhưng file chưa lưu được
+            return False, "Không thể ghi file Excel — file có thể đang mở ở chương trình khác trên máy chủ.", []
+        except Exception as e:
+            self._year_index = None
+            logger.exception("Lỗi import_officers: %s", e)
+            return False, str(e), []
+
+    @_exclusive_write(lambda message: (False, message, None))
     def start_new_year(self, year=None):
         """
         Tạo file Excel chuẩn cho năm học mới (tháng 8/year -> tháng 6/year+1).
@@ -1285,7 +1914,7 @@ class ScheduleManager:
                 ws.column_dimensions['E'].width = 25
 
             os.makedirs(config.SCHEDULE_FOLDER, exist_ok=True)
-            wb.save(filepath)
+            save_workbook_atomic(wb, filepath)
 
             # --- Đăng ký năm mới + cập nhật current_year ---
             existing_row = self.db.get_current_year_row()
@@ -1302,7 +1931,5 @@ class ScheduleManager:
             ), filepath
 
         except Exception as e:
-            print(f"Lỗi start_new_year: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Lỗi start_new_year: %s", e)
             return False, str(e), None
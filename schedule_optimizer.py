@@ -0,0 +1,239 @@
+# schedule_optimizer.py
+# Xếp lịch trực cân bằng (thay thế cho vòng tròn cố định): chia đều tổng số buổi cả năm,
+# tránh ngày cán bộ bận và tránh trực 2 ngày liền
+
+import heapq
+import random
+import time as time_module
+
+
+# Trọng số của hàm phạt (càng lớn càng ưu tiên tránh)
+PENALTY_UNAVAILABLE = 1000   # Xếp vào ngày cán bộ đã báo bận
+PENALTY_SAME_DAY = 500       # Một người trực cả sáng lẫn chiều trong cùng một ngày
+PENALTY_BACK_TO_BACK = 50    # Trực hai ngày làm việc liền nhau
+PENALTY_SHIFT_BALANCE = 1    # Lệch số buổi sáng/chiều của một người
+
+REPLACE_CANDIDATES = 20      # Số người (ít buổi nhất) được thử khi thay một ca trong tìm kiếm cục bộ
+IMPROVEMENT_EPSILON = 1e-9   # Bỏ qua bước "cải thiện" chỉ do sai số làm tròn số thực
+
+
+class BalancedScheduler:
+    """Bộ xếp lịch cân bằng cho một tháng.
+
+    - officers: danh sách tên cán bộ được xếp (đã loại người miễn trực)
+    - work_days: danh sách ngày làm việc cần xếp (đã loại cuối tuần/ngày nghỉ lễ)
+    - baseline: {tên: số buổi đã trực từ đầu năm học} (số liệu sheet 'Tổng')
+    - unavailable: {tên: tập ngày bận}
+    - leaders / leader_baseline: danh sách lãnh đạo và số buổi trực lãnh đạo đã có
+
+    Thuật toán:
+    1. Chia chỉ tiêu (quota) số buổi cho từng người theo kiểu "đổ nước": mỗi buổi giao cho người
+       có tổng (đã trực + đã chia) thấp nhất -> tổng cả năm chênh lệch tối đa 1 buổi.
+    2. Xếp tham lam theo ngày: mỗi ca chọn người còn nhiều chỉ tiêu nhất, không bận, không trực hôm trước,
+       lâu chưa trực nhất.
+    3. Tìm kiếm cục bộ: thử hoán đổi hai ca bất kỳ (khác ngày hoặc sáng/chiều trong ngày) hoặc thay một ca bằng
+       một trong những người ít buổi nhất nếu làm giảm hàm phạt (chỉ tính phần thay đổi); dừng khi không cải thiện
+       được nữa hoặc đã thử max_evaluations bước.
+    Kết quả tất định với cùng dữ liệu đầu vào (seed cố định, giới hạn theo số lần thử chứ không theo giờ máy);
+    time_limit chỉ là giới hạn an toàn, chỉ khi chạm tới nó (máy quá chậm) kết quả mới có thể khác.
+    """
+
+    def __init__(self, officers, work_days, baseline=None, unavailable=None,
+                 leaders=None, leader_baseline=None, seed=0, max_evaluations=100_000, time_limit=10.0):
+        self.officers = list(dict.fromkeys(officers))
+        self.work_days = sorted(work_days)
+        self.baseline = dict(baseline or {})
+        self.unavailable = {name: set(days) for name, days in (unavailable or {}).items()}
+        self.leaders = list(dict.fromkeys(leaders or []))
+        self.leader_baseline = dict(leader_baseline or {})
+        self.seed = seed
+        self.max_evaluations = max_evaluations
+        self.time_limit = time_limit
+
+    # --- Bước 1: chỉ tiêu ---
+    def _quotas(self, people, slots, baseline):
+        heap = [(baseline.get(name, 0), i, name) for i, name in enumerate(people)]
+        heapq.heapify(heap)
+        quotas = {name: 0 for name in people}
+        for _ in range(slots):
+            total, i, name = heapq.heappop(heap)
+            quotas[name] += 1
+            heapq.heappush(heap, (total + 1, i, name))
+        return quotas
+
+    def _is_busy(self, name, day):
+        return day in self.unavailable.get(name, ())
+
+    # --- Bước 2: xếp tham lam ---
+    def _greedy(self, quotas):
+        remaining = dict(quotas)
+        last_day_idx = {}
+        order = {name: i for i, name in enumerate(self.officers)}
+        plan = []
+
+        for d_idx, day in enumerate(self.work_days):
+            taken = []
+            for _ in range(2):  # Sáng, Chiều
+                def cost(name):
+                    return (
+                        self._is_busy(name, day),
+                        name in taken,
+                        last_day_idx.get(name, -2) == d_idx - 1,
+                        remaining[name] <= 0,
+                        -remaining[name],
+                        last_day_idx.get(name, -len(self.work_days) - 1),
+                        order[name],
+                    )
+                chosen = min(self.officers, key=cost)
+                taken.append(chosen)
+                remaining[chosen] -= 1
+                last_day_idx[chosen] = d_idx
+            plan.append(taken)
+        return plan
+
+    # --- Bước 3: tìm kiếm cục bộ ---
+    # Hàm phạt = tổng chi phí từng ngày (bận, trực cả ngày, trực liền hôm trước) + tổng chi phí từng người
+    # (lệch tổng số buổi so với trung bình, lệch sáng/chiều). Một bước đổi/thay chỉ chạm 1-2 ca nên chỉ cần tính
+    # lại chi phí của vài ngày lân cận và 2-3 người liên quan (_move_delta), không tính lại cả bảng.
+    def _day_cost(self, plan, d):
+        m_name, a_name = plan[d]
+        day = self.work_days[d]
+        cost = 0
+        if self._is_busy(m_name, day):
+            cost += PENALTY_UNAVAILABLE
+        if self._is_busy(a_name, day):
+            cost += PENALTY_UNAVAILABLE
+        if m_name == a_name:
+            cost += PENALTY_SAME_DAY
+        if d > 0:
+            prev = plan[d - 1]
+            cost += PENALTY_BACK_TO_BACK * ((m_name in prev) + (a_name in prev))
+        return cost
+
+    def _officer_cost(self, total, morning, afternoon):
+        return (total - self._mean) ** 2 + PENALTY_SHIFT_BALANCE * (morning - afternoon) ** 2
+
+    def _init_counts(self, plan):
+        """Số buổi (kể cả đã trực từ đầu năm) và số ca sáng/chiều của từng người theo plan"""
+        self._totals = {name: self.baseline.get(name, 0) for name in self.officers}
+        self._shifts = {name: [0, 0] for name in self.officers}
+        for day_plan in plan:
+            for s, name in enumerate(day_plan):
+                self._totals[name] += 1
+                self._shifts[name][s] += 1
+        # Tổng số buổi của cả nhóm không đổi khi đổi/thay ca -> trung bình cố định
+        self._mean = sum(self._totals.values()) / len(self.officers)
+
+    def _penalty(self, plan):
+        """Hàm phạt của cả bảng (tính đầy đủ; tìm kiếm cục bộ dùng _move_delta)"""
+        self._init_counts(plan)
+        return (
+            sum(self._day_cost(plan, d) for d in range(len(plan)))
+            + sum(self._officer_cost(self._totals[name], *self._shifts[name]) for name in self.officers)
+        )
+
+    def _move_delta(self, plan, changes):
+        """Áp dụng changes [(ngày, ca, người mới)] lên plan và trả về (mức thay đổi hàm phạt, số đếm mới của
+        những người bị ảnh hưởng). Người gọi giữ thay đổi bằng _commit_counts hoặc tự hoàn tác plan."""
+        days = {d for d, _, _ in changes} | {d + 1 for d, _, _ in changes if d + 1 < len(plan)}
+        before = sum(self._day_cost(plan, d) for d in days)
+
+        counts = {}
+        for d, s, name in changes:
+            old = plan[d][s]
+            for person, step in ((old, -1), (name, 1)):
+                if person not in counts:
+                    counts[person] = [self._totals[person]] + list(self._shifts[person])
+                counts[person][0] += step
+                counts[person][1 + s] += step
+            plan[d][s] = name
+
+        delta = sum(self._day_cost(plan, d) for d in days) - before
+        for person, (total, morning, afternoon) in counts.items():
+            delta += (self._officer_cost(total, morning, afternoon)
+                      - self._officer_cost(self._totals[person], *self._shifts[person]))
+        return delta, counts
+
+    def _commit_counts(self, counts):
+        for person, (total, morning, afternoon) in counts.items():
+            self._totals[person] = total
+            self._shifts[person] = [morning, afternoon]
+
+    def _local_search(self, plan):
+        rng = random.Random(self.seed)
+        slots = [(d, s) for d in range(len(plan)) for s in range(2)]
+        self._init_counts(plan)
+        order = {name: i for i, name in enumerate(self.officers)}
+        budget = self.max_evaluations
+        deadline = time_module.perf_counter() + self.time_limit
+
+        def exhausted():
+            return budget <= 0 or time_module.perf_counter() >= deadline
+
+        improved = True
+        while improved and not exhausted():
+            improved = False
+            rng.shuffle(slots)
+            for i, (d1, s1) in enumerate(slots):
+                for d2, s2 in slots[i + 1:]:
+                    a, b = plan[d1][s1], plan[d2][s2]
+                    if a == b:
+                        continue
+                    delta, counts = self._move_delta(plan, [(d1, s1, b), (d2, s2, a)])
+                    budget -= 1
+                    if delta < -IMPROVEMENT_EPSILON:
+                        self._commit_counts(counts)
+                        improved = True
+                    else:
+                        plan[d1][s1], plan[d2][s2] = a, b
+                if exhausted():
+                    break
+
+            # Thử thay một ca bằng người khác (cần khi số người > số ca hoặc có người bận):
+            # chỉ thử REPLACE_CANDIDATES người đang ít buổi nhất (tính lại mỗi vòng)
+            candidates = sorted(self.officers, key=lambda n: (self._totals[n], order[n]))[:REPLACE_CANDIDATES]
+            for d, s in slots:
+                for name in candidates:
+                    current = plan[d][s]
+                    if name == current:
+                        continue
+                    delta, counts = self._move_delta(plan, [(d, s, name)])
+                    budget -= 1
+                    if delta < -IMPROVEMENT_EPSILON:
+                        self._commit_counts(counts)
+                        improved = True
+                    else:
+                        plan[d][s] = current
+                if exhausted():
+                    break
+        return plan
+
+    def _assign_leaders(self):
+        """Lãnh đạo: chia đều theo tổng số buổi đã trực, tránh trực 2 ngày liền nếu có thể"""
+        if not self.leaders:
+            return [None] * len(self.work_days)
+        totals = {name: self.leader_baseline.get(name, 0) for name in self.leaders}
+        result = []
+        prev = None
+        for day in self.work_days:
+            candidates = [n for n in self.leaders if not self._is_busy(n, day)] or self.leaders
+            chosen = min(candidates, key=lambda n: (n == prev, totals[n], self.leaders.index(n)))
+            totals[chosen] += 1
+            result.append(chosen)
+            prev = chosen
+        return result
+
+    def solve(self):
+        """Trả về {ngày: (sáng, chiều, lãnh đạo)} cho mọi ngày trong work_days"""
+        if not self.officers or not self.work_days:
+            return {}
+
+        quotas = self._quotas(self.officers, 2 * len(self.work_days), self.baseline)
+        plan = self._greedy(quotas)
+        plan = self._local_search(plan)
+        leaders = self._assign_leaders()
+
+        return {
+            day: (plan[i][0], plan[i][1], leaders[i])
+            for i, day in enumerate(self.work_days)
+        }
@@ -0,0 +1,93 @@
+# sheet_export.py
+# Trích một vài sheet của file năm học ra file Excel nhỏ (chỉ giá trị) để gửi qua Telegram thay cho cả file
+
+import hashlib
+import io
+from datetime import datetime, date as date_type
+
+from schedule_index import MONTH_SHEET_PATTERN, needs_formula_dates, resolve_formula_dates
+
+
+# Định dạng hiển thị của ô ngày/tháng trong file trích (file nguồn: sheet tháng dùng dd/mm/yyyy, sheet 'Tổng' dùng mm/yyyy)
+DATE_FORMAT = 'dd/mm/yyyy'
+MONTH_FORMAT = 'mm/yyyy'
+
+# Độ rộng cột mặc định (giống sheet tháng do auto_schedule tạo)
+COLUMN_WIDTHS = {'A': 15, 'B': 25, 'C': 25, 'D': 25, 'E': 25}
+
+
+def _read_sheet_rows(wb, sheet_name):
+    """Các dòng giá trị của một sheet, bỏ các cột/dòng trống ở cuối"""
+    rows = []
+    for row in wb[sheet_name].iter_rows(values_only=True):
+        values = list(row)
+        while values and values[-1] is None:
+            values.pop()
+        rows.append(values)
+    while rows and not rows[-1]:
+        rows.pop()
+    return rows
+
+
+def _content_hash(sheets):
+    """Mã băm nội dung (tên sheet + giá trị từng ô) — giống nhau nếu dữ liệu không đổi,
+    khác với mã băm file .xlsx vốn thay đổi mỗi lần lưu do có thời điểm tạo file."""
+    digest = hashlib.sha256()
+    for sheet_name, rows in sheets:
+        digest.update(repr(sheet_name).encode('utf-8'))
+        for row in rows:
+            digest.update(repr(row).encode('utf-8'))
+            digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def _write_workbook(sheets, summary_sheets):
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+
+    # write_only: ghi thẳng từng dòng, không giữ mô hình ô đầy đủ trong bộ nhớ
+    wb = Workbook(write_only=True)
+    for sheet_name, rows in sheets:
+        ws = wb.create_sheet(sheet_name)
+        for col, width in COLUMN_WIDTHS.items():
+            ws.column_dimensions[col].width = width
+        date_format = MONTH_FORMAT if sheet_name in summary_sheets else DATE_FORMAT
+        for values in rows:
+            cells = []
+            for value in values:
+                cell = WriteOnlyCell(ws, value=value)
+                if isinstance(value, (datetime, date_type)):
+                    cell.number_format = date_format
+                cells.append(cell)
+            ws.append(cells)
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def export_sheets(filepath, sheet_names, summary_sheets=('Tổng',)):
+    """Đọc (read-only) các sheet chỉ định của file năm học và ghi ra file Excel mới chỉ gồm các sheet đó.
+    Sheet không tồn tại được bỏ qua. Trả về (nội dung file dạng bytes, mã băm nội dung),
+    hoặc (None, None) nếu không có sheet nào."""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(filepath, read_only=True, data_only=True)
+    try:
+        sheets = [(name, _read_sheet_rows(wb, name)) for name in sheet_names if name in wb.sheetnames]
+    finally:
+        wb.close()
+
+    if not sheets:
+        return None, None
+
+    # Ô Ngày là công thức (=A5+1...) không có giá trị đã tính sau khi bot lưu file (openpyxl): tự tính như chỉ mục năm
+    unresolved = [name for name, rows in sheets if MONTH_SHEET_PATTERN.match(name) and needs_formula_dates(rows[4:])]
+    if unresolved:
+        overrides = resolve_formula_dates(filepath, unresolved)
+        for name, rows in sheets:
+            for row_idx, duty_date in overrides.get(name, {}).items():
+                values = rows[row_idx - 1] if row_idx <= len(rows) else None
+                if values and values[0] is None:
+                    values[0] = datetime(duty_date.year, duty_date.month, duty_date.day)
+    return _write_workbook(sheets, summary_sheets), _content_hash(sheets)
@@ -0,0 +1,22 @@
+# conftest.py
+# Cho phép import các module của bot (thư mục gốc repo) khi chạy pytest; máy chưa có config.py
+# (file cấu hình thật, không nằm trong repo) thì dùng cấu hình mẫu config_example.py
+
+import importlib
+import importlib.util
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+if importlib.util.find_spec('config') is None:
+    # config_example tạo thư mục lịch/log theo đường dẫn tương đối: nạp trong thư mục tạm để không tạo rác trong repo
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp(prefix='qltb-test-'))
+    try:
+        sys.modules['config'] = importlib.import_module('config_example')
+    finally:
+        os.chdir(cwd)
@@ -0,0 +1,117 @@
+# test_formula_preservation.py
+# Ô Ngày của sheet tháng là công thức (=A5+1...): openpyxl lưu lại công thức nhưng không có giá trị đã tính,
+# nên sau /change, /swap các lệnh đọc (ngày trực, thống kê, bảng 'Tổng') phải tự tính ngày từ công thức
+
+import io
+from datetime import date, datetime
+
+import pytest
+from openpyxl import Workbook, load_workbook
+
+import config
+
+YEAR_FILE = 'LichTrucBan_2025-2026.xlsx'
+FIRST_DAY = date(2026, 3, 2)  # Thứ Hai
+WEEK = [
+    ('Thứ Hai', 'Nguyễn Văn An', 'Trần Thị Bình', 'Lê Văn Lãnh'),
+    ('Thứ Ba', 'Phạm Văn Cường', 'Nguyễn Văn An', 'Lê Văn Lãnh'),
+    ('Thứ Tư', 'Trần Thị Bình', 'Phạm Văn Cường', 'Lê Văn Lãnh'),
+    ('Thứ Năm', 'Nguyễn Văn An', 'Trần Thị Bình', 'Lê Văn Lãnh'),
+    ('Thứ Sáu', 'Phạm Văn Cường', 'Nguyễn Văn An', 'Lê Văn Lãnh'),
+]
+
+
+def _date_formulas(filepath):
+    ws = load_workbook(filepath)['3-2026']
+    return [ws.cell(row=r, column=1).value for r in range(5, 5 + len(WEEK))]
+
+
+@pytest.fixture
+def schedule_mgr(tmp_path, monkeypatch):
+    folder = tmp_path / 'lich-truc-ban'
+    folder.mkdir()
+    monkeypatch.setattr(config, 'SCHEDULE_FOLDER', str(folder))
+    monkeypatch.setattr(config, 'DATABASE_FILE', str(tmp_path / 'truc_ban.db'))
+    monkeypatch.setattr(config, 'SCHEDULE_BACKUP_COUNT', 0, raising=False)
+
+    wb = Workbook()
+    ds = wb.active
+    ds.title = 'DS trực'
+    ds.append(['STT', 'Họ tên', 'Miễn trực', 'Lý do'])
+    for stt, name in enumerate(['Nguyễn Văn An', 'Trần Thị Bình', 'Phạm Văn Cường'], 1):
+        ds.append([stt, name, None, None])
+
+    ws = wb.create_sheet('3-2026')
+    ws.cell(row=4, column=1, value='Ngày')
+    for i, (weekday, morning, afternoon, leader) in enumerate(WEEK):
+        row = 5 + i
+        ws.cell(row=row, column=1, value=datetime(2026, 3, 2) if i == 0 else f'=A{row - 1}+1')
+        ws.cell(row=row, column=2, value=weekday)
+        ws.cell(row=row, column=3, value=morning)
+        ws.cell(row=row, column=4, value=afternoon)
+        ws.cell(row=row, column=5, value=leader)
+    wb.save(folder / YEAR_FILE)
+
+    from schedule_manager import ScheduleManager
+    return ScheduleManager()
+
+
+def test_formulas_survive_repeated_change_and_swap(schedule_mgr):
+    filepath = schedule_mgr.get_master_schedule_path()
+    formulas = _date_formulas(filepath)
+    assert formulas[1:] == ['=A5+1', '=A6+1', '=A7+1', '=A8+1']
+
+    assert schedule_mgr.update_schedule(date(2026, 3, 4), 'sáng', 'Phạm Văn Cường')
+    assert schedule_mgr.update_schedule(date(2026, 3, 5), 'chiều', 'Phạm Văn Cường')
+    success, _ = schedule_mgr.swap_shifts(date(2026, 3, 3), 'sáng', date(2026, 3, 6), 'chiều')
+    assert success
+    success, _ = schedule_mgr.swap_shifts(date(2026, 3, 2), 'chiều', date(2026, 3, 4), 'chiều')
+    assert success
+    # Lần sửa sau chạy trên file đã được openpyxl lưu (công thức không còn giá trị đã tính)
+    assert schedule_mgr.update_schedule(date(2026, 3, 6), 'sáng', 'Trần Thị Bình')
+
+    assert _date_formulas(filepath) == formulas
+
+    info = schedule_mgr.get_duty_info_for_date(datetime(2026, 3, 4))
+    assert info['date'] == '04/03/2026'
+    assert info['day_of_week'] == 'Thứ Tư'
+    assert (info['morning_officer'], info['afternoon_officer']) == ('Phạm Văn Cường', 'Trần Thị Bình')
+
+    info = schedule_mgr.get_duty_info_for_date(datetime(2026, 3, 3))
+    assert (info['morning_officer'], info['afternoon_officer']) == ('Nguyễn Văn An', 'Nguyễn Văn An')
+
+    info = schedule_mgr.get_duty_info_for_date(datetime(2026, 3, 6))
+    assert (info['morning_officer'], info['afternoon_officer']) == ('Trần Thị Bình', 'Phạm Văn Cường')
+
+    stats = schedule_mgr.get_statistics(date(2026, 3, 1), date(2026, 3, 31))
+    assert stats == {'Nguyễn Văn An': 4, 'Trần Thị Bình': 2, 'Phạm Văn Cường': 4}
+
+
+def test_full_report_counts_formula_dated_sheets(schedule_mgr):
+    assert schedule_mgr.update_schedule(date(2026, 3, 4), 'sáng', 'Nguyễn Văn An')
+    success, _ = schedule_mgr.generate_full_report()
+    assert success
+
+    filepath = schedule_mgr.get_master_schedule_path()
+    assert _date_formulas(filepath)[1:] == ['=A5+1', '=A6+1', '=A7+1', '=A8+1']
+
+    ws = load_workbook(filepath)['Tổng']
+    assert ws.cell(row=5, column=3).value == datetime(2026, 3, 1)
+    rows = {ws.cell(row=r, column=2).value: ws.cell(row=r, column=3).value for r in range(6, 9)}
+    assert rows == {'Nguyễn Văn An': 5, 'Trần Thị Bình': 2, 'Phạm Văn Cường': 3}
+    assert ws.cell(row=9, column=4).value == 2 * len(WEEK)
+
+
+def test_sheet_export_resolves_formula_dates(schedule_mgr):
+    from sheet_export import export_sheets
+
+    assert schedule_mgr.update_schedule(date(2026, 3, 4), 'sáng', 'Nguyễn Văn An')
+    success, _ = schedule_mgr.swap_shifts(date(2026, 3, 2), 'sáng', date(2026, 3, 6), 'chiều')
+    assert success
+
+    data, _ = export_sheets(schedule_mgr.get_master_schedule_path(), ['3-2026'])
+    ws = load_workbook(io.BytesIO(data))['3-2026']
+    assert [ws.cell(row=r, column=1).value for r in range(5, 5 + len(WEEK))] == [
+        datetime(2026, 3, 2 + i) for i in range(len(WEEK))
+    ]
+    assert ws.cell(row=7, column=3).value == 'Nguyễn Văn An'